@@ -0,0 +1,243 @@
+"""
+asyncio download engine for the rgb_func tile downloads.
+
+One process keeps many blocking Earth Engine calls in flight (each runs in a
+worker thread) with a concurrency limit per endpoint. Failures are
+classified: throttling and network/server hiccups are retried with jittered
+exponential backoff, permanent errors (bad geometry, missing asset, no
+permission) fail at once. get_crp_rgb_from_asset jobs are split per year,
+so one failed year is retried alone instead of losing the whole yrList loop.
+
+Jobs run under the 'download' limit. The metadata calls they make inside
+(getInfo in tile_bounds, listAssets in iter_asset_names) each hold an
+endpoint_slot, so those endpoints keep their own, lower limits.
+
+Drop-in for the notebooks:
+    from async_download import run_downloads
+    results = run_downloads(get_crp_rgb_from_asset, argument_list_config_all, concurrency=32)
+"""
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_scheduler import is_throttle_error
+
+
+##################
+
+# Concurrency limit per Earth Engine endpoint
+ENDPOINT_LIMITS = {'download': 32, 'listAssets': 4, 'getInfo': 8}
+
+# Errors worth retrying (besides throttling)
+TRANSIENT_MARKERS = ('timed out', 'timeout', 'connection', 'temporarily', 'unavailable',
+                     'internal error', 'backend error', 'deadline', 'reset by peer',
+                     'broken pipe', 'incomplete read')
+
+# Errors a retry will not fix
+PERMANENT_MARKERS = ('not found', 'does not exist', 'permission', 'invalid geometry',
+                     'invalid geojson', 'geometry.', 'invalid argument', 'no band',
+                     'unable to parse', 'unauthorized', 'forbidden')
+
+PERMANENT_STATUS = (400, 401, 403, 404)
+
+PERMANENT_TYPES = (TypeError, ValueError, KeyError, AttributeError, FileNotFoundError,
+                   PermissionError)
+
+
+def classify_error(exc):
+    """Return 'throttle', 'transient' or 'permanent' for an exception."""
+    if is_throttle_error(exc):
+        return 'throttle'
+    status = getattr(exc, 'status_code', None) or getattr(getattr(exc, 'resp', None), 'status', None)
+    if status in PERMANENT_STATUS:
+        return 'permanent'
+    if status is not None and 500 <= int(status) < 600:
+        return 'transient'
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return 'transient'
+    msg = str(exc).lower()
+    if any(m in msg for m in PERMANENT_MARKERS):
+        return 'permanent'
+    if isinstance(exc, PERMANENT_TYPES):
+        return 'permanent'
+    if any(m in msg for m in TRANSIENT_MARKERS):
+        return 'transient'
+    # unknown EE/HTTP errors: retry; the attempt cap bounds the cost
+    return 'transient'
+
+
+def backoff_delay(attempt, base=2.0, cap=120.0, rng=random):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# endpoint -> threading semaphore, while a DownloadEngine runs
+_ENDPOINT_SLOTS = {}
+
+
+@contextmanager
+def endpoint_slot(endpoint):
+    """
+    Hold one of the running engine's `endpoint` slots around a blocking call.
+
+    For the metadata calls made inside download jobs (getInfo, listAssets),
+    which run in the engine's worker threads. A no-op outside run_downloads.
+    """
+    slot = _ENDPOINT_SLOTS.get(endpoint)
+    if slot is None:
+        yield
+        return
+    with slot:
+        yield
+
+
+##################
+
+def expand_years(argument_list):
+    """
+    Split get_crp_rgb_from_asset arguments into one task per year.
+
+    (yrList, download_dir, ...) -> [([yr], download_dir, ...) for yr in yrList].
+    Arguments whose first item is not a list of years are kept as they are.
+    """
+    tasks = []
+    for arg in argument_list:
+        if isinstance(arg, tuple) and arg and isinstance(arg[0], (list, tuple)):
+            tasks.extend(([yr],) + arg[1:] for yr in arg[0])
+        else:
+            tasks.append(arg)
+    return tasks
+
+
+class DownloadEngine:
+    """
+    Bounded-concurrency runner for blocking download calls.
+
+    Parameters:
+    - limits: dict endpoint -> max calls in flight (default ENDPOINT_LIMITS).
+    - max_retries: retries per task for throttle/transient errors.
+    - base_delay, max_delay: backoff parameters in seconds.
+    - bucket: optional rate_scheduler.TokenBucket pacing every call.
+    """
+    def __init__(self, limits=None, max_retries=5, base_delay=2.0, max_delay=120.0,
+                 bucket=None, seed=None):
+        self.limits = dict(ENDPOINT_LIMITS if limits is None else limits)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = bucket
+        self.rng = random.Random(seed)
+        self.stats = {'done': 0, 'retried': 0, 'throttled': 0, 'failed_permanent': 0,
+                      'failed_exhausted': 0}
+        self._semaphores = {}
+        self._executor = None
+
+    def _semaphore(self, endpoint):
+        if endpoint not in self._semaphores:
+            self._semaphores[endpoint] = asyncio.Semaphore(self.limits.get(endpoint, 4))
+        return self._semaphores[endpoint]
+
+    async def call(self, endpoint, func, *args):
+        """Run func(*args) in a thread under the endpoint limit, with retries."""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.wait_time())
+                while not self.bucket.try_acquire():
+                    await asyncio.sleep(max(0.01, self.bucket.wait_time()))
+            async with self._semaphore(endpoint):
+                try:
+                    result = await loop.run_in_executor(self._executor, lambda: func(*args))
+                    self.stats['done'] += 1
+                    return result
+                except Exception as exc:
+                    error = exc
+            kind = classify_error(error)
+            if kind == 'permanent':
+                self.stats['failed_permanent'] += 1
+                raise error
+            if attempt >= self.max_retries:
+                self.stats['failed_exhausted'] += 1
+                raise error
+            if kind == 'throttle':
+                self.stats['throttled'] += 1
+            self.stats['retried'] += 1
+            # back off outside the semaphore so other tasks keep the slot busy
+            await asyncio.sleep(backoff_delay(attempt, self.base_delay, self.max_delay, self.rng))
+            attempt += 1
+
+    async def run(self, func, argument_list, endpoint='download'):
+        """
+        Run all tasks; returns (result or exception) per task in input order.
+
+        Tasks run under the `endpoint` limit; the other limits apply to the
+        endpoint_slot calls the tasks make.
+        """
+        workers = sum(self.limits.values())
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        slots = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()
+                 if name != endpoint and name not in _ENDPOINT_SLOTS}
+        _ENDPOINT_SLOTS.update(slots)
+        try:
+            tasks = [self.call(endpoint, func, *(arg if isinstance(arg, tuple) else (arg,)))
+                     for arg in argument_list]
+            return await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for name in slots:
+                _ENDPOINT_SLOTS.pop(name, None)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+##################
+
+def _run_sync(coro):
+    """asyncio.run that also works inside Jupyter's running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    out = {}
+
+    def target():
+        try:
+            out['result'] = asyncio.run(coro)
+        except BaseException as exc:
+            out['error'] = exc
+    t = threading.Thread(target=target)
+    t.start()
+    t.join()
+    if 'error' in out:
+        raise out['error']
+    return out['result']
+
+
+def run_downloads(func, argument_list, concurrency=32, per_year=True, max_retries=5,
+                  base_delay=2.0, max_delay=120.0, bucket=None):
+    """
+    Drop-in replacement for parallelize_download(func, argument_list, cpus_).
+
+    Runs every task in this process with up to `concurrency` downloads in
+    flight. With per_year=True, get_crp_rgb_from_asset arguments are split
+    into one task per year. Returns one entry per task: the function result,
+    or the exception for tasks that failed.
+    """
+    tasks = expand_years(argument_list) if per_year else list(argument_list)
+    limits = dict(ENDPOINT_LIMITS, download=concurrency)
+    engine = DownloadEngine(limits=limits, max_retries=max_retries, base_delay=base_delay,
+                            max_delay=max_delay, bucket=bucket)
+    start = time.monotonic()
+    results = _run_sync(engine.run(func, tasks))
+    elapsed = time.monotonic() - start
+    for arg, res in zip(tasks, results):
+        if isinstance(res, Exception):
+            print(f"Failed ({classify_error(res)}): {arg[:4] if isinstance(arg, tuple) else arg} -> {res}")
+    s = engine.stats
+    print(f"Tasks: {len(tasks)}, done: {s['done']}, retried: {s['retried']} "
+          f"(throttled {s['throttled']}), failed: {s['failed_permanent']} permanent / "
+          f"{s['failed_exhausted']} out of retries, {elapsed:.1f} s")
+    return results
@@ -0,0 +1,23 @@
+"""
+Sentinel-2 band and cloud-mask settings shared by the Earth Engine code
+(rgb_func) and the offline NumPy backends (local_composite, local_cloudmask).
+
+Plain constants with no imports, so the offline modules load without
+earthengine-api or geemap.
+"""
+
+
+##################
+
+# combine s2 and cloudless s2 collection
+# s2 cloud cover filter parameters
+CLOUD_FILTER = 5#20
+CLD_PRB_THRESH = 5
+NIR_DRK_THRESH = 0.15
+CLD_PRJ_DIST = 1
+BUFFER = 1
+
+# RGB composite bands: (band, months used for its median, unitScale range)
+RGB_BANDS = [('B4', (8, 10), (100, 3000)),
+             ('B3', (6, 8), (200, 2300)),
+             ('B2', (4, 7), (150, 1350))]
@@ -0,0 +1,207 @@
+"""
+Benchmarks for the download path against the fake ee/geemap stand-in, and
+for the local raster steps.
+
+Run from this folder:
+    python bench_download.py
+
+Nothing touches Earth Engine; fake_ee counts client-side graph operations
+and server-side computed nodes, and turns them into simulated time.
+"""
+import time
+import tempfile
+
+import fake_ee
+
+
+##################
+
+def _run_tiles(rgb_func, n_tiles, yrList, out_dir):
+    for idx in range(n_tiles):
+        rgb_func.get_crp_rgb_from_asset(yrList, out_dir, 'SK', str(idx), 'roads', 'prov', f'tile_{idx}')
+
+
+def bench_graph_cache(n_tiles=20, yrList=(2021, 2022, 2023, 2024), op_cost=0.0005):
+    """
+    Client ops, server-computed nodes and wall time with and without graph memoization.
+
+    Memoization saves client-side graph building only: the fake server, like
+    EE, caches graphs by value, so both modes compute the same server nodes.
+    """
+    server = fake_ee.install(latency=0.0, max_concurrent=None, op_cost=op_cost)
+    import rgb_func
+    rows = []
+    try:
+        for label, size in (('no cache', 0), ('memoized', 512)):
+            rgb_func.GRAPH_CACHE_SIZE = size
+            rgb_func.clear_graph_cache()
+            server.reset()
+            start = time.perf_counter()
+            _run_tiles(rgb_func, n_tiles, list(yrList), tempfile.mkdtemp())
+            stats = server.stats()
+            rows.append((label, stats['ops'], stats['computed_nodes'], time.perf_counter() - start))
+    finally:
+        rgb_func.GRAPH_CACHE_SIZE = 512
+        rgb_func.clear_graph_cache()
+        fake_ee.uninstall()
+
+    print(f"\nGraph memoization: {n_tiles} tiles x {len(yrList)} years "
+          f"(saves client-side graph building; server nodes are cached by value either way)")
+    print(f"{'mode':<10} {'client ops':>11} {'server nodes':>13} {'time (s)':>9}")
+    for label, ops, nodes, secs in rows:
+        print(f"{label:<10} {ops:>11} {nodes:>13} {secs:>9.2f}")
+    return rows
+
+
+def bench_stacked_download(n_tiles=20, yrList=(2021, 2022, 2023, 2024), latency=0.05):
+    """Requests and wall time: one request per tile-year vs one stacked request per tile."""
+    server = fake_ee.install(latency=latency, max_concurrent=None)
+    import rgb_func
+    rows = []
+    try:
+        for label in ('per year', 'stacked'):
+            rgb_func.clear_graph_cache()
+            server.reset()
+            out_dir = tempfile.mkdtemp()
+            start = time.perf_counter()
+            for idx in range(n_tiles):
+                args = (list(yrList), out_dir, 'SK', str(idx), 'roads', 'prov', f'tile_{idx}')
+                if label == 'stacked':
+                    # fake downloads are placeholders, so keep the stack unsplit
+                    rgb_func.get_crp_rgb_stack_from_asset(*args, split=False)
+                else:
+                    rgb_func.get_crp_rgb_from_asset(*args)
+            rows.append((label, server.stats()['requests'], time.perf_counter() - start))
+    finally:
+        rgb_func.clear_graph_cache()
+        fake_ee.uninstall()
+
+    print(f"\nStacked download: {n_tiles} tiles x {len(yrList)} years, {latency} s per request")
+    print(f"{'mode':<10} {'requests':>9} {'time (s)':>9}")
+    for label, n, secs in rows:
+        print(f"{label:<10} {n:>9} {secs:>9.2f}")
+    return rows
+
+
+def bench_cloudmask(n_scenes=8, size=2048, tile_rows=512, workers=None, latency=0.5,
+                    op_cost=0.001, concurrency=4, seed=0):
+    """
+    Scenes and megapixels per second of the s2cloudless chain, local vs server.
+
+    local: local_cloudmask.cld_shdw_mask_tiled on synthetic scenes.
+    server: add_cld_shdw_mask + apply_cld_shdw_mask of rgb_func, one
+    download per scene, `concurrency` at a time, against fake_ee. Its time is
+    simulated: `latency` s per request plus `op_cost` s per graph node the
+    server computes, so set them from measured Earth Engine timings.
+    """
+    import sys
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    import local_cloudmask
+
+    rng = np.random.default_rng(seed)
+    probability = (rng.random((n_scenes, size, size)) * 10).astype('float32')
+    b8 = rng.integers(500, 4000, (n_scenes, size, size)).astype('uint16')
+    scl = rng.integers(3, 8, (n_scenes, size, size)).astype('uint8')
+    azimuth = rng.uniform(100, 170, n_scenes)
+    start = time.perf_counter()
+    local_cloudmask.cld_shdw_mask_tiled(probability, b8, scl, azimuth, tile_rows, workers)
+    t_local = time.perf_counter() - start
+
+    server = fake_ee.install(latency=latency, max_concurrent=None, op_cost=op_cost)
+    sys.modules.pop('rgb_func', None)
+    try:
+        import rgb_func
+        import geemap
+        out_dir = tempfile.mkdtemp()
+
+        def scene(i):
+            img = rgb_func.ee.Image(f'COPERNICUS/S2_SR/scene_{i}')
+            masked = rgb_func.apply_cld_shdw_mask(rgb_func.add_cld_shdw_mask(img))
+            geemap.download_ee_image(masked, f'{out_dir}/scene_{i}.tif', scale=10)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(scene, range(n_scenes)))
+        t_server = time.perf_counter() - start
+        nodes = server.stats()['computed_nodes']
+    finally:
+        sys.modules.pop('rgb_func', None)
+        fake_ee.uninstall()
+
+    mpx = n_scenes * size * size / 1e6
+    print(f"\nCloud/shadow mask: {n_scenes} scenes of {size}x{size} px")
+    print(f"{'mode':<16} {'time (s)':>9} {'scenes/s':>9} {'Mpx/s':>7}")
+    for label, secs in (('local', t_local), ('server (fake)', t_server)):
+        print(f"{label:<16} {secs:>9.2f} {n_scenes / secs:>9.1f} {mpx / secs:>7.1f}")
+    print(f"server: {latency} s per request, {op_cost} s x {nodes} graph nodes, "
+          f"{concurrency} requests in flight (simulated)")
+    return t_local, t_server
+
+
+def _loop_otsu_threshold(grayscale_array):
+    """The original per-bin Python loop (commented-out rgb_func.otsu_threshold)."""
+    import numpy as np
+    flat = grayscale_array.flatten()
+    flat = flat[flat > 0]
+    if flat.size == 0:
+        return 0
+    hist, _ = np.histogram(flat, bins=256, range=(0, 255))
+    total = flat.size
+    sum_total = np.dot(np.arange(256), hist)
+    sumB = wB = max_between = 0.0
+    threshold = 0
+    for i in range(256):
+        wB += hist[i]
+        if wB == 0:
+            continue
+        wF = total - wB
+        if wF == 0:
+            break
+        sumB += i * hist[i]
+        mB = sumB / wB
+        mF = (sum_total - sumB) / wF
+        between_var = wB * wF * (mB - mF) ** 2
+        if between_var > max_between:
+            max_between = between_var
+            threshold = i
+    return threshold
+
+
+def bench_otsu(n_images=16, size=1024, seed=0):
+    """Per-image loop vs one batched call, on the same grayscale images."""
+    import numpy as np
+    import otsu
+    rng = np.random.default_rng(seed)
+    # bimodal grayscale images with some zero (masked) pixels
+    images = np.where(rng.random((n_images, size, size)) < 0.5,
+                      rng.normal(80, 15, (n_images, size, size)),
+                      rng.normal(170, 20, (n_images, size, size)))
+    images = np.clip(images, 0, 255).astype('uint8')
+    images[:, :size // 8] = 0
+
+    start = time.perf_counter()
+    loop = [_loop_otsu_threshold(img) for img in images]
+    t_loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hist = otsu.histograms(images)
+    t_hist = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = otsu.otsu_from_histograms(hist, default=0)
+    t_thresh = time.perf_counter() - start
+
+    assert [int(t) for t in batch] == loop
+    print(f"\nOtsu: {n_images} images of {size}x{size} px")
+    print(f"{'mode':<22} {'time (ms)':>10}")
+    print(f"{'loop per image':<22} {t_loop * 1e3:>10.1f}")
+    print(f"{'batched':<22} {(t_hist + t_thresh) * 1e3:>10.1f}")
+    print(f"{'from histograms only':<22} {t_thresh * 1e3:>10.2f}")
+    return t_loop, t_hist, t_thresh
+
+
+if __name__ == '__main__':
+    bench_graph_cache()
+    bench_stacked_download()
+    bench_cloudmask()
+    bench_otsu()
@@ -0,0 +1,319 @@
+"""
+Persistent SQLite manifest of download outputs.
+
+One row per expected output, keyed by (province, tile, year, product).
+product is 'rgb' or 'crop_mask', and year is 0 for year-independent
+products. Each row records its state (pending / running / done / failed /
+skipped), and every file piece written for it (prefix_N.tif) is stored with
+its byte size and sha256.
+
+Resume checks are a primary-key lookup instead of os.path.exists on
+`..._1.tif`. A job that crashed half way stays 'running' or 'failed', so it is
+downloaded again (stale pieces are removed first) instead of being skipped
+forever. "What is left" for a whole province is a single indexed query.
+
+The manifest is passed to the download functions as a path, so each worker
+process opens its own connection (WAL mode, safe for concurrent writers).
+"""
+import os
+import glob
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+
+##################
+
+PENDING, RUNNING, DONE, FAILED, SKIPPED = 'pending', 'running', 'done', 'failed', 'skipped'
+
+# Province folder names used under 5_Data -> province codes used in file names
+PROVINCE_CODES = {'Alberta': 'AB', 'Saskatchewan': 'SK', 'Manitoba': 'MB'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    province  TEXT NOT NULL,
+    tile      TEXT NOT NULL,
+    year      INTEGER NOT NULL,
+    product   TEXT NOT NULL,
+    state     TEXT NOT NULL DEFAULT 'pending',
+    out_dir   TEXT,
+    prefix    TEXT,
+    n_pieces  INTEGER DEFAULT 0,
+    bytes     INTEGER DEFAULT 0,
+    sha256    TEXT,
+    attempts  INTEGER DEFAULT 0,
+    started   REAL,
+    finished  REAL,
+    error     TEXT,
+    PRIMARY KEY (province, tile, year, product)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, product, province);
+CREATE TABLE IF NOT EXISTS pieces (
+    province  TEXT NOT NULL,
+    tile      TEXT NOT NULL,
+    year      INTEGER NOT NULL,
+    product   TEXT NOT NULL,
+    path      TEXT NOT NULL,
+    bytes     INTEGER,
+    sha256    TEXT,
+    PRIMARY KEY (province, tile, year, product, path)
+);
+"""
+
+
+def rgb_key(provName, local_idx, yr):
+    return (provName, str(local_idx), int(yr), 'rgb')
+
+
+def mask_key(province, tile_id):
+    return (province, str(tile_id), 0, 'crop_mask')
+
+
+def province_from_dir(download_dir):
+    """'.../Mask_download/Saskatchewan' -> 'SK' (folder name if unknown)."""
+    name = Path(str(download_dir)).name
+    return PROVINCE_CODES.get(name, name)
+
+
+def file_sha256(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+##################
+
+class Manifest:
+    """SQLite-backed download manifest (see module docstring)."""
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def _exec(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def _many(self, sql, rows):
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(sql, rows)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def close(self):
+        self.conn.close()
+
+    # ---- registration -------------------------------------------------
+
+    def register(self, keys, out_dir=None, prefixes=None):
+        """Insert expected outputs as 'pending' (existing rows are kept)."""
+        keys = list(keys)
+        prefixes = prefixes or [None] * len(keys)
+        self._many("INSERT OR IGNORE INTO jobs (province, tile, year, product, out_dir, prefix) "
+                   "VALUES (?, ?, ?, ?, ?, ?)",
+                   [(*k, out_dir, p) for k, p in zip(keys, prefixes)])
+
+    def register_rgb_arguments(self, argument_list):
+        """Register every (tile, year) of get_crp_rgb_from_asset argument tuples."""
+        keys, prefixes, out_dir = [], [], None
+        for yrList, download_dir, provName, local_idx, *_ in argument_list:
+            out_dir = str(download_dir)
+            for yr in yrList:
+                keys.append(rgb_key(provName, local_idx, yr))
+                prefixes.append(f"rgb_{provName}_{yr}_{local_idx}_")
+        self.register(keys, out_dir, prefixes)
+
+    def register_mask_arguments(self, argument_list):
+        """Register every tile of get_crp_mask_from_asset argument tuples."""
+        keys, prefixes, out_dir = [], [], None
+        for download_dir, tile_id, *_ in argument_list:
+            out_dir = str(download_dir)
+            keys.append(mask_key(province_from_dir(download_dir), tile_id))
+            prefixes.append(f"crop_mask_{tile_id}_")
+        self.register(keys, out_dir, prefixes)
+
+    # ---- state transitions --------------------------------------------
+
+    def state(self, key):
+        row = self._exec("SELECT state FROM jobs WHERE province=? AND tile=? AND year=? "
+                         "AND product=?", key).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, key):
+        return self.state(key) in (DONE, SKIPPED)
+
+    def start(self, key, out_dir, prefix):
+        """Mark running and delete stale pieces left by an earlier attempt."""
+        for path in glob.glob(os.path.join(str(out_dir), glob.escape(prefix) + '*.tif')):
+            os.remove(path)
+        self._exec("DELETE FROM pieces WHERE province=? AND tile=? AND year=? AND product=?", key)
+        self._exec("INSERT INTO jobs (province, tile, year, product, state, out_dir, prefix, "
+                   "attempts, started, error) VALUES (?, ?, ?, ?, 'running', ?, ?, 1, ?, NULL) "
+                   "ON CONFLICT (province, tile, year, product) DO UPDATE SET "
+                   "state='running', out_dir=excluded.out_dir, prefix=excluded.prefix, "
+                   "attempts=attempts+1, started=excluded.started, finished=NULL, error=NULL",
+                   (*key, str(out_dir), prefix, time.time()))
+
+    def complete(self, key):
+        """Record every piece written for `key` (size + sha256) and mark done."""
+        out_dir, prefix = self._exec("SELECT out_dir, prefix FROM jobs WHERE province=? AND "
+                                     "tile=? AND year=? AND product=?", key).fetchone()
+        paths = sorted(glob.glob(os.path.join(out_dir, glob.escape(prefix) + '*.tif')))
+        if not paths:
+            raise RuntimeError(f"No output pieces found for {prefix} in {out_dir}")
+        rows, total, combined = [], 0, hashlib.sha256()
+        for path in paths:
+            size = os.path.getsize(path)
+            digest = file_sha256(path)
+            rows.append((*key, path, size, digest))
+            total += size
+            combined.update(digest.encode())
+        self._many("INSERT OR REPLACE INTO pieces VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._exec("UPDATE jobs SET state='done', n_pieces=?, bytes=?, sha256=?, finished=? "
+                   "WHERE province=? AND tile=? AND year=? AND product=?",
+                   (len(paths), total, combined.hexdigest(), time.time(), *key))
+
+    def fail(self, key, error):
+        self._exec("UPDATE jobs SET state='failed', error=?, finished=? WHERE province=? AND "
+                   "tile=? AND year=? AND product=?", (str(error)[:500], time.time(), *key))
+
+    def skip(self, key, reason=''):
+        self.register([key])
+        self._exec("UPDATE jobs SET state='skipped', error=? WHERE province=? AND tile=? AND "
+                   "year=? AND product=?", (reason, *key))
+
+    def recover(self):
+        """After a crash: jobs still marked 'running' go back to 'pending'."""
+        return self._exec("UPDATE jobs SET state='pending' WHERE state='running'").rowcount
+
+    # ---- queries ------------------------------------------------------
+
+    def remaining(self, product=None, province=None):
+        """Keys not done or skipped, optionally for one product / province."""
+        sql = "SELECT province, tile, year, product FROM jobs WHERE state NOT IN ('done', 'skipped')"
+        params = []
+        if product is not None:
+            sql += " AND product=?"
+            params.append(product)
+        if province is not None:
+            sql += " AND province=?"
+            params.append(province)
+        return [tuple(r) for r in self._exec(sql, params).fetchall()]
+
+    def summary(self, product=None):
+        """{state: (count, bytes)} for the whole manifest or one product."""
+        sql = "SELECT state, COUNT(*), COALESCE(SUM(bytes), 0) FROM jobs"
+        params = ()
+        if product is not None:
+            sql += " WHERE product=?"
+            params = (product,)
+        return {s: (n, b) for s, n, b in self._exec(sql + " GROUP BY state", params).fetchall()}
+
+    def done_keys(self, product=None):
+        sql = "SELECT province, tile, year, product FROM jobs WHERE state IN ('done', 'skipped')"
+        params = ()
+        if product is not None:
+            sql += " AND product=?"
+            params = (product,)
+        return {tuple(r) for r in self._exec(sql, params).fetchall()}
+
+    def tiles(self, state, product=None, province=None):
+        """Tile ids with at least one job in `state`."""
+        sql = "SELECT DISTINCT tile FROM jobs WHERE state=?"
+        params = [state]
+        if product is not None:
+            sql += " AND product=?"
+            params.append(product)
+        if province is not None:
+            sql += " AND province=?"
+            params.append(province)
+        return {r[0] for r in self._exec(sql, params).fetchall()}
+
+    def timings(self, product=None):
+        """(jobs, mean seconds, mean bytes) over done jobs, optionally for one product."""
+        sql = ("SELECT COUNT(*), AVG(finished - started), AVG(bytes) FROM jobs "
+               "WHERE state='done' AND started IS NOT NULL AND finished IS NOT NULL")
+        params = ()
+        if product is not None:
+            sql += " AND product=?"
+            params = (product,)
+        n, secs, size = self._exec(sql, params).fetchone()
+        return n, secs or 0.0, size or 0.0
+
+    def job_bytes(self, product=None):
+        """{key: bytes} of done jobs."""
+        sql = "SELECT province, tile, year, product, bytes FROM jobs WHERE state='done'"
+        params = ()
+        if product is not None:
+            sql += " AND product=?"
+            params = (product,)
+        return {tuple(r[:4]): r[4] for r in self._exec(sql, params).fetchall()}
+
+    def verify(self, key):
+        """True if every recorded piece still exists with its recorded size."""
+        rows = self._exec("SELECT path, bytes FROM pieces WHERE province=? AND tile=? AND "
+                          "year=? AND product=?", key).fetchall()
+        return bool(rows) and all(os.path.exists(p) and os.path.getsize(p) == b for p, b in rows)
+
+    # ---- scheduler input ----------------------------------------------
+
+    def pending_rgb_arguments(self, argument_list):
+        """get_crp_rgb_from_asset arguments with done years removed (no disk access)."""
+        done = self.done_keys('rgb')
+        out = []
+        for arg in argument_list:
+            yrList, _, provName, local_idx = arg[:4]
+            years = [yr for yr in yrList if rgb_key(provName, local_idx, yr) not in done]
+            if years:
+                out.append((years,) + tuple(arg[1:]))
+        return out
+
+    def pending_mask_arguments(self, argument_list):
+        """get_crp_mask_from_asset arguments whose tile is not done."""
+        done = self.done_keys('crop_mask')
+        return [arg for arg in argument_list
+                if mask_key(province_from_dir(arg[0]), arg[1]) not in done]
+
+
+##################
+
+_OPEN = {}
+
+
+def open_manifest(manifest):
+    """Manifest object, or one connection per process for a db path."""
+    if manifest is None or isinstance(manifest, Manifest):
+        return manifest
+    key = (os.getpid(), os.path.abspath(str(manifest)))
+    if key not in _OPEN:
+        _OPEN[key] = Manifest(manifest)
+    return _OPEN[key]
+
+
+@contextmanager
+def track_job(manifest, key, out_dir, prefix):
+    """start() before the download, complete() after it, fail() and re-raise on error."""
+    if manifest is None:
+        yield
+        return
+    manifest.start(key, out_dir, prefix)
+    try:
+        yield
+        manifest.complete(key)
+    except Exception as e:
+        manifest.fail(key, e)
+        raise
@@ -0,0 +1,122 @@
+"""
+Dry-run planner: size a download run before starting it.
+
+For every job-year in an argument list the planner computes the tile's pixel
+grid at `scale`, the number of requests after payload-aware splitting
+(tile_download.split_windows), and the raw bytes. Jobs that are already done
+(manifest, or the `_1.tif` file check) are flagged. Totals cover the pending
+jobs only.
+
+With a manifest that already has finished jobs, the planner uses measured
+values. Seconds per job give the projected wall time at a given
+concurrency. Bytes on disk per raw byte give the expected disk use, which
+includes compression. Without history, the defaults below are used.
+
+Nothing is downloaded. Tile bounds come from the grid catalog or from
+client-side GeoJSON features. Plain ee objects cost one getInfo per tile.
+
+    plan = plan_rgb(argument_list_config_all, manifest=db_path, concurrency=cpus_)
+    print_plan(plan)
+"""
+import os
+
+import numpy as np
+
+from tile_download import tile_grid, tile_bounds, split_windows, MAX_REQUEST_BYTES
+from download_manifest import open_manifest, rgb_key, mask_key, province_from_dir
+
+
+##################
+
+# Bands and dtype per product, as downloaded by rgb_func
+PRODUCTS = {'rgb': (3, 'uint8'), 'crop_mask': (1, 'float32')}
+
+# Used when the manifest has no finished jobs yet
+DEFAULT_JOB_SECONDS = {'rgb': 120.0, 'crop_mask': 60.0}
+DEFAULT_DISK_RATIO = {'rgb': 0.5, 'crop_mask': 0.1}
+
+
+def _job_bounds(catalog, local_idx, tile):
+    if catalog is not None:
+        return catalog.bounds(local_idx)
+    return tile_bounds(tile)
+
+
+def plan_job(bounds, product, scale=10, max_bytes=MAX_REQUEST_BYTES):
+    """(pixels, raw bytes, requests) of one download of `product` over `bounds`."""
+    n_bands, dtype = PRODUCTS[product]
+    width, height, _ = tile_grid(bounds, scale)
+    bpp = n_bands * np.dtype(dtype).itemsize
+    return width * height, width * height * bpp, len(split_windows(width, height, bpp, max_bytes))
+
+
+def _history(manifest, product, rows):
+    """Measured (seconds per job, disk bytes per raw byte), or the defaults."""
+    job_s, ratio = DEFAULT_JOB_SECONDS[product], DEFAULT_DISK_RATIO[product]
+    if manifest is None:
+        return job_s, ratio, 0
+    n, secs, _ = manifest.timings(product)
+    if n:
+        job_s = secs
+    on_disk = manifest.job_bytes(product)
+    raw = sum(r['raw_bytes'] for r in rows if r['key'] in on_disk)
+    if raw:
+        ratio = sum(on_disk[r['key']] for r in rows if r['key'] in on_disk) / raw
+    return job_s, ratio, n
+
+
+def _summarize(rows, product, manifest, concurrency):
+    job_s, ratio, n_history = _history(manifest, product, rows)
+    pending = [r for r in rows if not r['done']]
+    raw = sum(r['raw_bytes'] for r in pending)
+    requests = sum(r['requests'] for r in pending)
+    totals = {'product': product, 'jobs': len(rows), 'done': len(rows) - len(pending),
+              'pending': len(pending), 'requests': requests,
+              'pixels': sum(r['pixels'] for r in pending),
+              'raw_gb': raw / 1e9, 'disk_gb': raw * ratio / 1e9,
+              'job_seconds': job_s, 'history_jobs': n_history, 'concurrency': concurrency,
+              'hours': len(pending) * job_s / max(1, concurrency) / 3600.0}
+    return {'rows': rows, 'totals': totals}
+
+
+def plan_rgb(argument_list, manifest=None, catalog=None, scale=10, concurrency=7,
+             max_bytes=MAX_REQUEST_BYTES):
+    """Plan get_crp_rgb_from_asset argument tuples: one row per tile-year."""
+    manifest = open_manifest(manifest)
+    rows = []
+    for yrList, download_dir, provName, local_idx, _, _, tile_shp, *_ in argument_list:
+        pixels, raw, requests = plan_job(_job_bounds(catalog, local_idx, tile_shp), 'rgb',
+                                         scale, max_bytes)
+        for yr in yrList:
+            key = rgb_key(provName, local_idx, yr)
+            output_tif = os.path.join(str(download_dir), f'rgb_{provName}_{yr}_{local_idx}_1.tif')
+            done = manifest.is_done(key) if manifest else os.path.exists(output_tif)
+            rows.append({'key': key, 'pixels': pixels, 'raw_bytes': raw,
+                         'requests': requests, 'done': done})
+    return _summarize(rows, 'rgb', manifest, concurrency)
+
+
+def plan_mask(argument_list, manifest=None, catalog=None, scale=10, concurrency=7,
+              max_bytes=MAX_REQUEST_BYTES):
+    """Plan get_crp_mask_from_asset argument tuples: one row per tile."""
+    manifest = open_manifest(manifest)
+    rows = []
+    for download_dir, tile_id, _, tile, *_ in argument_list:
+        pixels, raw, requests = plan_job(_job_bounds(catalog, tile_id, tile), 'crop_mask',
+                                         scale, max_bytes)
+        key = mask_key(province_from_dir(download_dir), tile_id)
+        output_tif = os.path.join(str(download_dir), f'crop_mask_{tile_id}_1.tif')
+        done = manifest.is_done(key) if manifest else os.path.exists(output_tif)
+        rows.append({'key': key, 'pixels': pixels, 'raw_bytes': raw,
+                     'requests': requests, 'done': done})
+    return _summarize(rows, 'crop_mask', manifest, concurrency)
+
+
+def print_plan(plan):
+    t = plan['totals']
+    source = f"measured over {t['history_jobs']} jobs" if t['history_jobs'] else "default"
+    print(f"{t['product']}: {t['jobs']} jobs, {t['done']} already complete, {t['pending']} to download")
+    print(f"  requests: {t['requests']}, pixels: {t['pixels'] / 1e9:.2f} G, "
+          f"raw: {t['raw_gb']:.2f} GB, on disk: ~{t['disk_gb']:.2f} GB")
+    print(f"  {t['job_seconds']:.0f} s per job ({source}) at concurrency {t['concurrency']}: "
+          f"~{t['hours']:.2f} h")
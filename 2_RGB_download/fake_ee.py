@@ -0,0 +1,279 @@
+"""
+Local stand-in for the `ee` and `geemap` modules.
+
+Lets the download functions in rgb_func run without an Earth Engine account.
+Every ee object is a lazy node that accepts any method call; a FakeServer
+counts the graph operations built client side, adds latency to each request
+and answers with 429-style errors once its concurrency or rate quota is
+exceeded. Downloads write a small placeholder GeoTIFF name so the usual
+skip checks keep working.
+
+The server holds a lock, so drive the fake with a thread pool rather than a
+process pool.
+
+Usage:
+    import fake_ee
+    server = fake_ee.install(latency=0.2, max_concurrent=4)
+    import rgb_func          # picks up the fake `ee`
+    ...
+    print(server.stats())
+    fake_ee.uninstall()
+"""
+import os
+import sys
+import time
+import hashlib
+import random
+import threading
+import types
+
+
+##################
+
+class EEException(Exception):
+    """Same name as ee.ee_exception.EEException."""
+    pass
+
+
+class FakeServer:
+    """
+    Simulated Earth Engine endpoint.
+
+    Parameters:
+    - latency: seconds each request takes.
+    - jitter: extra uniform random latency in seconds.
+    - max_concurrent: requests allowed in flight before answering 429.
+    - max_rate: requests per second allowed (sliding 1 s window), None = unlimited.
+    - error_rate: probability of a random 'Too many requests' error.
+    - op_cost: seconds of server compute added per graph node of the
+      requested object that the server has not computed before. Like EE,
+      the cache is keyed by value (a digest of the node, its inputs and
+      arguments), so a rebuilt identical graph is as cheap as a reused one.
+    - info: value returned by getInfo() calls, or a callable info(node).
+    """
+    def __init__(self, latency=0.05, jitter=0.0, max_concurrent=4, max_rate=None,
+                 error_rate=0.0, op_cost=0.0, info=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.max_concurrent = max_concurrent
+        self.max_rate = max_rate
+        self.error_rate = error_rate
+        self.op_cost = op_cost
+        self.info = info
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.ops = 0
+            self.requests = 0
+            self.throttled = 0
+            self.in_flight = 0
+            self.peak_concurrent = 0
+            self.op_names = {}
+            self.computed_nodes = 0
+            self._computed = set()
+            self._recent = []
+
+    def count_op(self, name):
+        with self.lock:
+            self.ops += 1
+            self.op_names[name] = self.op_names.get(name, 0) + 1
+
+    def request(self, kind, obj=None):
+        """Run one request; raise EEException when the quota is exceeded."""
+        now = time.monotonic()
+        with self.lock:
+            graph = {_digest(n) for n in _walk(obj)} if isinstance(obj, _Node) else set()
+            new_nodes = graph - self._computed
+            self.requests += 1
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            over_rate = self.max_rate is not None and len(self._recent) >= self.max_rate
+            over_conc = self.max_concurrent is not None and self.in_flight >= self.max_concurrent
+            unlucky = self.random.random() < self.error_rate
+            if over_rate or over_conc or unlucky:
+                self.throttled += 1
+                raise EEException(f"Too many concurrent requests (429) on {kind}.")
+            self._recent.append(now)
+            self.in_flight += 1
+            self.peak_concurrent = max(self.peak_concurrent, self.in_flight)
+            self._computed.update(new_nodes)
+            self.computed_nodes += len(new_nodes)
+            delay = self.latency + self.random.uniform(0, self.jitter) + self.op_cost * len(new_nodes)
+        try:
+            time.sleep(delay)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'throttled': self.throttled, 'ops': self.ops,
+                    'computed_nodes': self.computed_nodes, 'peak_concurrent': self.peak_concurrent}
+
+
+##################
+
+class _Node:
+    """Lazy ee object: any method call returns a new node and counts one op."""
+    def __init__(self, server, name, parent=None, args=()):
+        self._server = server
+        self._name = name
+        self._parent = parent
+        self._args = args
+        self._key = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            self._server.count_op(name)
+            return _Node(self._server, name, self, tuple(args) + tuple(kwargs.values()))
+        return method
+
+    def getInfo(self):
+        self._server.request('getInfo', self)
+        info = self._server.info
+        return info(self) if callable(info) else info
+
+    def __repr__(self):
+        return f"<fake ee {self._name}>"
+
+
+def _value(arg):
+    """Hashable, identity-free form of a node argument."""
+    if isinstance(arg, _Node):
+        return _digest(arg)
+    if isinstance(arg, (list, tuple)):
+        return tuple(_value(a) for a in arg)
+    if isinstance(arg, dict):
+        return tuple(sorted((str(k), _value(v)) for k, v in arg.items()))
+    if callable(arg):
+        # EE serializes a mapped function's body; its code and closure stand in for it
+        code = getattr(arg, '__code__', None)
+        cells = tuple(_value(c.cell_contents) for c in (getattr(arg, '__closure__', None) or ()))
+        return ('function', getattr(arg, '__qualname__', repr(arg)),
+                code.co_code if code is not None else None, cells)
+    return repr(arg)
+
+
+def _digest(node):
+    """Structural hash of a node: equal graphs built twice get the same digest."""
+    if node._key is None:
+        parent = _digest(node._parent) if node._parent is not None else None
+        node._key = hashlib.sha1(repr((node._name, parent, _value(node._args))).encode()).hexdigest()
+    return node._key
+
+
+def _walk(node):
+    """Every distinct node of the graph below `node`."""
+    seen, stack = set(), [node]
+    while stack:
+        n = stack.pop()
+        if n in seen:
+            continue
+        seen.add(n)
+        stack.extend(c for c in (n._parent,) + n._args if isinstance(c, _Node))
+    return seen
+
+
+class _Namespace:
+    """ee.Image / ee.Filter / ... : callable constructor plus static methods."""
+    def __init__(self, server, name):
+        self._server = server
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        self._server.count_op(self._name)
+        return _Node(self._server, self._name, None, tuple(args) + tuple(kwargs.values()))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return _Namespace(self._server, f"{self._name}.{name}")
+
+
+##################
+
+def _make_ee(server, n_assets=3):
+    ee = types.ModuleType('ee')
+    ee.EEException = EEException
+    ee.ee_exception = types.SimpleNamespace(EEException=EEException)
+    ee.Initialize = lambda *a, **k: server.count_op('Initialize')
+    ee.Authenticate = lambda *a, **k: None
+    for name in ('Image', 'ImageCollection', 'Feature', 'FeatureCollection', 'Geometry',
+                 'Number', 'List', 'Dictionary', 'String', 'Date', 'Filter', 'Reducer',
+                 'Join', 'Kernel'):
+        setattr(ee, name, _Namespace(server, name))
+
+    def listAssets(params, *a, **k):
+        parent = params['parent'] if isinstance(params, dict) else params
+        page_size = params.get('pageSize') if isinstance(params, dict) else None
+        start = int(params.get('pageToken') or 0) if isinstance(params, dict) else 0
+        server.request('listAssets')
+        stop = n_assets if not page_size else min(n_assets, start + page_size)
+        page = {'assets': [{'name': f"{parent}/img_{i}"} for i in range(start, stop)]}
+        if stop < n_assets:
+            page['nextPageToken'] = str(stop)
+        return page
+
+    def computePixels(params, *a, **k):
+        import numpy as np
+        server.request('computePixels', params.get('expression'))
+        dims = params['grid']['dimensions']
+        bands = params.get('bandIds') or ['b1']
+        return np.ones((dims['height'], dims['width']), dtype=[(b, 'u1') for b in bands])
+
+    ee.data = types.SimpleNamespace(listAssets=listAssets, computePixels=computePixels)
+    ee._fake_server = server
+    return ee
+
+
+def _write_placeholder(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'II*\x00fake')
+
+
+def _make_geemap(server):
+    geemap = types.ModuleType('geemap')
+
+    def download_ee_image(image, filename, *args, **kwargs):
+        server.request('download', image)
+        _write_placeholder(filename)
+
+    def download_ee_image_tiles(image, features, out_dir=None, prefix=None, *args, **kwargs):
+        server.request('download', image)
+        _write_placeholder(os.path.join(str(out_dir), f"{prefix}1.tif"))
+
+    geemap.download_ee_image = download_ee_image
+    geemap.download_ee_image_tiles = download_ee_image_tiles
+    geemap.geemap = geemap
+    return geemap
+
+
+_SAVED = {}
+
+
+def install(server=None, n_assets=3, **kwargs):
+    """Register fake `ee`, `geemap` and `geemap.geemap` in sys.modules; return the server."""
+    server = server or FakeServer(**kwargs)
+    ee = _make_ee(server, n_assets=n_assets)
+    geemap = _make_geemap(server)
+    for name, mod in (('ee', ee), ('geemap', geemap), ('geemap.geemap', geemap)):
+        if name not in _SAVED:
+            _SAVED[name] = sys.modules.get(name)
+        sys.modules[name] = mod
+    return server
+
+
+def uninstall():
+    """Restore whatever `ee` / `geemap` modules were present before install()."""
+    for name, mod in _SAVED.items():
+        if mod is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = mod
+    _SAVED.clear()
@@ -0,0 +1,174 @@
+"""
+Local catalog of the Grid_prairies tiles and province boundaries.
+
+The notebooks pass `list_roi_all.get(local_idx)` to every job. That is a lazy
+server-side list lookup, and each ee.Feature(tile_shp).geometry() /
+filterBounds call resolves it again. The catalog fetches the grid and the
+boundary of a province once (paged getInfo), then caches them as GeoJSON, or
+as GeoParquet if pyarrow is installed. Jobs then get plain client-side GeoJSON
+features.
+
+local_idx is the tile's position in grid.toList(), as in the notebooks, so
+output file names do not change. Tile selection ("tiles in this bbox",
+"tiles inside the province") is a local STRtree query.
+
+    from grid_catalog import load_or_fetch
+    catalog = load_or_fetch(provName, project_root / '5_Data' / 'Grid_catalog')
+    argument_list_config_all = catalog.rgb_arguments(yrList, out_dir, provName, asset_path, selectProv)
+"""
+import os
+from pathlib import Path
+
+
+##################
+
+GRID_ASSET = 'projects/ee-download-canada/assets/Grid_prairies'
+BOUNDARY_ASSET = 'projects/ee-aafc-annimation/assets/provincialBoundary'
+
+# provName -> PRFABBR prefix used to select the province boundary
+PROVINCE_PREFIX = {'AB': 'Alb.', 'SK': 'Sask.', 'MB': 'Man.'}
+
+# Features per getInfo call (Earth Engine refuses more than 5000)
+PAGE_SIZE = 1000
+
+
+def fetch_features(collection, page_size=PAGE_SIZE):
+    """Client-side GeoJSON features of an ee.FeatureCollection, in toList order, paged."""
+    size = collection.size().getInfo()
+    features = []
+    for offset in range(0, size, page_size):
+        features.extend(collection.toList(page_size, offset).getInfo())
+    return features
+
+
+def _frame(features, index=None):
+    import geopandas as gpd
+    gdf = gpd.GeoDataFrame.from_features(features, crs='EPSG:4326')
+    if index is not None:
+        gdf['local_idx'] = index
+    return gdf
+
+
+def _cache_paths(cache_dir, provName, fmt):
+    ext = '.parquet' if fmt == 'parquet' else '.geojson'
+    return (Path(cache_dir) / f'grid_{provName}{ext}',
+            Path(cache_dir) / f'boundary_{provName}{ext}')
+
+
+def _default_format():
+    try:
+        import pyarrow  # noqa: F401
+        return 'parquet'
+    except ImportError:
+        return 'geojson'
+
+
+##################
+
+class GridCatalog:
+    """Grid tiles (GeoDataFrame with a local_idx column) plus the province boundary."""
+    def __init__(self, tiles, boundary=None):
+        tiles = tiles.set_index(tiles['local_idx'].astype(int).to_numpy())
+        self.tiles = tiles.sort_index()
+        self.boundary = boundary
+
+    def __len__(self):
+        return len(self.tiles)
+
+    # ---- cache --------------------------------------------------------
+
+    def save(self, cache_dir, provName, fmt=None):
+        fmt = fmt or _default_format()
+        grid_path, boundary_path = _cache_paths(cache_dir, provName, fmt)
+        os.makedirs(cache_dir, exist_ok=True)
+        for gdf, path in ((self.tiles, grid_path), (self.boundary, boundary_path)):
+            if gdf is None:
+                continue
+            gdf = gdf.reset_index(drop=True)
+            if fmt == 'parquet':
+                gdf.to_parquet(path)
+            else:
+                gdf.to_file(path, driver='GeoJSON')
+        return grid_path
+
+    @classmethod
+    def load(cls, cache_dir, provName):
+        """Catalog from the cache, or None if it has not been fetched yet."""
+        import geopandas as gpd
+        for fmt in ('parquet', 'geojson'):
+            grid_path, boundary_path = _cache_paths(cache_dir, provName, fmt)
+            if grid_path.exists():
+                read = gpd.read_parquet if fmt == 'parquet' else gpd.read_file
+                boundary = read(boundary_path) if boundary_path.exists() else None
+                return cls(read(grid_path), boundary)
+        return None
+
+    # ---- queries ------------------------------------------------------
+
+    def query(self, bbox=None, geometry=None, within_province=False):
+        """
+        local_idx of tiles intersecting `bbox` (xmin, ymin, xmax, ymax) and/or
+        a shapely `geometry`. With within_province=True, only tiles intersecting
+        the cached province boundary. No argument returns every tile.
+        """
+        from shapely.geometry import box
+        from shapely.ops import unary_union
+        idx = [int(i) for i in self.tiles.index]
+        shapes = [] if bbox is None else [box(*bbox)]
+        if geometry is not None:
+            shapes.append(geometry)
+        if within_province and self.boundary is not None:
+            shapes.append(unary_union(list(self.boundary.geometry)))
+        for shape in shapes:
+            hits = set(self.tiles.index[self.tiles.sindex.query(shape, predicate='intersects')])
+            idx = [i for i in idx if i in hits]
+        return idx
+
+    def geometry(self, local_idx):
+        """Shapely geometry of one tile."""
+        return self.tiles.geometry.loc[int(local_idx)]
+
+    def bounds(self, local_idx):
+        return tuple(self.geometry(local_idx).bounds)
+
+    def feature(self, local_idx):
+        """Client-side GeoJSON Feature of one tile (what workers receive as tile_shp)."""
+        from shapely.geometry import mapping
+        return {'type': 'Feature', 'geometry': mapping(self.geometry(local_idx)),
+                'properties': {'local_idx': int(local_idx)}}
+
+    # ---- job arguments ------------------------------------------------
+
+    def rgb_arguments(self, yrList, out_dir, provName, asset_path, selectProv, idx=None):
+        """get_crp_rgb_from_asset argument tuples for `idx` (default: every tile)."""
+        idx = self.query() if idx is None else idx
+        return [(yrList, out_dir, provName, str(i), asset_path, selectProv, self.feature(i))
+                for i in idx]
+
+    def mask_arguments(self, out_dir, asset_path, idx=None):
+        """get_crp_mask_from_asset argument tuples for `idx` (default: every tile)."""
+        idx = self.query() if idx is None else idx
+        return [(out_dir, str(i), asset_path, self.feature(i)) for i in idx]
+
+
+##################
+
+def fetch_grid(provName, grid_asset=GRID_ASSET, boundary_asset=BOUNDARY_ASSET,
+               page_size=PAGE_SIZE):
+    """Fetch the province boundary and its grid tiles from Earth Engine (getInfo, paged)."""
+    import ee
+    selectProv = ee.FeatureCollection(boundary_asset).filter(
+        ee.Filter.stringStartsWith('PRFABBR', PROVINCE_PREFIX[provName]))
+    grid = ee.FeatureCollection(grid_asset).filterBounds(selectProv)
+    tiles = fetch_features(grid, page_size)
+    boundary = fetch_features(selectProv, page_size)
+    return GridCatalog(_frame(tiles, index=range(len(tiles))), _frame(boundary))
+
+
+def load_or_fetch(provName, cache_dir, refresh=False, fmt=None, **kwargs):
+    """Cached catalog for provName; fetched from Earth Engine and saved on first use."""
+    catalog = None if refresh else GridCatalog.load(cache_dir, provName)
+    if catalog is None:
+        catalog = fetch_grid(provName, **kwargs)
+        catalog.save(cache_dir, provName, fmt)
+    return catalog
@@ -0,0 +1,161 @@
+"""
+NumPy/SciPy port of the s2cloudless cloud and shadow mask chain in rgb_func.
+
+Same steps and parameters as add_cloud_bands / add_shadow_bands /
+add_cld_shdw_mask / apply_cld_shdw_mask (CLD_PRB_THRESH, NIR_DRK_THRESH,
+CLD_PRJ_DIST, BUFFER), run on local 10 m arrays:
+- clouds: s2cloudless probability > CLD_PRB_THRESH
+- dark pixels: B8 < NIR_DRK_THRESH * 1e4, excluding water (SCL == 6)
+- cloud projection: directionalDistanceTransform at 100 m. A pixel is flagged
+  when a cloud lies within CLD_PRJ_DIST km towards the sun (angle
+  90 - MEAN_SOLAR_AZIMUTH_ANGLE). Clouds are taken to 100 m by block max.
+- shadows: projection AND dark pixels
+- cloudmask: (clouds OR shadows) at 20 m (nearest), focalMin(2) then
+  focalMax(BUFFER * 2 / 20) with circular kernels, back to 10 m
+
+Every step is vectorized across scenes: arrays are (n_scenes, h, w) and the
+azimuth is one value per scene. Large scenes are processed in row tiles with a
+halo wide enough for the projection and focal kernels, so memory stays bounded
+and tiles can run in a thread pool.
+"""
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+from bands import CLD_PRB_THRESH, NIR_DRK_THRESH, CLD_PRJ_DIST, BUFFER
+
+
+##################
+
+SR_BAND_SCALE = 1e4
+WATER_SCL = 6
+PIXEL_SIZE = 10
+PROJ_SCALE = 100
+MASK_SCALE = 20
+
+
+def cloud_bands(probability, threshold=CLD_PRB_THRESH):
+    """add_cloud_bands: clouds where s2cloudless probability > threshold."""
+    return probability > threshold
+
+
+def dark_pixels(b8, scl, nir_dark=NIR_DRK_THRESH):
+    """Dark NIR pixels that are not water."""
+    return (b8 < nir_dark * SR_BAND_SCALE) & (scl != WATER_SCL)
+
+
+def _block_reduce_max(mask, factor):
+    """(n, h, w) bool -> (n, ceil(h/f), ceil(w/f)), True where any pixel of the block is."""
+    n, h, w = mask.shape
+    H, W = -(-h // factor), -(-w // factor)
+    padded = np.zeros((n, H * factor, W * factor), dtype=bool)
+    padded[:, :h, :w] = mask
+    return padded.reshape(n, H, factor, W, factor).any(axis=(2, 4))
+
+
+def _upsample(mask, factor, shape):
+    """Nearest-neighbour upsampling back to the (h, w) 10 m grid."""
+    return mask.repeat(factor, axis=1).repeat(factor, axis=2)[:, :shape[0], :shape[1]]
+
+
+def project_clouds(clouds, solar_azimuth, proj_dist=CLD_PRJ_DIST, pixel_size=PIXEL_SIZE,
+                   proj_scale=PROJ_SCALE):
+    """
+    directionalDistanceTransform(90 - azimuth, proj_dist * 10).mask() at `proj_scale`.
+
+    clouds: (n, h, w) bool at pixel_size; solar_azimuth: (n,) degrees.
+    Returns the (n, h, w) bool cloud projection at pixel_size.
+    """
+    factor = max(1, int(round(proj_scale / pixel_size)))
+    coarse = _block_reduce_max(clouds, factor)
+    n, H, W = coarse.shape
+    angle = np.radians(90.0 - np.asarray(solar_azimuth, dtype=float)).reshape(n)
+    max_steps = int(proj_dist * 10)
+
+    rows = np.arange(H)[None, :, None]
+    cols = np.arange(W)[None, None, :]
+    scene = np.arange(n)[:, None, None]
+    proj = coarse.copy()
+    for d in range(1, max_steps + 1):
+        # source pixel d steps towards the sun (x east, y north; rows grow south)
+        dc = np.rint(d * np.cos(angle)).astype(int)[:, None, None]
+        dr = np.rint(-d * np.sin(angle)).astype(int)[:, None, None]
+        r, c = rows + dr, cols + dc
+        inside = (r >= 0) & (r < H) & (c >= 0) & (c < W)
+        proj |= inside & coarse[scene, np.clip(r, 0, H - 1), np.clip(c, 0, W - 1)]
+    return _upsample(proj, factor, clouds.shape[1:])
+
+
+def circle_footprint(radius):
+    """EE circular kernel of `radius` pixels (at least the centre pixel)."""
+    r = int(math.floor(radius))
+    y, x = np.mgrid[-r:r + 1, -r:r + 1]
+    return (x * x + y * y) <= radius * radius
+
+
+def clean_mask(is_cld_shdw, buffer=BUFFER, pixel_size=PIXEL_SIZE, mask_scale=MASK_SCALE):
+    """focalMin(2).focalMax(buffer * 2 / 20) at mask_scale, nearest back to pixel_size."""
+    factor = max(1, int(round(mask_scale / pixel_size)))
+    coarse = is_cld_shdw[:, ::factor, ::factor]
+    eroded = ndimage.minimum_filter(coarse, footprint=circle_footprint(2)[None], mode='nearest')
+    dilated = ndimage.maximum_filter(eroded, footprint=circle_footprint(buffer * 2 / 20)[None],
+                                     mode='constant', cval=False)
+    return _upsample(dilated, factor, is_cld_shdw.shape[1:])
+
+
+def cld_shdw_mask(probability, b8, scl, solar_azimuth):
+    """
+    add_cld_shdw_mask for (n, h, w) scene stacks.
+
+    Returns a dict of (n, h, w) bool arrays: clouds, dark_pixels,
+    cloud_transform, shadows and cloudmask.
+    """
+    clouds = cloud_bands(probability)
+    dark = dark_pixels(b8, scl)
+    proj = project_clouds(clouds, solar_azimuth)
+    shadows = proj & dark
+    return {'clouds': clouds, 'dark_pixels': dark, 'cloud_transform': proj,
+            'shadows': shadows, 'cloudmask': clean_mask(clouds | shadows)}
+
+
+def apply_cld_shdw_mask(bands, cloudmask):
+    """apply_cld_shdw_mask: (n, h, w) or (n, b, h, w) bands as float with NaN under the mask."""
+    bands = np.asarray(bands, dtype=np.float32)
+    mask = cloudmask if bands.ndim == 3 else cloudmask[:, None]
+    return np.where(mask, np.nan, bands)
+
+
+##################
+
+def halo_rows(proj_dist=CLD_PRJ_DIST, buffer=BUFFER, pixel_size=PIXEL_SIZE):
+    """Rows of context a tile needs so its mask matches the full-scene result."""
+    proj = int(proj_dist * 10) * PROJ_SCALE // pixel_size + PROJ_SCALE // pixel_size
+    focal = (2 + int(math.floor(buffer * 2 / 20)) + 1) * MASK_SCALE // pixel_size
+    return proj + focal
+
+
+def cld_shdw_mask_tiled(probability, b8, scl, solar_azimuth, tile_rows=1024, workers=None):
+    """
+    cloudmask of cld_shdw_mask, computed in row tiles with a halo.
+
+    Tile starts are aligned to the 100 m grid, so tiles see the same coarse
+    blocks as the whole scene. Returns the (n, h, w) bool cloudmask.
+    """
+    n, h, w = probability.shape
+    align = PROJ_SCALE // PIXEL_SIZE
+    tile_rows = max(align, tile_rows // align * align)
+    halo = -(-halo_rows() // align) * align
+    out = np.empty((n, h, w), dtype=bool)
+
+    def run(row):
+        r0, r1 = max(0, row - halo), min(h, row + tile_rows + halo)
+        part = cld_shdw_mask(probability[:, r0:r1], b8[:, r0:r1], scl[:, r0:r1], solar_azimuth)
+        stop = min(h, row + tile_rows)
+        out[:, row:stop] = part['cloudmask'][:, row - r0:stop - r0]
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        list(pool.map(run, range(0, h, tile_rows)))
+    return out
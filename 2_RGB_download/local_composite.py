@@ -0,0 +1,213 @@
+"""
+Offline NumPy backend for get_s2: seasonal RGB composites from cached scenes.
+
+Reproduces the Earth Engine logic of rgb_func.get_s2 on local arrays:
+- scenes dated in [year-04-01, year-10-01), as filterDate does
+- a pixel is clear where cs_cdf >= clear_threshold
+- each band only uses scenes in its month window (RGB_BANDS: B4 Aug-Oct,
+  B3 Jun-Aug, B2 Apr-Jul)
+- per-pixel median of the clear, in-season observations
+- unitScale to the band range, * 255, cast to byte (truncated, saturated)
+- unmask(1) where no observation is left, then * mask, unmask(1) again
+
+Cache layout: one single-band GeoTIFF per scene and band, all on the tile grid,
+    <scene_dir>/<scene_id>_B4.tif, _B3.tif, _B2.tif, _cs_cdf.tif
+where scene_id is the S2 system:index (it starts with YYYYMMDD).
+
+The tile is processed in row blocks sized to `max_memory`, and the blocks are
+composited in a thread pool. NumPy sorting releases the GIL, so the work
+scales with cores. Each block is written to the output as it finishes.
+"""
+import os
+import re
+import glob
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from bands import RGB_BANDS
+
+
+##################
+
+CS_BAND = 'cs_cdf'
+CLEAR_THRESHOLD = 0.55
+MAX_MEMORY = 1024 * 1024 * 1024
+
+_SCENE_FILE = re.compile(r'^(?P<scene>(?P<date>\d{8})\w*?)_(?P<band>B\d+A?|cs_cdf)\.tif$')
+
+
+def list_scenes(scene_dir, year=None):
+    """
+    Cached scenes in scene_dir as [(scene_id, date, {band: path})], sorted by date.
+
+    With `year`, only scenes inside get_s2's [year-04-01, year-10-01) window.
+    Scenes missing a band or the cloud score are left out.
+    """
+    scenes = {}
+    for path in glob.glob(os.path.join(str(scene_dir), '*.tif')):
+        m = _SCENE_FILE.match(os.path.basename(path))
+        if m:
+            date = datetime.datetime.strptime(m['date'], '%Y%m%d').date()
+            scenes.setdefault((m['scene'], date), {})[m['band']] = path
+    needed = {b for b, _, _ in RGB_BANDS} | {CS_BAND}
+    out = []
+    for (scene, date), paths in sorted(scenes.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        if not needed <= set(paths):
+            continue
+        if year is not None and not (datetime.date(year, 4, 1) <= date < datetime.date(year, 10, 1)):
+            continue
+        out.append((scene, date, paths))
+    return out
+
+
+def masked_median(values, valid):
+    """
+    Per-pixel median over axis 0 of `values` where `valid`; NaN where nothing is valid.
+
+    Vectorized: invalid values are pushed to +inf, one sort, then the middle
+    one or two valid values are picked per pixel (EE averages the two for
+    even counts as well).
+    """
+    data = np.where(valid, values, np.inf).astype(np.float32, copy=False)
+    data.sort(axis=0)
+    n = valid.sum(axis=0)
+    lo = np.clip((n - 1) // 2, 0, None)[None]
+    hi = np.clip(n // 2, 0, data.shape[0] - 1)[None]
+    med = 0.5 * (np.take_along_axis(data, lo, 0)[0] + np.take_along_axis(data, hi, 0)[0])
+    med[n == 0] = np.nan
+    return med
+
+
+def to_byte(band, lo, hi):
+    """unitScale(lo, hi) * 255 then toByte(); NaN (masked) -> unmask(1)."""
+    scaled = (band - lo) / float(hi - lo) * 255
+    out = np.clip(np.nan_to_num(scaled, nan=1.0), 0, 255).astype(np.uint8)
+    out[np.isnan(scaled)] = 1
+    return out
+
+
+def composite_arrays(bands, cs, months, clear_threshold=CLEAR_THRESHOLD, mask=None):
+    """
+    get_s2 on arrays.
+
+    Parameters:
+    - bands: {'B4': (n, h, w), 'B3': ..., 'B2': ...} surface reflectance.
+    - cs: (n, h, w) cs_cdf cloud score.
+    - months: (n,) acquisition month of each scene.
+    - mask: optional (h, w) cropland mask; NaN where masked.
+
+    Returns a (3, h, w) uint8 array in RGB_BANDS order.
+    """
+    months = np.asarray(months)
+    clear = cs >= clear_threshold
+    out = []
+    for band, (m_lo, m_hi), (lo, hi) in RGB_BANDS:
+        in_season = ((months >= m_lo) & (months <= m_hi))[:, None, None]
+        out.append(to_byte(masked_median(bands[band], clear & in_season), lo, hi))
+    rgb = np.stack(out)
+    if mask is not None:
+        # rgb.multiply(mask).toByte().unmask(1)
+        product = np.clip(rgb * np.nan_to_num(mask, nan=0.0), 0, 255).astype(np.uint8)
+        rgb = np.where(np.isnan(mask)[None], np.uint8(1), product)
+    return rgb
+
+
+##################
+
+def _read_block(scenes, band, window):
+    import rasterio
+    out = []
+    for _, _, paths in scenes:
+        with rasterio.open(paths[band]) as src:
+            out.append(src.read(1, window=window))
+    return np.stack(out)
+
+
+def _read_mask(mask_tif, window):
+    import rasterio
+    with rasterio.open(mask_tif) as src:
+        data = src.read(1, window=window, masked=True)
+    return data.astype(np.float32).filled(np.nan)
+
+
+def block_rows_for(n_scenes, width, max_memory=MAX_MEMORY, workers=1):
+    """Rows per block so that `workers` blocks in flight stay within max_memory."""
+    # per scene and pixel: 4 inputs as read (<= 4 bytes each) + the float32 sort copy
+    per_row = max(1, n_scenes) * width * (4 * 4 + 4)
+    return max(1, int(max_memory // (per_row * max(1, workers))))
+
+
+def composite_tile(scene_dir, year, out_tif, mask_tif=None, clear_threshold=CLEAR_THRESHOLD,
+                   max_memory=MAX_MEMORY, workers=None, block_rows=None):
+    """
+    Write the get_s2 composite of `year` from the scenes in scene_dir to out_tif.
+
+    Parameters:
+    - mask_tif: optional cropland mask on the same grid (nodata = masked).
+    - max_memory: bound for the blocks in flight, in bytes.
+    - workers: threads (default: CPU count).
+    - block_rows: rows per block; derived from max_memory if None.
+
+    Returns out_tif, or None if there is no cached scene for the year.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    scenes = list_scenes(scene_dir, year)
+    if not scenes:
+        return None
+    months = [d.month for _, d, _ in scenes]
+    workers = workers or os.cpu_count() or 1
+
+    with rasterio.open(scenes[0][2][CS_BAND]) as ref:
+        width, height = ref.width, ref.height
+        profile = {'driver': 'GTiff', 'width': width, 'height': height, 'count': 3,
+                   'dtype': 'uint8', 'crs': ref.crs, 'transform': ref.transform,
+                   'tiled': True, 'blockxsize': 512, 'blockysize': 512, 'compress': 'deflate'}
+    rows = block_rows or block_rows_for(len(scenes), width, max_memory, workers)
+
+    def run(row):
+        window = Window(0, row, width, min(rows, height - row))
+        bands = {b: _read_block(scenes, b, window) for b, _, _ in RGB_BANDS}
+        cs = _read_block(scenes, CS_BAND, window)
+        mask = _read_mask(mask_tif, window) if mask_tif else None
+        return window, composite_arrays(bands, cs, months, clear_threshold, mask)
+
+    part = out_tif + '.part'
+    try:
+        with rasterio.open(part, 'w', **profile) as dst:
+            dst.descriptions = tuple(b for b, _, _ in RGB_BANDS)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # submit in waves so at most `workers` blocks are in memory
+                starts = list(range(0, height, rows))
+                for i in range(0, len(starts), workers):
+                    futures = [pool.submit(run, row) for row in starts[i:i + workers]]
+                    for fut in as_completed(futures):
+                        window, rgb = fut.result()
+                        dst.write(rgb, window=window)
+        os.replace(part, out_tif)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return out_tif
+
+
+def composite_tile_years(scene_dir, yrList, download_dir, provName, local_idx, mask_tif=None,
+                         **kwargs):
+    """
+    Local counterpart of get_crp_rgb_from_asset for one tile.
+
+    Writes rgb_{prov}_{yr}_{idx}_1.tif for every year with cached scenes, so
+    segmentation reads the local composites like downloaded ones.
+    """
+    written = []
+    for yr in yrList:
+        out_tif = os.path.join(str(download_dir), f'rgb_{provName}_{yr}_{local_idx}_1.tif')
+        if composite_tile(scene_dir, yr, out_tif, mask_tif, **kwargs):
+            written.append(out_tif)
+        else:
+            print("No cached scenes for year ", yr, " in ", scene_dir, ", skipping now ...")
+    return written
@@ -0,0 +1,114 @@
+"""
+Vectorized Otsu thresholds, for one image or a batch.
+
+Replaces the commented-out compute_otsu / otsu_threshold in rgb_func, which
+loop in Python over 256 bins per image. Here:
+- histograms: np.bincount per image (uint8 images are counted directly),
+  with the same bin edges as the np.histogram calls of the old code
+- thresholds: cumulative sums over the bins, the between-class variance of
+  every split at once, one argmax per image
+
+Thresholds are computed from histograms, so histograms saved in a first pass
+(or summed over windows) can be thresholded again without rereading pixels.
+Results match the loops, including the first-maximum tie-break and the
+fallback threshold when no split separates two classes.
+"""
+import numpy as np
+
+
+##################
+
+N_BINS = 256
+
+
+def _histogram_one(img, value_range, n_bins, ignore_nonpositive):
+    """np.histogram(img, n_bins, value_range)[0] (minus values <= 0), via bincount."""
+    lo, hi = value_range
+    img = np.asarray(img).ravel()
+    if img.dtype == np.uint8 and (lo, hi) == (0, 255) and n_bins == 256:
+        # bin == value: count directly, then drop the zeros
+        hist = np.bincount(img, minlength=n_bins)
+        if ignore_nonpositive:
+            hist[0] = 0
+        return hist
+    v = img.astype(np.float64, copy=False)
+    keep = (v >= lo) & (v <= hi)
+    if ignore_nonpositive:
+        keep &= v > 0
+    v = v[keep]
+    idx = np.minimum(((v - lo) * (n_bins / (hi - lo))).astype(np.int64), n_bins - 1)
+    return np.bincount(idx, minlength=n_bins)
+
+
+def histograms(images, value_range=(0, 255), n_bins=N_BINS, ignore_nonpositive=True):
+    """
+    (N, n_bins) int64 histograms of N grayscale images.
+
+    `images` is an (N, ...) array or a list of arrays of any shapes. With
+    ignore_nonpositive, values <= 0 are left out, as otsu_threshold does.
+    Histograms of windows of one image can be summed before thresholding.
+    """
+    out = np.zeros((len(images), n_bins), dtype=np.int64)
+    for i, img in enumerate(images):
+        out[i] = _histogram_one(img, value_range, n_bins, ignore_nonpositive)
+    return out
+
+
+def otsu_from_histograms(hist, centers=None, default=None):
+    """
+    Otsu threshold of every histogram row.
+
+    Parameters:
+    - hist: (n_bins,) or (N, n_bins) counts.
+    - centers: value of each bin (default: the bin index).
+    - default: threshold when no split has positive between-class variance
+      (default: centers[0]).
+
+    Returns a float array of shape (N,) (a float for a single histogram).
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    single = hist.ndim == 1
+    hist = np.atleast_2d(hist)
+    n_bins = hist.shape[1]
+    centers = np.arange(n_bins, dtype=np.float64) if centers is None else np.asarray(centers, float)
+    default = centers[0] if default is None else default
+
+    w_b = np.cumsum(hist, axis=1)
+    sum_b = np.cumsum(hist * centers, axis=1)
+    total = w_b[:, -1:]
+    w_f = total - w_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m_b = sum_b / w_b
+        m_f = (sum_b[:, -1:] - sum_b) / w_f
+        between = w_b * w_f * (m_b - m_f) ** 2
+    between[(w_b == 0) | (w_f == 0) | ~np.isfinite(between)] = 0.0
+
+    best = between.argmax(axis=1)
+    found = between[np.arange(len(hist)), best] > 0
+    thresh = np.where(found, centers[best], default)
+    return float(thresh[0]) if single else thresh
+
+
+##################
+
+def otsu_thresholds(images, value_range=(0, 255), ignore_nonpositive=True):
+    """Otsu threshold (bin index, 0 when undefined) of each image of a batch."""
+    hist = histograms(images, value_range, ignore_nonpositive=ignore_nonpositive)
+    return otsu_from_histograms(hist, default=0)
+
+
+def otsu_threshold(grayscale_array):
+    """
+    Otsu threshold in [0..255] of a grayscale array; values <= 0 are ignored.
+
+    Same result as the old loop in rgb_func: bins of np.histogram(range=(0, 255)),
+    returns the bin index, 0 if no threshold exists.
+    """
+    return int(otsu_thresholds([grayscale_array])[0])
+
+
+def compute_otsu(gray_arr):
+    """Return Otsu threshold for 8-bit grayscale numpy array (bin centre, zeros counted)."""
+    hist = histograms([gray_arr], (0, 256), ignore_nonpositive=False)
+    centers = np.arange(N_BINS) + 0.5
+    return float(otsu_from_histograms(hist, centers)[0])
@@ -0,0 +1,270 @@
+"""
+Multi-year Otsu composite of aligned RGB tiles, streamed window by window.
+
+Working version of the commented-out compute_mean_with_otsu_and_shapefile in
+rgb_func. Outputs are the same:
+1. `rgb/<name>_with_otsu.tif`: per pixel and band, the mean over the years
+   whose grayscale passed that year's Otsu threshold
+2. `shp/<name>_mask.shp`: polygons where the plain multi-year grayscale mean
+   is above its own Otsu threshold
+
+The old version held float64 (3, H, W) sums, uint32 counts and a full masked
+float32 read of every year. This one never holds more than a window:
+- pass 1: per-year grayscale histograms, summed over windows -> thresholds
+  (otsu.py, no pixels kept)
+- pass 2: windows run in a thread pool. Each window reads every year and
+  accumulates into uint16/uint32 sums and uint8/uint16 counts, then writes
+  the mean composite. The grayscale mean goes to a temporary uint8 raster,
+  and its histogram is summed.
+- pass 3: threshold the grayscale mean window by window, then polygonize the
+  mask straight from the raster band (GDAL reads it line by line)
+
+Window height comes from `max_memory` and the measured cost of a window
+pixel, so the windows in flight stay within max_memory whatever the tile
+size. Windows are whole BLOCK rows high while they fit; otherwise fewer
+windows run at once, and as a last resort a single window gets fewer rows.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from otsu import histograms, otsu_from_histograms
+
+
+##################
+
+GRAY_WEIGHTS = (0.2989, 0.5870, 0.1140)
+MAX_MEMORY = 512 * 1024 * 1024
+BLOCK = 512
+# peak bytes per window pixel, measured with tracemalloc:
+# one year's masked read and the _gray temporaries (pass 1, plus 4 per year kept)
+_READ_BYTES = 24
+# pass 2 on top of its accumulators: float64 division, rounding and np.where
+# of the mean composite, and the uint8 results waiting to be written
+_MEAN_BYTES = 64
+
+
+def extract_year(filename):
+    """
+    Extracts a 4-digit year from filenames like 'rgb_SK_2021_200_1.tif'.
+    Returns the year string (e.g. '2021') or None if not found.
+    """
+    m = re.search(r'_(\d{4})(?=_|\.)', filename)
+    return m.group(1) if m else None
+
+
+def strip_year_from_basename(filename):
+    """
+    Removes exactly one "_<4-digit year>" from the base name.
+    E.g. "rgb_SK_2021_200_1.tif" -> "rgb_SK_200_1"
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r'_(?:19|20)\d{2}(?=_)', '', name, count=1)
+
+
+def group_by_tile(raster_paths):
+    """{year-less basename: [paths of every year]} for compute_mean_with_otsu_and_shapefile."""
+    groups = {}
+    for path in sorted(raster_paths):
+        groups.setdefault(strip_year_from_basename(path), []).append(path)
+    return groups
+
+
+##################
+
+def _gray(data):
+    """Grayscale (float32) of a masked (3, h, w) read, masked pixels -> 0; plus the valid mask."""
+    r, g, b = (data[i].filled(0).astype(np.float32) for i in range(3))
+    gray = GRAY_WEIGHTS[0] * r + GRAY_WEIGHTS[1] * g + GRAY_WEIGHTS[2] * b
+    return gray, ~np.ma.getmaskarray(data).any(axis=0)
+
+
+def _bytes_per_pixel(n_years, sum_dtype, count_dtype):
+    """Peak bytes per window pixel over passes 1 and 2."""
+    accumulators = 3 * np.dtype(sum_dtype).itemsize + 2 * np.dtype(count_dtype).itemsize + 8
+    return max(4 * n_years + _READ_BYTES, accumulators + _MEAN_BYTES)
+
+
+def _windows(width, height, max_memory, workers, bytes_per_pixel):
+    """
+    (full-width windows, workers) with `workers` windows in flight within max_memory.
+
+    Windows are whole BLOCK rows high when at least one fits; the number of
+    workers drops before the window height does.
+    """
+    from rasterio.windows import Window
+    row_bytes = bytes_per_pixel * width
+    rows = max_memory // (row_bytes * workers)
+    if rows >= BLOCK:
+        rows = rows // BLOCK * BLOCK
+    else:
+        fit = max_memory // (row_bytes * BLOCK)
+        workers = int(max(1, min(workers, fit)))
+        rows = BLOCK if fit else max(1, max_memory // row_bytes)
+    rows = int(rows)
+    return [Window(0, r, width, min(rows, height - r)) for r in range(0, height, rows)], workers
+
+
+def _run_windows(func, windows, workers, on_result):
+    """func(window) in a thread pool, at most `workers` windows in memory at once."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(windows), workers):
+            for fut in as_completed([pool.submit(func, w) for w in windows[i:i + workers]]):
+                on_result(*fut.result())
+
+
+def _remove_shapefile(path):
+    base = os.path.splitext(path)[0]
+    for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
+        if os.path.exists(base + ext):
+            os.remove(base + ext)
+
+
+def compute_mean_with_otsu_and_shapefile(raster_paths, output_basename, max_memory=MAX_MEMORY,
+                                         workers=None, verbose=True):
+    """
+    Given a list of aligned 3-band, 8-bit unsigned GeoTIFFs (`raster_paths`),
+    this function produces:
+      1. A 3-band "mean_with_otsu" GeoTIFF, where each pixel is the mean only
+         over those pixels that exceeded each image's Otsu threshold.
+      2. A polygon shapefile of regions where the Otsu mask (computed on the
+         "no_otsu" grayscale composite) is 255.
+
+    Outputs go into two subdirectories under the parent of `output_basename`:
+      - "rgb/": contains `{name_no_ext}_with_otsu.tif`
+      - "shp/": contains `{name_no_ext}_mask.shp`
+
+    max_memory bounds the windows in flight (bytes); workers is the number
+    of threads (default: CPU count, at most 8).
+
+    Returns:
+      (with_otsu_fp, mask_shp_fp) - full filepaths to the outputs.
+    """
+    import rasterio
+    import geopandas as gpd
+    from rasterio.features import shapes
+
+    if len(raster_paths) == 0:
+        raise ValueError("`raster_paths` is empty.")
+    raster_paths = sorted(raster_paths)
+    n = len(raster_paths)
+    workers = workers or min(8, os.cpu_count() or 1)
+
+    with rasterio.open(raster_paths[0]) as src0:
+        profile = src0.profile.copy()
+        bands, height, width = src0.count, src0.height, src0.width
+        transform, crs = src0.transform, src0.crs
+        if bands != 3 or src0.dtypes[0] != 'uint8':
+            raise RuntimeError(
+                f"Expected 3-band uint8 imagery, but first file has {bands} bands of type {src0.dtypes[0]}")
+    for fp in raster_paths[1:]:
+        with rasterio.open(fp) as src:
+            if src.count != bands or src.height != height or src.width != width:
+                raise RuntimeError(
+                    f"Raster {os.path.basename(fp)} has different dimensions/bands than the first one.")
+
+    # Smallest accumulators that cannot overflow
+    sum_dtype = np.uint16 if n * 255 <= np.iinfo(np.uint16).max else np.uint32
+    count_dtype = np.uint8 if n <= np.iinfo(np.uint8).max else np.uint16
+    windows, workers = _windows(width, height, max_memory, workers,
+                                _bytes_per_pixel(n, sum_dtype, count_dtype))
+
+    # 1) Per-year Otsu thresholds from window histograms
+    year_hist = np.zeros((n, 256), dtype=np.int64)
+
+    def hist_window(window):
+        grays = []
+        for fp in raster_paths:
+            with rasterio.open(fp) as src:
+                grays.append(_gray(src.read(window=window, masked=True))[0])
+        return (histograms(grays),)
+
+    def add_hist(h):
+        year_hist[:] += h
+    _run_windows(hist_window, windows, workers, add_hist)
+    thresholds = otsu_from_histograms(year_hist, default=0)
+    if verbose:
+        for idx, (fp, thr) in enumerate(zip(raster_paths, thresholds), start=1):
+            print(f"  [{idx}/{n}] {os.path.basename(fp)} → Otsu = {thr:.1f}")
+
+    # 2) Output paths
+    parent_dir = os.path.dirname(output_basename)
+    name_no_ext = os.path.splitext(os.path.basename(output_basename))[0]
+    rgb_dir = os.path.join(parent_dir, "rgb")
+    shp_dir = os.path.join(parent_dir, "shp")
+    os.makedirs(rgb_dir, exist_ok=True)
+    os.makedirs(shp_dir, exist_ok=True)
+    with_otsu_fp = os.path.join(rgb_dir, f"{name_no_ext}_with_otsu.tif")
+    mask_shp_fp = os.path.join(shp_dir, f"{name_no_ext}_mask.shp")
+    gray_fp = os.path.join(rgb_dir, f"{name_no_ext}_gray.tmp.tif")
+
+    profile_with_otsu = profile.copy()
+    profile_with_otsu.update({'dtype': 'uint8', 'count': 3, 'nodata': 0, 'compress': 'lzw',
+                              'tiled': True, 'blockxsize': BLOCK, 'blockysize': BLOCK})
+    profile_gray = profile_with_otsu.copy()
+    profile_gray.update({'count': 1, 'nodata': None})
+
+    # 3) Masked means, window by window
+    def mean_window(window):
+        h, w = int(window.height), int(window.width)
+        sum_with_otsu = np.zeros((3, h, w), dtype=sum_dtype)
+        count_with_otsu = np.zeros((h, w), dtype=count_dtype)
+        sum_gray = np.zeros((h, w), dtype=np.float64)
+        count_gray = np.zeros((h, w), dtype=count_dtype)
+        for fp, thr in zip(raster_paths, thresholds):
+            with rasterio.open(fp) as src:
+                data = src.read(window=window, masked=True)
+            gray, valid = _gray(data)
+            sum_gray[valid] += gray[valid]
+            count_gray += valid
+            passed = (gray > thr) & valid
+            sum_with_otsu += np.where(passed, data.data, 0).astype(sum_dtype)
+            count_with_otsu += passed
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_rgb = np.where(count_with_otsu > 0,
+                                np.round(sum_with_otsu / count_with_otsu), 0).astype(np.uint8)
+            mean_gray = np.where(count_gray > 0, np.round(sum_gray / count_gray), 0).astype(np.uint8)
+        return window, mean_rgb, mean_gray
+
+    gray_hist = np.zeros(256, dtype=np.int64)
+    with rasterio.open(with_otsu_fp, 'w', **profile_with_otsu) as dst, \
+            rasterio.open(gray_fp, 'w', **profile_gray) as gray_dst:
+        def write(window, mean_rgb, mean_gray):
+            dst.write(mean_rgb, window=window)
+            gray_dst.write(mean_gray, 1, window=window)
+            gray_hist[:] += histograms([mean_gray])[0]
+        _run_windows(mean_window, windows, workers, write)
+    if verbose:
+        print(f"→ Wrote TIFF: {os.path.relpath(with_otsu_fp, parent_dir)}")
+
+    # 4) Otsu mask on the "no_otsu" grayscale composite, polygonized from the band
+    thr_mean = otsu_from_histograms(gray_hist, default=0)
+    mask_fp = os.path.join(rgb_dir, f"{name_no_ext}_mask.tmp.tif")
+    try:
+        with rasterio.open(gray_fp) as gsrc, rasterio.open(mask_fp, 'w', **profile_gray) as mdst:
+            for window in windows:
+                gray = gsrc.read(1, window=window)
+                mdst.write(np.where(gray > thr_mean, 255, 0).astype(np.uint8), 1, window=window)
+
+        _remove_shapefile(mask_shp_fp)
+        with rasterio.open(mask_fp) as msrc:
+            band = rasterio.band(msrc, 1)
+            shapes_list = [{"geometry": geom, "properties": {"value": int(value)}}
+                           for geom, value in shapes(band, mask=band, transform=transform)
+                           if int(value) == 255]
+    finally:
+        for tmp in (gray_fp, mask_fp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    if len(shapes_list) == 0:
+        gdf = gpd.GeoDataFrame({"value": []}, geometry=[], crs=crs)
+    else:
+        gdf = gpd.GeoDataFrame.from_features(shapes_list, crs=crs)
+    gdf.to_file(mask_shp_fp, driver="ESRI Shapefile")
+    if verbose:
+        print(f"→ Wrote shapefile: {os.path.relpath(mask_shp_fp, parent_dir)}")
+
+    return with_otsu_fp, mask_shp_fp
@@ -0,0 +1,185 @@
+"""
+NumPy/SciPy port of the commented-out arcpy mask_and_apply in rgb_func.
+
+Same steps, without Spatial Analyst or in-memory ArcGIS rasters:
+1. grayscale (0.2989 R + 0.5870 G + 0.1140 B, cast to uint8)
+2. Otsu threshold (otsu.compute_otsu) -> mask, 0 is NoData
+3. FocalStatistics 5x5 MEAN + Con(>= 0.5): integer box sums. By default
+   NoData cells are ignored, as ArcGIS does, so any masked cell in the 5x5
+   keeps a pixel. Pass ignore_nodata=False to count them as 0 (majority
+   smoothing).
+4. RegionGroup (8-connected) + Lookup COUNT: scipy.ndimage.label per strip.
+   Strips are joined across their borders with a connected-components pass
+   over the label pairs, and sizes come from np.bincount.
+5. Con(size >= minSize) + ExtractByMask: RGB where kept, nodata 0 elsewhere
+
+The raster is read in row strips with a 2-row halo for the focal filter, and
+strips run in a thread pool. The strips in flight stay within `max_memory`:
+strips are whole BLOCK rows high while they fit; otherwise fewer strips run
+at once, and as a last resort a single strip gets fewer rows. There are
+three passes: histogram, component sizes, then apply and write.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage, sparse
+from scipy.sparse.csgraph import connected_components
+
+from otsu import histograms, otsu_from_histograms, N_BINS
+
+
+##################
+
+GRAY_WEIGHTS = (0.2989, 0.5870, 0.1140)
+FOCAL_SIZE = 5
+HALO = FOCAL_SIZE // 2
+MAX_MEMORY = 256 * 1024 * 1024
+BLOCK = 512
+# peak bytes per strip pixel, measured with tracemalloc (the apply pass: int32
+# labels, int64 global label lookups, the RGB read and the masked result)
+_BYTES_PER_PIXEL = 28
+_EIGHT = np.ones((3, 3), dtype=bool)
+
+
+def grayscale(rgb):
+    """uint8 grayscale of a (3, h, w) array, as in mask_and_apply."""
+    arr8 = np.clip(rgb, 0, 255).astype(np.uint8)
+    return (GRAY_WEIGHTS[0] * arr8[0] + GRAY_WEIGHTS[1] * arr8[1] +
+            GRAY_WEIGHTS[2] * arr8[2]).astype(np.uint8)
+
+
+def focal_smooth(mask, ignore_nodata=True):
+    """Con(FocalStatistics(mask, 5x5, MEAN) >= 0.5, 1) for a 0/1 mask with 0 as NoData."""
+    kernel = np.ones((FOCAL_SIZE, FOCAL_SIZE), dtype=np.uint8)
+    total = ndimage.convolve(mask.astype(np.uint8), kernel, mode='constant')
+    if ignore_nodata:
+        # mean over data cells only: every data cell is 1
+        return total > 0
+    inside = ndimage.convolve(np.ones_like(mask, dtype=np.uint8), kernel, mode='constant')
+    return 2 * total.astype(np.int32) >= inside
+
+
+##################
+
+def _strips(width, height, max_memory, workers):
+    """
+    ([(r0, r1)] row strips, workers) with `workers` strips in flight within max_memory.
+
+    Strips are whole output blocks high when at least one fits, so
+    compressed blocks are written once; the number of workers drops before
+    the strip height does.
+    """
+    row_bytes = _BYTES_PER_PIXEL * width
+    rows = max_memory // (row_bytes * workers)
+    if rows >= BLOCK:
+        rows = rows // BLOCK * BLOCK
+    else:
+        fit = max_memory // (row_bytes * BLOCK)
+        workers = int(max(1, min(workers, fit)))
+        rows = BLOCK if fit else max(1, max_memory // row_bytes)
+    rows = int(rows)
+    return [(r, min(height, r + rows)) for r in range(0, height, rows)], workers
+
+
+def _read_rows(path, r0, r1, width):
+    import rasterio
+    from rasterio.windows import Window
+    with rasterio.open(path) as src:
+        return src.read([1, 2, 3], window=Window(0, r0, width, r1 - r0))
+
+
+def _smooth_strip(path, r0, r1, width, height, thr, ignore_nodata):
+    """Smoothed mask of rows [r0, r1), computed with a HALO-row margin."""
+    h0, h1 = max(0, r0 - HALO), min(height, r1 + HALO)
+    gray = grayscale(_read_rows(path, h0, h1, width))
+    smooth = focal_smooth(gray >= thr, ignore_nodata)
+    return smooth[r0 - h0:r0 - h0 + (r1 - r0)]
+
+
+def component_sizes(strip_labels, strip_counts):
+    """
+    Merge per-strip labels into 8-connected components across strip borders.
+
+    strip_labels: [(labels of the first row, labels of the last row)] per strip.
+    strip_counts: per strip, bincount of its labels (index 0 = background).
+    Returns (offsets, size of the component of each global label).
+    """
+    offsets = np.cumsum([0] + [len(c) - 1 for c in strip_counts])
+    n = int(offsets[-1]) + 1
+    sizes = np.zeros(n, dtype=np.int64)
+    for off, counts in zip(offsets, strip_counts):
+        sizes[off + 1:off + len(counts)] = counts[1:]
+
+    rows, cols = [], []
+    for k in range(len(strip_labels) - 1):
+        bottom = strip_labels[k][1]
+        top = strip_labels[k + 1][0]
+        for shift in (-1, 0, 1):
+            a = bottom[max(0, -shift):len(bottom) - max(0, shift)]
+            b = top[max(0, shift):len(top) - max(0, -shift)]
+            both = (a > 0) & (b > 0)
+            rows.append(a[both] + offsets[k])
+            cols.append(b[both] + offsets[k + 1])
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    graph = sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    _, root = connected_components(graph, directed=False)
+    comp_size = np.bincount(root, weights=sizes).astype(np.int64)
+    return offsets, comp_size[root]
+
+
+def mask_and_apply(rgb_path, out_dir, minSize, max_memory=MAX_MEMORY, workers=None,
+                   ignore_nodata=True, verbose=True):
+    """
+    Create a continuous-patch mask from RGB and apply it to the RGB.
+
+    Writes `<out_dir>/<base>_masked.tif` (nodata 0 outside patches of at
+    least minSize pixels) and returns its path.
+    """
+    import rasterio
+
+    workers = workers or min(8, os.cpu_count() or 1)
+    with rasterio.open(rgb_path) as src:
+        width, height = src.width, src.height
+        profile = src.profile.copy()
+    strips, workers = _strips(width, height, max_memory, workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 1-2) Grayscale -> Otsu threshold (histogram summed over strips)
+        hist = sum(pool.map(lambda s: histograms([grayscale(_read_rows(rgb_path, *s, width))],
+                                                 (0, 256), ignore_nonpositive=False)[0], strips))
+        thr = otsu_from_histograms(hist, np.arange(N_BINS) + 0.5)
+        if verbose:
+            print(f"{os.path.basename(rgb_path)} → Otsu = {thr:.1f}")
+
+        # 3-4) Smooth, label each strip, keep border rows and label counts
+        def label_strip(s):
+            labels, _ = ndimage.label(_smooth_strip(rgb_path, *s, width, height, thr, ignore_nodata),
+                                      structure=_EIGHT)
+            return (labels[0].copy(), labels[-1].copy()), np.bincount(labels.ravel())
+        labelled = list(pool.map(label_strip, strips))
+        offsets, sizes = component_sizes([l for l, _ in labelled], [c for _, c in labelled])
+
+        # 5-6) Keep components >= minSize, apply to the RGB, write strip by strip
+        base = os.path.splitext(os.path.basename(rgb_path))[0]
+        out_tif = os.path.join(out_dir, f"{base}_masked.tif")
+        os.makedirs(out_dir, exist_ok=True)
+        profile.update(count=3, nodata=0, compress='lzw', tiled=True, blockxsize=BLOCK, blockysize=BLOCK)
+
+        def apply_strip(args):
+            k, (r0, r1) = args
+            labels, _ = ndimage.label(_smooth_strip(rgb_path, r0, r1, width, height, thr, ignore_nodata),
+                                      structure=_EIGHT)
+            keep = (labels > 0) & (sizes[np.where(labels > 0, labels + offsets[k], 0)] >= minSize)
+            rgb = _read_rows(rgb_path, r0, r1, width)
+            return r0, r1, np.where(keep, rgb, 0).astype(profile['dtype'])
+
+        from rasterio.windows import Window
+        with rasterio.open(out_tif, 'w', **profile) as dst:
+            for i in range(0, len(strips), workers):
+                for r0, r1, data in pool.map(apply_strip, list(enumerate(strips))[i:i + workers]):
+                    dst.write(data, [1, 2, 3], window=Window(0, r0, width, r1 - r0))
+    if verbose:
+        print(f"  → Saved: {out_tif}")
+    return out_tif
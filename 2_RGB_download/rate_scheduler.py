@@ -0,0 +1,231 @@
+"""
+Adaptive rate-limited scheduler for Earth Engine download jobs.
+
+Replaces the fixed time.sleep() pauses between jobs. Jobs are started through
+a token bucket (request rate) and a cap on jobs in flight (concurrency). Both
+limits follow an AIMD rule: they grow slowly while requests succeed and are
+cut in half, with a cool-down, only when Earth Engine answers with a quota
+or 429-style error. Jobs that hit the same throttle together cut the limits
+once: at most one decrease per cool-down window. Throttled jobs are put back
+in the queue.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+
+##################
+
+# Text Earth Engine / HTTP layers put in quota and throttling errors
+THROTTLE_MARKERS = ('429', 'too many requests', 'too many concurrent', 'quota',
+                    'rate limit', 'resource exhausted', 'resource_exhausted')
+
+
+def is_throttle_error(exc):
+    """Return True if `exc` looks like an EE quota or HTTP 429 error."""
+    status = getattr(exc, 'status_code', None) or getattr(getattr(exc, 'resp', None), 'status', None)
+    if status == 429:
+        return True
+    msg = str(exc).lower()
+    return any(m in msg for m in THROTTLE_MARKERS)
+
+
+##################
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Parameters:
+    - rate: tokens added per second.
+    - capacity: largest burst allowed (default: max(1, rate)).
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def try_acquire(self, n=1):
+        """Take `n` tokens if available; never blocks."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= n:
+                self.tokens -= n
+                return True
+            return False
+
+    def wait_time(self, n=1):
+        """Seconds until `n` tokens are available."""
+        with self.lock:
+            self._refill()
+            missing = n - self.tokens
+            return 0.0 if missing <= 0 else missing / self.rate
+
+    def acquire(self, n=1):
+        """Block until `n` tokens are taken."""
+        while not self.try_acquire(n):
+            time.sleep(min(1.0, max(0.01, self.wait_time(n))))
+
+
+##################
+
+class AdaptiveScheduler:
+    """
+    AIMD controller for job rate and concurrency.
+
+    Parameters:
+    - rate: starting job rate (jobs per second).
+    - max_concurrency: upper bound on jobs in flight (e.g. cpus_).
+    - min_rate, max_rate: bounds for the adaptive rate.
+    - increase: rate added (jobs/s) after each successful job.
+    - decrease: factor applied to rate and concurrency on a throttle error,
+      at most once per `cooldown` seconds; later throttles in that window
+      are counted and retried only.
+    - cooldown: seconds to pause new jobs after a decrease; doubles for
+      consecutive decreases up to `max_cooldown`.
+    - max_retries: throttled attempts allowed per job before giving up.
+    """
+    def __init__(self, rate=0.5, max_concurrency=7, min_rate=0.01, max_rate=5.0,
+                 increase=0.05, decrease=0.5, cooldown=10.0, max_cooldown=300.0,
+                 max_retries=8):
+        self.bucket = TokenBucket(rate, capacity=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.last_decrease = None
+        self.throttle_streak = 0
+        self.success_streak = 0
+        self.done = self.failed = self.throttled = 0
+        self.started = None
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def can_start(self, in_flight):
+        """True if a new job may start now (consumes a token)."""
+        if self.started is None:
+            self.started = time.monotonic()
+        if time.monotonic() < self.paused_until or in_flight >= self.concurrency:
+            return False
+        return self.bucket.try_acquire()
+
+    def on_success(self):
+        with self.lock:
+            self.done += 1
+            self.throttle_streak = 0
+            self.success_streak += 1
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.increase))
+            # one more slot after a full round of successes at the current limit
+            if self.success_streak >= self.concurrency and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self.success_streak = 0
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttled += 1
+            self.success_streak = 0
+            now = time.monotonic()
+            if self.last_decrease is not None and now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease))
+            self.concurrency = max(1, int(self.concurrency * self.decrease))
+            pause = min(self.max_cooldown, self.cooldown * 2 ** self.throttle_streak)
+            self.throttle_streak += 1
+            self.paused_until = max(self.paused_until, now + pause)
+
+    def on_failure(self):
+        with self.lock:
+            self.failed += 1
+
+    def elapsed(self):
+        return 0.0 if self.started is None else time.monotonic() - self.started
+
+    def tiles_per_hour(self):
+        """Measured throughput of completed jobs (one job = one tile)."""
+        elapsed = self.elapsed()
+        return self.done * 3600.0 / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        return {'done': self.done, 'failed': self.failed, 'throttled': self.throttled,
+                'elapsed_s': round(self.elapsed(), 1),
+                'tiles_per_hour': round(self.tiles_per_hour(), 1),
+                'rate_per_s': round(self.rate, 3), 'concurrency': self.concurrency}
+
+    def print_report(self):
+        r = self.report()
+        print(f"Done: {r['done']}, failed: {r['failed']}, throttled: {r['throttled']} | "
+              f"{r['tiles_per_hour']} tiles/h over {r['elapsed_s']} s | "
+              f"rate {r['rate_per_s']}/s, concurrency {r['concurrency']}")
+
+    def run(self, func, argument_list, executor=None, poll=0.2):
+        """
+        Run func over argument_list (tuples are unpacked) under the limits.
+
+        `executor` is any concurrent.futures executor; a thread pool of
+        max_concurrency workers is used when None. Returns results in input
+        order; failed jobs give None.
+        """
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+        pending = deque((i, arg, 0) for i, arg in enumerate(argument_list))
+        results = [None] * len(pending)
+        in_flight = {}
+        bar = tqdm(total=len(pending))
+        try:
+            while pending or in_flight:
+                while pending and self.can_start(len(in_flight)):
+                    i, arg, attempt = pending.popleft()
+                    args = arg if isinstance(arg, tuple) else (arg,)
+                    in_flight[executor.submit(func, *args)] = (i, arg, attempt)
+
+                if not in_flight:
+                    time.sleep(poll)
+                    continue
+                finished, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    i, arg, attempt = in_flight.pop(fut)
+                    exc = fut.exception()
+                    if exc is None:
+                        results[i] = fut.result()
+                        self.on_success()
+                        bar.update(1)
+                    elif is_throttle_error(exc) and attempt < self.max_retries:
+                        self.on_throttle()
+                        pending.appendleft((i, arg, attempt + 1))
+                    else:
+                        print(f"Job {i} failed: {exc}")
+                        self.on_failure()
+                        bar.update(1)
+                bar.set_postfix(tiles_h=round(self.tiles_per_hour(), 1), rate=round(self.rate, 2),
+                                conc=self.concurrency)
+        finally:
+            bar.close()
+            if own_executor:
+                executor.shutdown(wait=True)
+        return results
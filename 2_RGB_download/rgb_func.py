@@ -1,20 +1,17 @@
 import time
+import threading
 from pathlib import Path
+from collections import OrderedDict
 import os, glob, ee, time
-from tqdm import tqdm
-from multiprocessing import Pool
+from concurrent.futures import ProcessPoolExecutor
 import ee
-
-
-##################
-
-# combine s2 and cloudless s2 collection
-# s2 cloud cover filter parameters
-CLOUD_FILTER = 5#20
-CLD_PRB_THRESH = 5
-NIR_DRK_THRESH = 0.15
-CLD_PRJ_DIST = 1
-BUFFER = 1
+from rate_scheduler import AdaptiveScheduler
+from download_manifest import open_manifest, track_job, rgb_key, mask_key, province_from_dir
+from tile_download import download_tile_mosaic, tile_bounds
+from async_download import endpoint_slot
+from bands import CLOUD_FILTER, CLD_PRB_THRESH, NIR_DRK_THRESH, CLD_PRJ_DIST, BUFFER, RGB_BANDS
+from cog_writer import finalize_pieces, RESAMPLING
+from worker_session import ensure_session, init_worker, TimedJob, print_session_report
 
 
 ##################
@@ -144,6 +141,117 @@ def bufferAndSetVal(feature):
 
 ##################
 
+# Memoized ee graphs, keyed by (province, tile, product); tile is None for
+# province-level objects. Reusing the same object saves building and
+# serializing the graph client side. It does not change server work: Earth
+# Engine deduplicates graphs by value, so a rebuilt identical graph is served
+# from its cache too.
+GRAPH_CACHE_SIZE = 512
+_GRAPH_CACHE = OrderedDict()
+_GRAPH_LOCK = threading.Lock()
+
+
+def cached_graph(key, build):
+    """Return the ee object cached under `key`, calling build() on a miss."""
+    with _GRAPH_LOCK:
+        if key in _GRAPH_CACHE:
+            _GRAPH_CACHE.move_to_end(key)
+            return _GRAPH_CACHE[key]
+    obj = build()
+    with _GRAPH_LOCK:
+        _GRAPH_CACHE[key] = obj
+        while len(_GRAPH_CACHE) > GRAPH_CACHE_SIZE:
+            _GRAPH_CACHE.popitem(last=False)
+    return obj
+
+
+def clear_graph_cache():
+    with _GRAPH_LOCK:
+        _GRAPH_CACHE.clear()
+
+
+# Asset listings: paged, and optionally cached on disk for ASSET_LIST_TTL seconds
+ASSET_PAGE_SIZE = 1000
+ASSET_CACHE_DIR = None
+ASSET_LIST_TTL = 24 * 3600
+
+
+def iter_asset_names(asset_path, page_size=ASSET_PAGE_SIZE):
+    """Yield asset names under asset_path one listAssets page at a time."""
+    token = None
+    while True:
+        params = {'parent': asset_path, 'pageSize': page_size}
+        if token:
+            params['pageToken'] = token
+        with endpoint_slot('listAssets'):
+            page = ee.data.listAssets(params)
+        for asset in page.get('assets', []):
+            yield asset['name']
+        token = page.get('nextPageToken')
+        if not token:
+            return
+
+
+def list_asset_names(asset_path, cache_dir=None, ttl=None):
+    """
+    Asset names under asset_path, from the disk cache if younger than `ttl`.
+
+    cache_dir / ttl default to ASSET_CACHE_DIR / ASSET_LIST_TTL; no cache dir
+    means a fresh (paged) listing.
+    """
+    import json
+    cache_dir = ASSET_CACHE_DIR if cache_dir is None else cache_dir
+    ttl = ASSET_LIST_TTL if ttl is None else ttl
+    if not cache_dir:
+        return list(iter_asset_names(asset_path))
+
+    cache_file = os.path.join(str(cache_dir), asset_path.replace('/', '__') + '.json')
+    if os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < ttl:
+        with open(cache_file) as f:
+            return json.load(f)
+    names = list(iter_asset_names(asset_path))
+    os.makedirs(str(cache_dir), exist_ok=True)
+    tmp = cache_file + '.part'
+    with open(tmp, 'w') as f:
+        json.dump(names, f)
+    os.replace(tmp, cache_file)
+    return names
+
+
+def get_asset_mosaic(asset_path):
+    """First band of the mosaic of every image under asset_path, built once per process."""
+    def build():
+        list_img = [ee.Image(name) for name in list_asset_names(asset_path)]
+        return ee.ImageCollection.fromImages(list_img).mosaic().select([0])
+    return cached_graph((None, asset_path, 'asset_mosaic'), build)
+
+
+def build_road_mask(asset_path, selectProv):
+    """Province road mask: 0 on 5 m road buffers, 1 elsewhere."""
+    road_skshp = ee.FeatureCollection(asset_path).filterBounds(selectProv)
+    mask = ee.Image.constant(1).clip(selectProv)
+    roadSK = road_skshp.map(bufferAndSetVal)
+    roadImg = reduceToImage(roadSK)
+    return mask.multiply(roadImg.add(0.3)).mask(0.1).Not().clip(selectProv)
+
+
+def get_road_mask(provName, asset_path, selectProv):
+    """Road mask built once per province and process."""
+    return cached_graph((provName, None, 'road_mask'),
+                        lambda: build_road_mask(asset_path, selectProv))
+
+
+def get_tile_cropland_mask(provName, local_idx, tile_shp, roadMask):
+    """Tile geometry and processCroplandMask, built once per tile and reused for every year."""
+    geo = cached_graph((provName, str(local_idx), 'geometry'),
+                       lambda: ee.Feature(tile_shp).geometry())
+    mask = cached_graph((provName, str(local_idx), 'cropland_mask'),
+                        lambda: processCroplandMask(geo, roadMask))
+    return geo, mask
+
+
+##################
+
 def get_aafc_crop_mask(roi):
     """
     Generates a smoothed AAFC crop mask from the AAFC Crop Inventory.
@@ -189,12 +297,14 @@ def get_aafc_crop_mask(roi):
 
 # Define the combined function
 def processCroplandMask(roi,roadMask):
-    # Index calculation function
+    # Index calculation function: NDVI, spring-only NDVI (Apr-Jun, masked
+    # otherwise) and NDWI, so one reduce over the collection gives all three
     def index(img):
+        month = ee.Date(img.get('system:time_start')).get('month')
         ndvi = img.normalizedDifference(['B8', 'B4']).rename('ndvi')
+        ndvi_spring = ndvi.updateMask(ee.Image(month.lte(6))).rename('ndvi_spring')
         ndwi = img.normalizedDifference(['B8', 'B11']).rename('ndwi')
-        return img.addBands(ndvi).addBands(ndwi) \
-            .copyProperties(img, ['system:time_start'])
+        return ndvi.addBands(ndvi_spring).addBands(ndwi)
     
     # Cropland filter function
     def croplandFilter(img):
@@ -206,19 +316,20 @@ def processCroplandMask(roi,roadMask):
         imgFiltered = filter.updateMask(pixelCount.gte(minPixelCount)).unmask()
         return imgFiltered
     
-    # S2 collection
+    # S2 collection (Apr-Sep only)
     s2 = ee.ImageCollection("COPERNICUS/S2") \
         .filterBounds(roi) \
         .filterDate('2022-04-01', '2023-10-15') \
         .filter(ee.Filter.lte('CLOUDY_PIXEL_PERCENTAGE', 5)) \
-        .filter(ee.Filter.calendarRange(4, 9, 'month')) \
-        .map(lambda img: img.clip(roi))
+        .filter(ee.Filter.calendarRange(4, 9, 'month'))
     
-    # Extract indices
-    NDVImax = s2.map(index).filter(ee.Filter.calendarRange(4, 9, 'month')).select('ndvi').max()
-    NDVImedian = s2.map(index).filter(ee.Filter.calendarRange(4, 6, 'month')).select('ndvi').median()
-    NDVIdiff = NDVImax.subtract(NDVImedian)
-    NDWImin = s2.map(index).select('ndwi').min()
+    # Extract indices in one pass: max(ndvi), median(ndvi_spring), min(ndwi)
+    reducer = ee.Reducer.max() \
+        .combine(reducer2=ee.Reducer.median(), sharedInputs=False) \
+        .combine(reducer2=ee.Reducer.min(), sharedInputs=False)
+    indices = s2.map(index).reduce(reducer).rename(['NDVImax', 'NDVImedian', 'NDWImin']).clip(roi)
+    NDVIdiff = indices.select('NDVImax').subtract(indices.select('NDVImedian'))
+    NDWImin = indices.select('NDWImin')
     
     # Non-crop index calculation
     nonCrop= NDVIdiff.subtract(NDWImin)
@@ -248,10 +359,15 @@ def get_s2(roi, year, mask,
         filter = ee.Filter.equals(leftField='system:index', rightField='system:index')
         return ee.ImageCollection(join.apply(s2_col, cs_col, filter))
 
-    # Define cloud masking function
+    # Define cloud masking function; also masks each band outside its season
+    # (B4 Aug-Oct, B3 Jun-Aug, B2 Apr-Jul) so one median gives all three bands
     def apply_cloud_mask(image):
         cs_img = ee.Image(image.get('csplus')).select(qa_band)
-        return image.updateMask(cs_img.gte(clear_threshold))
+        month = ee.Date(image.get('system:time_start')).get('month')
+        season = ee.Image.cat([ee.Image(month.gte(lo).And(month.lte(hi)))
+                               for _, (lo, hi), _ in RGB_BANDS])
+        return image.select([b for b, _, _ in RGB_BANDS]) \
+            .updateMask(cs_img.gte(clear_threshold)).updateMask(season)
 
     # Filter collections
     s2_filtered = s2.filterBounds(roi).filterDate(f'{year}-04-01', f'{year}-10-01')
@@ -261,20 +377,13 @@ def get_s2(roi, year, mask,
     joined = join_cloudscore(s2_filtered, cs_filtered)
     collection = joined.map(apply_cloud_mask)
 
-    # Extract and scale RGB bands
-    B4 = (collection.filter(ee.Filter.calendarRange(8, 10, 'month'))
-          .select('B4').median().unitScale(100, 3000).multiply(255).toByte().unmask(1).rename('B4'))
-    
-
-    B3 = (collection.filter(ee.Filter.calendarRange(6, 8, 'month'))
-          .select('B3').median().unitScale(200, 2300).multiply(255).toByte().unmask(1).rename('B3'))
-
-    B2 = (collection.filter(ee.Filter.calendarRange(4, 7, 'month'))
-          .select('B2').median().unitScale(150, 1350).multiply(255).toByte().unmask(1).rename('B2'))
-
+    # Per-band median in one pass, then per-band unitScale to bytes
+    low = ee.Image.constant([lo for _, _, (lo, hi) in RGB_BANDS])
+    span = ee.Image.constant([hi - lo for _, _, (lo, hi) in RGB_BANDS])
+    rgb = (collection.median().subtract(low).divide(span)
+           .multiply(255).toByte().unmask(1).rename([b for b, _, _ in RGB_BANDS]))
 
     # Combine and mask
-    rgb = B4.addBands(B3).addBands(B2)
     rgb_3m = rgb.multiply(mask).toByte().unmask(1).clip(roi)
 
     return rgb_3m
@@ -282,28 +391,51 @@ def get_s2(roi, year, mask,
 
 ##################
 
-def parallelize_download(func, argument_list, num_processes):
- 
-    pool = Pool(processes=num_processes)
- 
-    jobs = [pool.apply_async(func=func, args=(*argument,)) 
-            if isinstance(argument, tuple) 
-            else pool.apply_async(func=func, args=(argument,)) 
-            for argument in argument_list]
-    pool.close()
-    result_list_tqdm = []
-    for job in tqdm(jobs):
-        result_list_tqdm.append(job.get())
-        # Add a wait of 1 second
-        time.sleep(180)
- 
-    return result_list_tqdm
+def get_s2_stack(roi, yrList, mask):
+    """
+    get_s2 composites for all years in one multi-band image.
+
+    Bands are ordered per year: B4_<yr>, B3_<yr>, B2_<yr>, ... so the stack
+    can be split back into the usual 3-band files with split_rgb_stack.
+    """
+    years = [get_s2(roi, yr, mask).rename([f'B4_{yr}', f'B3_{yr}', f'B2_{yr}']) for yr in yrList]
+    return ee.Image.cat(years)
+
+
+##################
+
+def parallelize_download(func, argument_list, num_processes, scheduler=None, project=None,
+                         warmup=None, warmup_args=()):
+    """
+    Run download jobs in a process pool under an AdaptiveScheduler.
+
+    The scheduler paces job starts with a token bucket and backs off only
+    when Earth Engine reports quota / 429 errors (no fixed sleeps). Pass a
+    configured scheduler to tune the starting rate; its report (tiles/h)
+    is printed at the end.
+
+    Each worker process initializes Earth Engine once (worker_session) and
+    runs warmup(*warmup_args) before its first job, e.g.
+    warmup=get_road_mask, warmup_args=(provName, asset_path, selectProv).
+    Startup and per-job times are reported separately.
+    """
+    if scheduler is None:
+        scheduler = AdaptiveScheduler(max_concurrency=num_processes)
+
+    with ProcessPoolExecutor(max_workers=num_processes, initializer=init_worker,
+                             initargs=(project, warmup, warmup_args)) as pool:
+        timed = scheduler.run(TimedJob(func), argument_list, executor=pool)
+
+    result_list = [None if t is None else t[0] for t in timed]
+    scheduler.print_report()
+    print_session_report([t[1] for t in timed if t is not None])
+    return result_list
 
 
 def get_raster_from_asset(download_outpath, grid_id, crop_mask, grid_shp):
         
     import ee, os
-    ee.Initialize()
+    ensure_session()
     import geemap.geemap as geemap
     from pathlib import Path
     
@@ -323,169 +455,208 @@ def get_raster_from_asset(download_outpath, grid_id, crop_mask, grid_shp):
 
 
 
-def get_crp_mask_from_asset(download_dir, tile_id, asset_path, tile):
+def get_crp_mask_from_asset(download_dir, tile_id, asset_path, tile, manifest=None, mosaic=False,
+                            cog=False):
     
     import ee, os
-    ee.Initialize()
+    ensure_session()
     import geemap.geemap as geemap
     from pathlib import Path
     
     # Set output file names
-    output_tif = str(download_dir) + '/crop_mask_' + str(tile_id) + '_1.tif'
+    prefix = 'crop_mask_' + str(tile_id) + '_'
+    output_tif = str(download_dir) + '/' + prefix + '1.tif'
+
+    # With a manifest (db path), resume from its recorded state instead of the file check
+    manifest = open_manifest(manifest)
+    key = mask_key(province_from_dir(download_dir), tile_id)
+    done = manifest.is_done(key) if manifest else os.path.exists(output_tif)
     
     # if output csv file exist, skip
-    if os.path.exists(output_tif):
+    if done:
         
         print("Crop mask exists for file ",
               str(Path(output_tif).stem), ", skipping now ...")
         
     else:
-        
-        # List assets and extract their names
-        asset_list = ee.data.listAssets(asset_path)['assets']
-        asset_names = list(map(lambda d: d['name'], asset_list))
-        
-        # Create a list of images from asset names
-        list_img = list(map(lambda f: ee.Image(f), asset_names))
-        
-        # Create an image collection from the list of images and mosaic them
-        crop_mask_raster = ee.ImageCollection.fromImages(list_img).mosaic().select([0])
-        crop_mask_raster = crop_mask_raster.clip(tile)
-        crop_mask_raster = crop_mask_raster.rename('crop_mask')
-
-        geemap.download_ee_image_tiles(
-            crop_mask_raster, ee.FeatureCollection(ee.Feature(tile)),
-            str(download_dir), prefix = 'crop_mask_' +  str(tile_id) + '_',
-            crs = "EPSG:4326", scale = 10)
+        with track_job(manifest, key, download_dir, prefix):
+            # ee.Feature or client-side GeoJSON feature (grid_catalog)
+            tile = ee.Feature(tile)
+
+            # Mosaic of the mask assets (listed and built once per process)
+            crop_mask_raster = get_asset_mosaic(asset_path)
+            crop_mask_raster = crop_mask_raster.clip(tile)
+            crop_mask_raster = crop_mask_raster.rename('crop_mask')
+
+            if mosaic:
+                # one GeoTIFF per tile, sub-tiled and fetched in parallel
+                download_tile_mosaic(crop_mask_raster.toFloat(), tile_bounds(tile), output_tif,
+                                     ['crop_mask'], dtype='float32', scale=10)
+            else:
+                geemap.download_ee_image_tiles(
+                    crop_mask_raster, ee.FeatureCollection(ee.Feature(tile)),
+                    str(download_dir), prefix = prefix,
+                    crs = "EPSG:4326", scale = 10)
+
+            if cog:
+                # rewrite the pieces as COGs before the manifest hashes them
+                finalize_pieces(download_dir, prefix, resampling=RESAMPLING['crop_mask'])
 
 # ########################### Download Crop Mask RGB
 
 
-def get_crp_rgb_from_asset(yrList, download_dir, provName, local_idx, asset_path, selectProv, tile_shp):
+def get_crp_rgb_from_asset(yrList, download_dir, provName, local_idx, asset_path, selectProv, tile_shp,
+                           manifest=None, mosaic=False, cog=False):
     
+    import ee, os
+    ensure_session()
+    import geemap.geemap as geemap
+    from pathlib import Path
+
     for yr in yrList:
 
-        import ee, os
-        ee.Initialize()
-        import geemap.geemap as geemap
-        from pathlib import Path
-        
         # Set output file names
-        output_tif = str(download_dir) + '/rgb_' + provName + '_' + str(yr) + '_' + str(local_idx) + '_1.tif'
+        prefix = 'rgb_' + provName + '_' + str(yr) + '_' + str(local_idx) + '_'
+        output_tif = str(download_dir) + '/' + prefix + '1.tif'
+
+        # With a manifest (db path), resume from its recorded state instead of the file check
+        manifest = open_manifest(manifest)
+        key = rgb_key(provName, local_idx, yr)
+        done = manifest.is_done(key) if manifest else os.path.exists(output_tif)
         
         # if output csv file exist, skip
-        if os.path.exists(output_tif):
+        if done:
             
             print("Crop RGB exists for file ",
                   str(Path(output_tif).stem), ", skipping now ...")
             
         else:
+            with track_job(manifest, key, download_dir, prefix):
+                # Road mask (once per province)
+                roadMask = get_road_mask(provName, asset_path, selectProv)
+
+                # MASK from NDVI and ESA (year independent: once per tile)
+                geo, mask = get_tile_cropland_mask(provName, local_idx, tile_shp, roadMask)# using crop and road
+                rgb_3m = get_s2(geo, yr, mask)
+
+                if mosaic:
+                    # one GeoTIFF per tile-year, sub-tiled and fetched in parallel
+                    download_tile_mosaic(rgb_3m, tile_bounds(tile_shp), output_tif,
+                                         [b for b, _, _ in RGB_BANDS], dtype='uint8', scale=10)
+                else:
+                    geemap.download_ee_image_tiles(
+                        rgb_3m, ee.FeatureCollection(ee.Feature(tile_shp)), str(download_dir),
+                        prefix = prefix,
+                        crs = "EPSG:4326", scale = 10)
+
+                if cog:
+                    # rewrite the pieces as COGs before the manifest hashes them
+                    finalize_pieces(download_dir, prefix, resampling=RESAMPLING['rgb'])
+
+
+def split_rgb_stack(stack_path, yrList, download_dir, provName, local_idx, keep_stack=False):
+    """
+    Split one downloaded multi-year stack piece into rgb_{prov}_{yr}_{idx}_{N}.tif files.
 
-            # Road mask
-            road_skshp = ee.FeatureCollection(asset_path).filterBounds(selectProv)
-            mask = ee.Image.constant(1).clip(selectProv)
-            roadSK = road_skshp.map(bufferAndSetVal)
-            roadImg = reduceToImage(roadSK)
-            roadMask = mask.multiply(roadImg.add(0.3)).mask(0.1).Not().clip(selectProv)
-
-            # Filter for required year
-            start_date =  str(yr) +'-05-15'
-            end_date = str(yr)+'-10-15'
-            year = str(yr)
-
-            geo = ee.Feature(tile_shp).geometry()
-
-            # MASK from NDVI and ESA
-            mask = processCroplandMask(geo, roadMask)# using crop and road
-            rgb_3m = get_s2(geo, yr, mask)
-
-            geemap.download_ee_image_tiles(
-                rgb_3m, ee.FeatureCollection(ee.Feature(tile_shp)), str(download_dir),
-                prefix = 'rgb_' + provName + '_' + str(yr) + '_' + str(local_idx) + '_',
-                crs = "EPSG:4326", scale = 10)
-            time.sleep(100)
-
-
-
-# def compute_otsu(gray_arr):
-#     """Return Otsu threshold for 8-bit grayscale numpy array."""
-#     hist, bins = np.histogram(gray_arr.flatten(), bins=256, range=(0,256))
-#     centers    = (bins[:-1] + bins[1:]) / 2
-#     total      = hist.sum()
-#     sum_total  = (centers * hist).sum()
-#     weight_b = sum_b = max_bt = 0.0
-#     thresh   = centers[0]
-    
-#     for i in range(256):
-#         weight_b += hist[i]
-#         if weight_b == 0:
-#             continue
-#         weight_f = total - weight_b
-#         if weight_f == 0:
-#             break
-#         sum_b += centers[i] * hist[i]
-#         m_b   = sum_b / weight_b
-#         m_f   = (sum_total - sum_b) / weight_f
-#         bt    = weight_b * weight_f * (m_b - m_f)**2
-#         if bt > max_bt:
-#             max_bt, thresh = bt, centers[i]
-#     return thresh
-
-
-# def mask_and_apply(rgb_path, out_dir, minSize):
-#     """Create a continuous‐patch mask from RGB and apply it to the RGB."""
-#     # 1) Load RGB
-#     ras     = arcpy.Raster(rgb_path)
-#     arr     = arcpy.RasterToNumPyArray(ras)
-#     arr8    = np.clip(arr, 0, 255).astype(np.uint8)
-#     gray    = (0.2989*arr8[0] + 0.5870*arr8[1] + 0.1140*arr8[2]).astype(np.uint8)
-    
-#     # 2) Otsu threshold → binary mask
-#     thr     = compute_otsu(gray)
-#     print(f"{os.path.basename(rgb_path)} → Otsu = {thr:.1f}")
-#     mask1   = (gray >= thr).astype(np.uint8)
-    
-#     # 3) Grayscale → Raster
-#     ll      = arcpy.Point(ras.extent.XMin, ras.extent.YMin)
-#     cs      = ras.meanCellWidth
-#     mask_r  = arcpy.NumPyArrayToRaster(mask1, ll, cs, cs, value_to_nodata=0)
-    
-#     # 4) Smooth (5×5 mean) + re-threshold → clean mask
-#     mean5   = FocalStatistics(mask_r, NbrRectangle(5,5,"CELL"), "MEAN")
-#     smooth  = Con(mean5 >= 0.5, 1)  # false → NoData
-    
-#     # 5) RegionGroup + Lookup → size raster
-#     rg      = RegionGroup(smooth, "EIGHT", "WITHIN", "ADD_LINK", "0")
-#     sizes   = Lookup(rg, "COUNT")
-    
-#     # 6) Continuous mask only (>= minSize pixels)
-#     cont_m  = Con(sizes >= minSize, 1)
-    
-#     # 7) Apply mask to original RGB
-#     masked  = ExtractByMask(rgb_path, cont_m)
-    
-#     # 8) Save result
-#     base    = os.path.splitext(os.path.basename(rgb_path))[0]
-#     out_tif = os.path.join(out_dir, f"{base}_masked.tif")
-#     masked.save(out_tif)
-#     print(f"  → Saved: {out_tif}")
-    
-#     # 9) Clean up in_memory
-#     for obj in (mask_r, mean5, smooth, rg, sizes, cont_m):
-#         try:
-#             arcpy.Delete_management(obj)
-#         except:
-#             pass
+    `stack_path` is a piece written by download_ee_image_tiles with prefix
+    'rgb_{prov}_stack_{idx}_' (N is taken from its name). Copies block by
+    block, so the stack is never fully loaded into memory.
+    """
+    import rasterio
+
+    stack_prefix = 'rgb_' + provName + '_stack_' + str(local_idx) + '_'
+    piece = Path(stack_path).stem[len(stack_prefix):]
+    written = []
+    with rasterio.open(stack_path) as src:
+        if src.count != 3 * len(yrList):
+            raise RuntimeError(f"{stack_path} has {src.count} bands, expected {3 * len(yrList)}")
+        profile = src.profile.copy()
+        profile.update(count=3)
+        for i, yr in enumerate(yrList):
+            out_tif = os.path.join(str(download_dir), f'rgb_{provName}_{yr}_{local_idx}_{piece}.tif')
+            bands = [3 * i + 1, 3 * i + 2, 3 * i + 3]
+            with rasterio.open(out_tif, 'w', **profile) as dst:
+                for _, window in src.block_windows(1):
+                    dst.write(src.read(bands, window=window), window=window)
+                dst.descriptions = ('B4', 'B3', 'B2')
+            written.append(out_tif)
+    if not keep_stack:
+        os.remove(stack_path)
+    return written
+
+
+def get_crp_rgb_stack_from_asset(yrList, download_dir, provName, local_idx, asset_path, selectProv,
+                                 tile_shp, manifest=None, split=True, cog=False):
+    """
+    Same job as get_crp_rgb_from_asset, but all missing years in one request.
+
+    The get_s2 composites of the missing years are stacked into one image
+    and downloaded once per tile. With split=True (default) the stack is
+    split locally into the usual rgb_{prov}_{year}_{idx}_N.tif files, so
+    segmentation and postprocessing read the same inputs as before. With
+    split=False the multi-band rgb_{prov}_stack_{idx}_N.tif files are kept.
+    With cog=True the outputs are rewritten as Cloud-Optimized GeoTIFFs.
+    """
+    import ee, os
+    ensure_session()
+    import geemap.geemap as geemap
 
+    manifest = open_manifest(manifest)
 
+    prefix = 'rgb_' + provName + '_stack_' + str(local_idx) + '_'
+    stack_exists = not split and os.path.exists(os.path.join(str(download_dir), prefix + '1.tif'))
 
+    # Years still to download
+    years = []
+    for yr in yrList:
+        key = rgb_key(provName, local_idx, yr)
+        output_tif = str(download_dir) + '/rgb_' + provName + '_' + str(yr) + '_' + str(local_idx) + '_1.tif'
+        if manifest.is_done(key) if manifest else (stack_exists or os.path.exists(output_tif)):
+            print("Crop RGB exists for file ", Path(output_tif).stem, ", skipping now ...")
+        else:
+            years.append(yr)
+    if not years:
+        return
+
+    keys = [rgb_key(provName, local_idx, yr) for yr in years]
+    for stale in glob.glob(os.path.join(str(download_dir), glob.escape(prefix) + '*.tif')):
+        os.remove(stale)
+    if manifest:
+        # split: each year owns its own pieces; no split: all years share the stack pieces
+        for yr, key in zip(years, keys):
+            year_prefix = 'rgb_' + provName + '_' + str(yr) + '_' + str(local_idx) + '_'
+            manifest.start(key, download_dir, year_prefix if split else prefix)
+
+    try:
+        roadMask = get_road_mask(provName, asset_path, selectProv)
+        geo, mask = get_tile_cropland_mask(provName, local_idx, tile_shp, roadMask)
+        stack = get_s2_stack(geo, years, mask)
 
+        geemap.download_ee_image_tiles(
+            stack, ee.FeatureCollection(ee.Feature(tile_shp)), str(download_dir),
+            prefix = prefix, crs = "EPSG:4326", scale = 10)
 
+        if split:
+            for stack_tif in sorted(glob.glob(os.path.join(str(download_dir), glob.escape(prefix) + '*.tif'))):
+                split_rgb_stack(stack_tif, years, download_dir, provName, local_idx)
+        if cog:
+            for piece_prefix in ([f'rgb_{provName}_{yr}_{local_idx}_' for yr in years] if split else [prefix]):
+                finalize_pieces(download_dir, piece_prefix, resampling=RESAMPLING['rgb'])
+        if manifest:
+            for key in keys:
+                manifest.complete(key)
+    except Exception as e:
+        if manifest:
+            for key in keys:
+                manifest.fail(key, e)
+        raise
 
 
 
+# compute_otsu: see otsu.py
 
 
+# mask_and_apply: see otsu_mask.py
 
 
 # ## ----------------- MASK FUNCTIONS ------------------#
@@ -496,219 +667,5 @@ def get_crp_rgb_from_asset(yrList, download_dir, provName, local_idx, asset_path
 # from rasterio.features import shapes
 # import geopandas as gpd
 
-# def extract_year(filename):
-#     """
-#     Extracts a 4‐digit year from filenames like 'rgb_SK_2021_200_1.tif'.
-#     Returns the year string (e.g. '2021') or None if not found.
-#     """
-#     m = re.search(r'_(\d{4})(?=_|\.)', filename)
-#     return m.group(1) if m else None
-
-# def strip_year_from_basename(filename):
-#     import re
-#     """
-#     Removes exactly one "_<4‐digit year>" from the end of the base name.
-#     E.g. "rgb_SK_2021_200_1.tif" → "rgb_SK_200_1"
-#     """
-#     name = os.path.splitext(filename)[0]
-#     # return re.sub(r'_(\d{4})(?!.*_\d{4})', '', name)
-#     return re.sub(r'_(?:19|20)\d{2}(?=_)', '', name, count=1)
-
-
-
-# def otsu_threshold(grayscale_array):
-#     """
-#     Applies Otsu's method to a 2D array (dtype=float, values in [0..255]).
-#     Returns the optimal threshold in [0..255]. Zeros and negatives are ignored.
-#     """
-#     flat = grayscale_array.flatten()
-#     flat = flat[flat > 0]
-#     if flat.size == 0:
-#         return 0
-
-#     hist, _ = np.histogram(flat, bins=256, range=(0, 255))
-#     total = flat.size
-#     sum_total = np.dot(np.arange(256), hist)
-
-#     sumB = 0.0
-#     wB = 0.0
-#     max_between = 0.0
-#     threshold = 0
-
-#     for i in range(256):
-#         wB += hist[i]
-#         if wB == 0:
-#             continue
-#         wF = total - wB
-#         if wF == 0:
-#             break
-
-#         sumB += i * hist[i]
-#         mB = sumB / wB
-#         sumF = sum_total - sumB
-#         mF = sumF / wF
-
-#         between_var = wB * wF * (mB - mF) ** 2
-#         if between_var > max_between:
-#             max_between = between_var
-#             threshold = i
-
-#     return threshold
-
-# def compute_mean_with_otsu_and_shapefile(raster_paths, output_basename):
-#     """
-#     Given a list of aligned 3‐band, 8‐bit unsigned GeoTIFFs (`raster_paths`),
-#     this function produces:
-#       1. A 3‐band "mean_with_otsu" GeoTIFF, where each pixel is the mean only
-#          over those pixels that exceeded each image’s Otsu threshold.
-#       2. A polygon shapefile of regions where the Otsu mask (computed on the
-#          “no_otsu” grayscale composite) is 255.
-
-#     Outputs go into two subdirectories under the parent of `output_basename`:
-#       - “rgb/”: contains `{name_no_ext}_with_otsu.tif`
-#       - “shp/”: contains `{name_no_ext}_mask.shp`
-
-#     Returns:
-#       (with_otsu_fp, mask_shp_fp) – full filepaths to the outputs.
-#     """
-#     import rasterio
-#     if len(raster_paths) == 0:
-#         raise ValueError("`raster_paths` is empty.")
-
-#     # 1) Open the first raster to grab metadata, dims, transform, etc.
-#     with rasterio.open(raster_paths[0]) as src0:
-#         profile = src0.profile.copy()
-#         bands = src0.count
-#         height = src0.height
-#         width = src0.width
-#         transform = src0.transform
-#         crs = src0.crs
-
-#         if bands != 3 or src0.dtypes[0] != 'uint8':
-#             raise RuntimeError(
-#                 f"Expected 3‐band uint8 imagery, but first file has {bands} bands of type {src0.dtypes[0]}"
-#             )
-
-#         # Prepare accumulators for "with_otsu" mean
-#         sum_with_otsu = np.zeros((3, height, width), dtype=np.float64)
-#         count_with_otsu = np.zeros((3, height, width), dtype=np.uint32)
-
-#         # Prepare accumulators for computing temporary "no_otsu" grayscale composite
-#         sum_no_otsu_gray = np.zeros((height, width), dtype=np.float64)
-#         count_no_otsu_gray = np.zeros((height, width), dtype=np.uint32)
-
-#     # 2) Loop over each raster to build accumulators
-#     for idx, fp in enumerate(sorted(raster_paths), start=1):
-#         with rasterio.open(fp) as src:
-#             if src.count != bands or src.height != height or src.width != width:
-#                 raise RuntimeError(
-#                     f"Raster {os.path.basename(fp)} has different dimensions/bands than the first one."
-#                 )
-
-#             data = src.read(masked=True).astype(np.float32)  # shape = (3, H, W)
-
-#             # Compute grayscale for this image (masked‐to‐zero)
-#             R = data[0].filled(0)
-#             G = data[1].filled(0)
-#             B = data[2].filled(0)
-#             gray = 0.2989 * R + 0.5870 * G + 0.1140 * B
-
-#             # Accumulate for temporary "no_otsu" grayscale composite
-#             valid_gray = (~data[0].mask) & (~data[1].mask) & (~data[2].mask)
-#             sum_no_otsu_gray[valid_gray] += gray[valid_gray]
-#             count_no_otsu_gray[valid_gray] += 1
-
-#             # Compute this image’s Otsu threshold on its grayscale
-#             thr = otsu_threshold(gray)
-#             print(f"  [{idx}/{len(raster_paths)}] {os.path.basename(fp)} → Otsu = {thr:.1f}")
-
-#             # Create mask for this image: pixel > thr AND unmasked
-#             combined_mask = (gray > thr) & valid_gray
-
-#             # Accumulate sums/counts for pixels that passed Otsu
-#             for b in range(3):
-#                 band_arr = data[b].filled(0).astype(np.float64)
-#                 sum_with_otsu[b][combined_mask] += band_arr[combined_mask]
-#                 count_with_otsu[b][combined_mask] += 1
-
-#     # 3) Compute the “with_otsu” mean (3 bands, uint8)
-#     mean_with_otsu = np.zeros((3, height, width), dtype=np.uint8)
-#     for b in range(3):
-#         with np.errstate(divide='ignore', invalid='ignore'):
-#             valid = count_with_otsu[b] > 0
-#             band_float = sum_with_otsu[b]
-#             mean_with_otsu[b][valid] = np.round(band_float[valid] / count_with_otsu[b][valid]).astype(np.uint8)
-
-#     # 4) Compute temporary "no_otsu" grayscale composite
-#     mean_no_otsu_gray = np.zeros((height, width), dtype=np.uint8)
-#     with np.errstate(divide='ignore', invalid='ignore'):
-#         valid_gray = count_no_otsu_gray > 0
-#         gray_float = sum_no_otsu_gray
-#         mean_no_otsu_gray[valid_gray] = np.round(gray_float[valid_gray] / count_no_otsu_gray[valid_gray]).astype(np.uint8)
-
-#     # 5) Compute Otsu mask on the "no_otsu" grayscale composite
-#     thr_mean = otsu_threshold(mean_no_otsu_gray.astype(np.float32))
-
-#     # Build final binary mask array: 255 where mean_no_otsu_gray > thr_mean
-#     mask_on_mean = np.zeros((height, width), dtype=np.uint8)
-#     mask_on_mean[mean_no_otsu_gray > thr_mean] = 255
-
-#     # 6) Derive output directories and filenames
-#     parent_dir = os.path.dirname(output_basename)
-#     name_no_ext = os.path.splitext(os.path.basename(output_basename))[0]
-
-#     rgb_dir = os.path.join(parent_dir, "rgb")
-#     shp_dir = os.path.join(parent_dir, "shp")
-#     os.makedirs(rgb_dir, exist_ok=True)
-#     os.makedirs(shp_dir, exist_ok=True)
-
-#     with_otsu_fp = os.path.join(rgb_dir, f"{name_no_ext}_with_otsu.tif")
-#     mask_shp_fp = os.path.join(shp_dir, f"{name_no_ext}_mask.shp")
-
-#     # 7) Write out the “with_otsu” 3‐band TIFF into rgb_dir
-#     profile_with_otsu = profile.copy()
-#     profile_with_otsu.update({
-#         'dtype': 'uint8',
-#         'count': 3,
-#         'nodata': 0,
-#         'compress': 'lzw'
-#     })
-#     with rasterio.open(with_otsu_fp, 'w', **profile_with_otsu) as dst:
-#         dst.write(mean_with_otsu)
-
-#     print(f"→ Wrote TIFF: {os.path.relpath(with_otsu_fp, parent_dir)}")
-
-#     # 8) Convert `mask_on_mean` array to polygons and write shapefile into shp_dir
-#     # Delete existing shapefile files if present
-#     if os.path.exists(mask_shp_fp):
-#         base = os.path.splitext(mask_shp_fp)[0]
-#         for ext in [".shp", ".shx", ".dbf", ".prj", ".cpg"]:
-#             fp = base + ext
-#             if os.path.exists(fp):
-#                 os.remove(fp)
-
-#     # Extract polygons where mask == 255
-#     shapes_list = []
-#     for geom, value in shapes(mask_on_mean, mask=(mask_on_mean == 255), transform=transform):
-#         if int(value) == 255:
-#             shapes_list.append({
-#                 "geometry": geom,
-#                 "properties": {"value": int(value)}
-#             })
-
-#     # Build GeoDataFrame
-#     if len(shapes_list) == 0:
-#         gdf = gpd.GeoDataFrame({"value": []}, geometry=[], crs=crs)
-#     else:
-#         gdf = gpd.GeoDataFrame.from_features(shapes_list, crs=crs)
-
-#     # Write out shapefile into shp_dir
-#     gdf.to_file(mask_shp_fp, driver="ESRI Shapefile")
-#     print(f"→ Wrote shapefile: {os.path.relpath(mask_shp_fp, parent_dir)}")
-
-#     return with_otsu_fp, mask_shp_fp
-
-
-
-
-
+# extract_year, strip_year_from_basename, compute_mean_with_otsu_and_shapefile:
+# see otsu_composite.py
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# the Part 2 modules import each other as top-level modules (from the notebook folder)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_ee
+
+
+@pytest.fixture
+def fake_rgb_func():
+    """rgb_func imported against a fresh fake_ee server; yields (rgb_func, server)."""
+    server = fake_ee.install(latency=0.01, max_concurrent=None)
+    sys.modules.pop('rgb_func', None)
+    import rgb_func
+    try:
+        yield rgb_func, server
+    finally:
+        sys.modules.pop('rgb_func', None)
+        fake_ee.uninstall()
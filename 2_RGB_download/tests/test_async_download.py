@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+from fake_ee import EEException
+from async_download import (classify_error, expand_years, DownloadEngine, endpoint_slot,
+                            run_downloads)
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+
+
+def test_classify_error():
+    assert classify_error(EEException("Too many concurrent aggregations.")) == 'throttle'
+    assert classify_error(HttpError(503)) == 'transient'
+    assert classify_error(TimeoutError("read timed out")) == 'transient'
+    assert classify_error(HttpError(404)) == 'permanent'
+    assert classify_error(EEException("Image.load: Image asset 'x' not found.")) == 'permanent'
+    assert classify_error(ValueError("bad tile")) == 'permanent'
+
+
+def test_expand_years():
+    args = [([2021, 2022], 'out', 'SK', 7), ('out', 'tile_3')]
+    assert expand_years(args) == [([2021], 'out', 'SK', 7), ([2022], 'out', 'SK', 7), ('out', 'tile_3')]
+
+
+def test_run_downloads_retries_and_fails_fast(capsys):
+    calls = {}
+    lock = threading.Lock()
+
+    def job(yrs, idx):
+        key = (yrs[0], idx)
+        with lock:
+            calls[key] = calls.get(key, 0) + 1
+            n = calls[key]
+        if idx == 0 and n == 1:
+            raise EEException("Too many concurrent requests (429).")
+        if idx == 1 and n < 3:
+            raise HttpError(503)
+        if idx == 2:
+            raise EEException("Image asset not found.")
+        return key
+
+    results = run_downloads(job, [([2021, 2022], i) for i in range(4)], concurrency=4,
+                            base_delay=0.001, max_delay=0.01)
+    assert results[:4] == [(2021, 0), (2022, 0), (2021, 1), (2022, 1)]
+    assert all(isinstance(r, EEException) for r in results[4:6])
+    assert results[6:] == [(2021, 3), (2022, 3)]
+    assert calls[(2021, 2)] == calls[(2022, 2)] == 1   # permanent: no retry
+    assert calls[(2021, 1)] == 3
+    assert 'permanent' in capsys.readouterr().out
+
+
+def test_metadata_calls_use_their_endpoint_limit():
+    active = {'download': 0, 'getInfo': 0}
+    peak = dict(active)
+    lock = threading.Lock()
+
+    def enter(name):
+        with lock:
+            active[name] += 1
+            peak[name] = max(peak[name], active[name])
+
+    def leave(name):
+        with lock:
+            active[name] -= 1
+
+    def job(i):
+        enter('download')
+        with endpoint_slot('getInfo'):
+            enter('getInfo')
+            time.sleep(0.02)
+            leave('getInfo')
+        time.sleep(0.02)
+        leave('download')
+        return i
+
+    engine = DownloadEngine(limits={'download': 8, 'getInfo': 2}, base_delay=0.001)
+    assert asyncio.run(engine.run(job, list(range(16)))) == list(range(16))
+    assert peak['getInfo'] == 2
+    assert peak['download'] > 2
+    # outside an engine the slot is a no-op
+    with endpoint_slot('getInfo'):
+        pass
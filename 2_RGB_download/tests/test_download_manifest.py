@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from download_manifest import Manifest, rgb_key, mask_key, track_job, DONE, FAILED, PENDING
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    m = Manifest(tmp_path / 'manifest.sqlite')
+    yield m
+    m.close()
+
+
+def write(path, data=b'tif'):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_complete_records_pieces(manifest, tmp_path):
+    key = rgb_key('SK', 4, 2022)
+    manifest.start(key, tmp_path, 'rgb_SK_2022_4_')
+    write(tmp_path / 'rgb_SK_2022_4_1.tif', b'a' * 10)
+    write(tmp_path / 'rgb_SK_2022_4_2.tif', b'b' * 5)
+    manifest.complete(key)
+    assert manifest.is_done(key)
+    assert manifest.summary('rgb') == {DONE: (1, 15)}
+    assert manifest.verify(key)
+    os.remove(tmp_path / 'rgb_SK_2022_4_2.tif')
+    assert not manifest.verify(key)
+
+
+def test_failed_job_resumes_from_scratch(manifest, tmp_path):
+    key = rgb_key('SK', 4, 2022)
+    with pytest.raises(RuntimeError):
+        with track_job(manifest, key, tmp_path, 'rgb_SK_2022_4_'):
+            write(tmp_path / 'rgb_SK_2022_4_1.tif')
+            raise RuntimeError("connection reset")
+    assert manifest.state(key) == FAILED and not manifest.is_done(key)
+    # the retry deletes the stale piece before downloading again
+    manifest.start(key, tmp_path, 'rgb_SK_2022_4_')
+    assert not (tmp_path / 'rgb_SK_2022_4_1.tif').exists()
+    assert manifest._exec("SELECT attempts FROM jobs").fetchone()[0] == 2
+
+
+def test_recover_and_pending_arguments(manifest, tmp_path):
+    args = [([2021, 2022], str(tmp_path), 'SK', 0, 'roads', 'prov', 'tile_0'),
+            ([2021, 2022], str(tmp_path), 'SK', 1, 'roads', 'prov', 'tile_1')]
+    manifest.register_rgb_arguments(args)
+    assert len(manifest.remaining('rgb')) == 4
+    with track_job(manifest, rgb_key('SK', 0, 2021), tmp_path, 'rgb_SK_2021_0_'):
+        write(tmp_path / 'rgb_SK_2021_0_1.tif')
+    manifest.start(rgb_key('SK', 1, 2022), tmp_path, 'rgb_SK_2022_1_')   # crash while running
+    assert manifest.recover() == 1
+    assert manifest.state(rgb_key('SK', 1, 2022)) == PENDING
+    assert manifest.pending_rgb_arguments(args) == [([2022],) + args[0][1:], args[1]]
+
+    masks = [(str(tmp_path / 'Saskatchewan'), 't7', 'asset', 'tile')]
+    manifest.register_mask_arguments(masks)
+    assert manifest.remaining('crop_mask') == [mask_key('SK', 't7')]
+    manifest.skip(mask_key('SK', 't7'), 'no cropland')
+    assert manifest.pending_mask_arguments(masks) == []
+
+
+def test_interrupted_download_is_fetched_again(fake_rgb_func, tmp_path):
+    rgb_func, server = fake_rgb_func
+    db = str(tmp_path / 'manifest.sqlite')
+    out = tmp_path / 'rgb'
+    out.mkdir()
+    args = ([2021, 2022], str(out), 'SK', 3, 'roads', 'prov', 'tile_3')
+    # 2021 finished; 2022 left a truncated _1.tif that an exists() check would skip
+    m = Manifest(db)
+    with track_job(m, rgb_key('SK', 3, 2021), out, 'rgb_SK_2021_3_'):
+        write(out / 'rgb_SK_2021_3_1.tif', b'done')
+    m.start(rgb_key('SK', 3, 2022), out, 'rgb_SK_2022_3_')
+    write(out / 'rgb_SK_2022_3_1.tif', b'trunc')
+    m.recover()
+    m.close()
+
+    rgb_func.get_crp_rgb_from_asset(*args, manifest=db)
+    assert server.stats()['requests'] == 1
+    assert (out / 'rgb_SK_2022_3_1.tif').read_bytes() != b'trunc'
+    assert (out / 'rgb_SK_2021_3_1.tif').read_bytes() == b'done'
+    m = Manifest(db)
+    assert m.remaining() == []
+    m.close()
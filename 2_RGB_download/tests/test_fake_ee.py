@@ -0,0 +1,42 @@
+import fake_ee
+
+
+def _graph(ee, scene, scale=10):
+    img = ee.Image(f'COPERNICUS/S2_SR/{scene}')
+    return img.select(['B4', 'B3', 'B2']).map(lambda b: b.multiply(scale)).clip({'type': 'Polygon'})
+
+
+def test_server_cache_is_keyed_by_value():
+    server = fake_ee.install(latency=0.0, max_concurrent=None)
+    try:
+        import ee
+        _graph(ee, 'a').getInfo()
+        first = server.stats()['computed_nodes']
+        assert first > 0
+        # rebuilt from scratch: new objects, same graph -> served from the cache
+        _graph(ee, 'a').getInfo()
+        assert server.stats()['computed_nodes'] == first
+        # another scene: every node above the new leaf is new
+        _graph(ee, 'b').getInfo()
+        assert server.stats()['computed_nodes'] == 2 * first
+        # a different closure value in the mapped function: map and clip are new
+        _graph(ee, 'a', scale=20).getInfo()
+        assert server.stats()['computed_nodes'] == 2 * first + 2
+    finally:
+        fake_ee.uninstall()
+
+
+def test_graph_memoization_saves_client_ops_only(fake_rgb_func, tmp_path):
+    rgb_func, server = fake_rgb_func
+    rows = {}
+    for size in (0, 512):
+        rgb_func.GRAPH_CACHE_SIZE = size
+        rgb_func.clear_graph_cache()
+        server.reset()
+        for idx in range(4):
+            rgb_func.get_crp_rgb_from_asset([2021, 2022], str(tmp_path / str(size)), 'SK', str(idx),
+                                            'roads', 'prov', f'tile_{idx}')
+        rows[size] = server.stats()
+    rgb_func.GRAPH_CACHE_SIZE = 512
+    assert rows[512]['ops'] < rows[0]['ops']
+    assert rows[512]['computed_nodes'] == rows[0]['computed_nodes']
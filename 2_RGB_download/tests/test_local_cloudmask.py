@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+
+from local_cloudmask import cld_shdw_mask, cld_shdw_mask_tiled, project_clouds, dark_pixels
+
+
+def scenes(n=3, h=700, w=260, seed=0):
+    rng = np.random.default_rng(seed)
+    # blobs of cloud probability rather than noise, so the focal steps keep something
+    probability = np.zeros((n, h, w), dtype=np.float32)
+    for k in range(n):
+        for _ in range(12):
+            r, c, s = rng.integers(0, h), rng.integers(0, w), rng.integers(3, 25)
+            probability[k, max(0, r - s):r + s, max(0, c - s):c + s] = 50
+    b8 = rng.integers(500, 4000, (n, h, w)).astype(np.uint16)
+    b8[:, ::3] = 800                        # dark rows for shadows
+    scl = rng.integers(3, 8, (n, h, w)).astype(np.uint8)
+    return probability, b8, scl, rng.uniform(100, 170, n)
+
+
+@pytest.mark.parametrize('tile_rows', [100, 256, 1000])
+def test_tiled_matches_full_scene(tile_rows):
+    probability, b8, scl, azimuth = scenes()
+    full = cld_shdw_mask(probability, b8, scl, azimuth)['cloudmask']
+    assert full.any() and not full.all()
+    tiled = cld_shdw_mask_tiled(probability, b8, scl, azimuth, tile_rows=tile_rows, workers=2)
+    np.testing.assert_array_equal(tiled, full)
+
+
+def test_projection_points_away_from_the_sun():
+    clouds = np.zeros((1, 200, 200), dtype=bool)
+    clouds[0, 100:110, 100:110] = True
+    # sun in the south-east (azimuth 135): shadows fall north-west of the cloud
+    proj = project_clouds(clouds, [135.0])[0]
+    assert proj[60:100, 60:100].any()
+    assert not proj[120:, 120:].any()
+
+
+def test_dark_pixels_exclude_water():
+    b8 = np.array([[[1000, 1000, 3000]]], dtype=np.uint16)
+    scl = np.array([[[4, 6, 4]]], dtype=np.uint8)
+    assert dark_pixels(b8, scl).tolist() == [[[True, False, False]]]
+
+
+def test_imports_without_earth_engine():
+    code = "import sys, local_cloudmask; assert 'ee' not in sys.modules and 'geemap' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import warnings
+
+import numpy as np
+
+from local_composite import masked_median, to_byte, composite_arrays
+
+
+def test_masked_median_matches_nanmedian():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 3000, (9, 40, 50)).astype(np.float32)
+    valid = rng.random(values.shape) < 0.6
+    valid[:, :3] = False                   # no valid observation at all
+    valid[:, 3, :] = False
+    valid[4, 3, :] = True                  # exactly one
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)   # all-NaN pixels
+        expected = np.nanmedian(np.where(valid, values, np.nan), axis=0)
+    got = masked_median(values, valid)
+    np.testing.assert_allclose(got, expected)
+    assert np.isnan(got[:3]).all()
+
+
+def test_to_byte_unit_scale_and_unmask():
+    band = np.array([100.0, 3000.0, 1550.0, np.nan, -50.0, 9000.0])
+    assert to_byte(band, 100, 3000).tolist() == [0, 255, 127, 1, 0, 255]
+
+
+def test_composite_uses_clear_in_season_scenes():
+    # scenes in May, July and September; B4 uses Aug-Oct only, B2 Apr-Jul
+    months = [5, 7, 9]
+    bands = {b: np.full((3, 2, 2), v, dtype=np.float32)
+             for b, v in (('B4', 0), ('B3', 0), ('B2', 0))}
+    bands['B4'][2] = 3000
+    bands['B2'][:] = np.array([150, 1350, 9999])[:, None, None]
+    cs = np.ones((3, 2, 2), dtype=np.float32)
+    cs[0, 0, 0] = 0.1                      # May cloudy at one pixel
+    mask = np.array([[1.0, 1.0], [1.0, np.nan]])
+    rgb = composite_arrays(bands, cs, months, mask=mask)
+    assert rgb[0].tolist() == [[255, 255], [255, 1]]
+    # B2: median of 150 and 1350 -> 750 -> 127; only 1350 where May is cloudy
+    assert rgb[2].tolist() == [[255, 127], [127, 1]]
+
+
+def test_imports_without_earth_engine():
+    code = "import sys, local_composite; assert 'ee' not in sys.modules and 'geemap' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
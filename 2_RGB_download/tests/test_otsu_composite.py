@@ -0,0 +1,73 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+from rasterio.transform import from_origin
+
+import otsu_composite
+from otsu_composite import BLOCK, _windows, _bytes_per_pixel, compute_mean_with_otsu_and_shapefile
+
+
+def _write_years(tmp_path, n, height, width, seed=0):
+    """n aligned 3-band uint8 years of 64-pixel constant blocks (few polygons), 0 = nodata."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for k in range(n):
+        blocks = rng.integers(0, 256, (3, height // 64 + 1, width // 64 + 1), dtype=np.uint8)
+        data = np.repeat(np.repeat(blocks, 64, axis=1), 64, axis=2)[:, :height, :width]
+        path = tmp_path / f'rgb_SK_{2018 + k}_7_1.tif'
+        with rasterio.open(path, 'w', driver='GTiff', height=height, width=width, count=3,
+                           dtype='uint8', nodata=0, crs='EPSG:32613',
+                           transform=from_origin(500000, 5600000, 10, 10)) as dst:
+            dst.write(data)
+        paths.append(str(path))
+    return paths
+
+
+def test_windows_are_whole_blocks_when_they_fit():
+    windows, workers = _windows(1000, 3000, 4 * 1024 * 1000 * 80, 2, 80)
+    assert workers == 2
+    assert [int(w.height) for w in windows] == [2048, 952]
+
+
+def test_windows_drop_workers_before_rows():
+    # room for two windows of BLOCK rows, eight workers asked for
+    windows, workers = _windows(1000, 3000, 2 * BLOCK * 1000 * 80, 8, 80)
+    assert workers == 2
+    assert all(int(w.height) == BLOCK for w in windows[:-1])
+
+
+def test_windows_below_one_block_use_fewer_rows():
+    windows, workers = _windows(1000, 3000, 100 * 1000 * 80, 8, 80)
+    assert workers == 1
+    assert int(windows[0].height) == 100
+    assert sum(int(w.height) for w in windows) == 3000
+
+
+def test_bytes_per_pixel_grows_with_years_and_dtypes():
+    assert _bytes_per_pixel(3, np.uint16, np.uint8) == _bytes_per_pixel(7, np.uint16, np.uint8)
+    assert _bytes_per_pixel(40, np.uint16, np.uint8) > _bytes_per_pixel(3, np.uint16, np.uint8)
+    assert _bytes_per_pixel(3, np.uint32, np.uint16) > _bytes_per_pixel(3, np.uint16, np.uint8)
+
+
+def test_peak_memory_within_max_memory(tmp_path):
+    paths = _write_years(tmp_path, 3, 1024, 1024)
+    full = compute_mean_with_otsu_and_shapefile(paths, str(tmp_path / 'full' / 'rgb_SK_7_1.tif'),
+                                                workers=1, verbose=False)
+    # less than one BLOCK-row window: the old code still ran 4 workers x 512 rows
+    max_memory = 16 * 1024 * 1024
+    assert max_memory < BLOCK * 1024 * _bytes_per_pixel(3, np.uint16, np.uint8)
+    tracemalloc.start()
+    try:
+        small = compute_mean_with_otsu_and_shapefile(paths, str(tmp_path / 'small' / 'rgb_SK_7_1.tif'),
+                                                     max_memory=max_memory, workers=4, verbose=False)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # windows within max_memory, plus a fixed overhead (thread pool, dataset handles, polygons)
+    assert peak <= 1.1 * max_memory
+    with rasterio.open(full[0]) as a, rasterio.open(small[0]) as b:
+        assert np.array_equal(a.read(), b.read())
+    assert otsu_composite.group_by_tile(paths) == {'rgb_SK_7_1': sorted(paths)}
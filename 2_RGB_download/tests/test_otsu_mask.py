@@ -0,0 +1,66 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+from rasterio.transform import from_origin
+
+from otsu_mask import BLOCK, _BYTES_PER_PIXEL, _strips, mask_and_apply
+
+
+def _write_rgb(path, height, width, count=3, seed=0):
+    """uint8 raster of 32-pixel constant blocks; bands beyond 3 are constant 255 (alpha)."""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(1, 256, (3, height // 32 + 1, width // 32 + 1), dtype=np.uint8)
+    data = np.repeat(np.repeat(blocks, 32, axis=1), 32, axis=2)[:, :height, :width]
+    with rasterio.open(path, 'w', driver='GTiff', height=height, width=width, count=count,
+                       dtype='uint8', nodata=0, crs='EPSG:32613',
+                       transform=from_origin(500000, 5600000, 10, 10)) as dst:
+        dst.write(data, [1, 2, 3])
+        for band in range(4, count + 1):
+            dst.write(np.full((height, width), 255, np.uint8), band)
+    return str(path)
+
+
+def test_strips_drop_workers_before_rows():
+    strips, workers = _strips(1000, 3000, 2 * BLOCK * 1000 * _BYTES_PER_PIXEL, 8)
+    assert workers == 2
+    assert strips[0] == (0, BLOCK) and strips[-1][1] == 3000
+
+
+def test_strips_below_one_block_use_fewer_rows():
+    strips, workers = _strips(1000, 3000, 100 * 1000 * _BYTES_PER_PIXEL, 8)
+    assert workers == 1
+    assert strips[0] == (0, 100) and len(strips) == 30
+
+
+def test_peak_memory_within_max_memory(tmp_path):
+    src = _write_rgb(tmp_path / 'rgb_SK_2021_7_1.tif', 1024, 1024)
+    full = mask_and_apply(src, str(tmp_path / 'full'), 50, workers=1, verbose=False)
+    # less than one BLOCK-row strip: the old code still ran 4 workers x 512 rows
+    max_memory = 4 * 1024 * 1024
+    assert max_memory < BLOCK * 1024 * _BYTES_PER_PIXEL
+    tracemalloc.start()
+    try:
+        small = mask_and_apply(src, str(tmp_path / 'small'), 50, max_memory=max_memory, workers=4,
+                               verbose=False)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # strips within max_memory, plus a fixed overhead (thread pool, dataset handles, labels)
+    assert peak <= 1.1 * max_memory
+    with rasterio.open(full) as a, rasterio.open(small) as b:
+        assert np.array_equal(a.read(), b.read())
+
+
+def test_four_band_source_writes_three_bands(tmp_path):
+    src = _write_rgb(tmp_path / 'rgba.tif', 300, 200, count=4)
+    out = mask_and_apply(src, str(tmp_path / 'out'), 50, verbose=False)
+    with rasterio.open(out) as dst, rasterio.open(src) as s:
+        assert dst.count == 3
+        data = dst.read()
+        rgb = s.read([1, 2, 3])
+    kept = data.any(axis=0)
+    assert kept.any()
+    assert np.array_equal(data[:, kept], rgb[:, kept])
@@ -0,0 +1,94 @@
+import os
+import time
+
+import pytest
+
+from fake_ee import EEException
+from rate_scheduler import TokenBucket, AdaptiveScheduler, is_throttle_error
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=20, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert 0 < bucket.wait_time() <= 1 / 20
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.5
+
+
+def test_token_bucket_set_rate():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.try_acquire()
+    bucket.set_rate(100)
+    time.sleep(0.05)
+    assert bucket.try_acquire()
+
+
+def test_is_throttle_error():
+    assert is_throttle_error(EEException("Too many concurrent aggregations."))
+    assert is_throttle_error(Exception("User memory limit exceeded or Quota exceeded"))
+
+    class HttpError(Exception):
+        status_code = 429
+    assert is_throttle_error(HttpError("nope"))
+    assert not is_throttle_error(EEException("Image.load: Image asset 'x' not found."))
+
+
+def test_aimd_halves_on_throttle_and_recovers():
+    scheduler = AdaptiveScheduler(rate=2.0, max_concurrency=8, increase=0.5, cooldown=0.05)
+    scheduler.on_throttle()
+    assert scheduler.rate == pytest.approx(1.0)
+    assert scheduler.concurrency == 4
+    assert not scheduler.can_start(0)          # cooling down
+    time.sleep(0.06)
+    scheduler.on_throttle()
+    assert scheduler.rate == pytest.approx(0.5) and scheduler.concurrency == 2
+    # consecutive throttles double the pause
+    assert scheduler.paused_until - time.monotonic() > 0.05
+    for _ in range(2):
+        scheduler.on_success()
+    assert scheduler.rate == pytest.approx(1.5)
+    assert scheduler.concurrency == 3
+
+
+def test_simultaneous_throttles_decrease_once():
+    scheduler = AdaptiveScheduler(rate=2.0, max_concurrency=8, cooldown=0.05)
+    for _ in range(5):                          # five jobs hit the same 429
+        scheduler.on_throttle()
+    assert scheduler.throttled == 5
+    assert scheduler.rate == pytest.approx(1.0) and scheduler.concurrency == 4
+    assert scheduler.paused_until - time.monotonic() <= 0.05
+    time.sleep(0.06)
+    scheduler.on_throttle()                     # a new window: one more decrease
+    scheduler.on_throttle()
+    assert scheduler.rate == pytest.approx(0.5) and scheduler.concurrency == 2
+
+
+def test_run_retries_throttled_jobs():
+    calls = {}
+
+    def job(i):
+        calls[i] = calls.get(i, 0) + 1
+        if i == 2 and calls[i] == 1:
+            raise EEException("Too many concurrent requests (429).")
+        if i == 3:
+            raise EEException("Image asset not found.")
+        return i * 10
+
+    scheduler = AdaptiveScheduler(rate=100, max_concurrency=2, cooldown=0.01)
+    assert scheduler.run(job, [0, 1, 2, 3], poll=0.01) == [0, 10, 20, None]
+    assert calls == {0: 1, 1: 1, 2: 2, 3: 1}
+    assert (scheduler.done, scheduler.failed, scheduler.throttled) == (3, 1, 1)
+
+
+def test_fake_ee_download_run(fake_rgb_func, tmp_path):
+    rgb_func, server = fake_rgb_func
+    server.max_concurrent = 2
+    args = [([2022, 2023], str(tmp_path), 'SK', idx, 'roads', 'prov', f'tile_{idx}') for idx in range(6)]
+    scheduler = AdaptiveScheduler(rate=50, max_concurrency=6, cooldown=0.02, max_cooldown=0.1)
+    scheduler.run(rgb_func.get_crp_rgb_from_asset, args, poll=0.01)
+    assert scheduler.done == 6 and scheduler.failed == 0
+    assert scheduler.throttled > 0 and scheduler.concurrency < 6
+    assert server.stats()['peak_concurrent'] <= 2
+    assert sorted(os.listdir(tmp_path)) == sorted(f'rgb_SK_{yr}_{idx}_1.tif'
+                                                  for idx in range(6) for yr in (2022, 2023))
@@ -0,0 +1,71 @@
+import threading
+import time
+import weakref
+
+import numpy as np
+import pytest
+
+from tile_download import BLOCK, split_windows, download_tile_mosaic, tile_grid
+
+rasterio = pytest.importorskip('rasterio')
+
+
+def _covers(windows, width, height):
+    seen = np.zeros((height, width), dtype=np.uint8)
+    for c, r, w, h in windows:
+        seen[r:r + h, c:c + w] += 1
+    return (seen == 1).all()
+
+
+@pytest.mark.parametrize('width, height', [(3000, 2000), (5000, 700), (1500, 1500)])
+def test_split_windows_on_block_boundaries(width, height):
+    max_bytes = 1024 * 1024 * 3           # ~ 0.75 MB after safety: a few blocks per window
+    windows = split_windows(width, height, 3, max_bytes)
+    assert len(windows) > 1
+    assert _covers(windows, width, height)
+    for c, r, w, h in windows:
+        assert w * h * 3 <= max_bytes * 0.75
+        assert c % BLOCK == 0 and r % BLOCK == 0
+        assert w % BLOCK == 0 or c + w == width
+        assert h % BLOCK == 0 or r + h == height
+
+
+def test_split_windows_below_one_block():
+    # a single block over the limit is still split, off the block grid
+    windows = split_windows(BLOCK, BLOCK, 8, BLOCK * BLOCK * 8 // 2)
+    assert _covers(windows, BLOCK, BLOCK)
+    assert all(w * h * 8 <= BLOCK * BLOCK * 8 // 2 * 0.75 for _, _, w, h in windows)
+
+
+def test_mosaic_bounds_sub_tiles_in_flight(tmp_path):
+    bounds = (500000, 5600000, 500000 + 10 * 2100, 5600000 + 10 * 1300)
+    width, height, _ = tile_grid(bounds, 10, 'EPSG:32613')
+    lock = threading.Lock()
+    alive = {'now': 0, 'peak': 0}
+
+    def freed():
+        with lock:
+            alive['now'] -= 1
+
+    def fetch(image, grid, band_names, dtype):
+        dims = grid['dimensions']
+        col = round((grid['affineTransform']['translateX'] - bounds[0]) / 10)
+        row = round((bounds[3] - grid['affineTransform']['translateY']) / 10)
+        time.sleep(0.005)
+        ys, xs = np.mgrid[row:row + dims['height'], col:col + dims['width']]
+        data = np.stack([(xs + ys) % 251 + 1] * len(band_names)).astype(dtype)
+        weakref.finalize(data, freed)
+        with lock:
+            alive['now'] += 1
+            alive['peak'] = max(alive['peak'], alive['now'])
+        return data
+
+    out = str(tmp_path / 'tile.tif')
+    info = download_tile_mosaic(None, bounds, out, ['R', 'G', 'B'], crs='EPSG:32613',
+                                max_bytes=1024 * 1024, workers=3, fetch=fetch)
+    assert info['sub_tiles'] > 6
+    assert alive['peak'] <= 2 * 3          # in flight plus completed, not yet written
+    with rasterio.open(out) as src:
+        data = src.read(1)
+    ys, xs = np.mgrid[0:height, 0:width]
+    assert np.array_equal(data, ((xs + ys) % 251 + 1).astype(np.uint8))
@@ -0,0 +1,91 @@
+import sys
+
+import pytest
+
+import fake_ee
+from download_manifest import open_manifest, rgb_key, mask_key, SKIPPED
+
+
+class FakeCatalog:
+    """The two GridCatalog methods the screen uses."""
+    def __init__(self, idx):
+        self.idx = list(idx)
+
+    def query(self):
+        return list(self.idx)
+
+    def feature(self, local_idx):
+        return {'type': 'Feature', 'geometry': None, 'properties': {'local_idx': int(local_idx)}}
+
+
+def _reduce_regions_info(means):
+    """getInfo() of reduceRegions: features in reverse order, no 'mean' where the tile had no pixel."""
+    def info(node):
+        while node._name != 'reduceRegions':
+            node = node._parent
+        features = node._args[0]._args[0]
+        out = []
+        for f in reversed(features):
+            assert f._name == 'set' and f._args[0] == 'local_idx'
+            i = f._args[1]
+            props = {'local_idx': i}
+            if means.get(i) is not None:
+                props['mean'] = means[i]
+            out.append({'type': 'Feature', 'geometry': None, 'properties': props})
+        return {'type': 'FeatureCollection', 'features': out}
+    return info
+
+
+@pytest.fixture
+def tile_screen():
+    server = fake_ee.install(latency=0.0, max_concurrent=None)
+    sys.modules.pop('tile_screen', None)
+    import tile_screen
+    try:
+        yield tile_screen, server
+    finally:
+        sys.modules.pop('tile_screen', None)
+        fake_ee.uninstall()
+
+
+def test_fractions_keyed_by_local_idx_with_null_means(tile_screen):
+    ts, server = tile_screen
+    # tile 11 has no valid pixel: aggregate_array('mean') would drop it and shift 12, 13
+    means = {10: 0.5, 11: None, 12: 0.01, 13: 0.3, 14: 0.0}
+    server.info = _reduce_regions_info(means)
+    fractions = ts.cropland_fractions_ee(FakeCatalog(means), batch_size=2)
+    assert fractions == {10: 0.5, 11: 0.0, 12: 0.01, 13: 0.3, 14: 0.0}
+    assert server.stats()['requests'] == 3
+
+
+def test_cropland_image_is_aafc_and_esa(tile_screen):
+    ts, server = tile_screen
+    image = ts.cropland_image()
+    chain = []
+    node = image
+    while node is not None:
+        chain.append(node._name)
+        node = node._parent
+    # AAFC crop classes kept only where ESA says cropland (build_cropland_mask), then 0 elsewhere
+    assert chain[:4] == ['rename', 'unmask', 'updateMask', 'max']
+    esa = image._parent._parent._args[0]
+    assert esa._name == 'eq' and esa._args == (ts.ESA_CROPLAND,)
+    assert 'Or' not in server.op_names and 'And' not in server.op_names
+
+
+def test_screen_arguments_marks_skipped(tile_screen, tmp_path):
+    ts, _ = tile_screen
+    db = tmp_path / 'manifest.sqlite'
+    rgb = [([2020, 2021], 'out', 'SK', str(i), 'asset', 'Saskatchewan', {}) for i in (1, 2, 3)]
+    masks = [('Mask_download/Saskatchewan', str(i), 'asset', {}) for i in (1, 2, 3)]
+    fractions = {1: 0.5, 2: 0.001}
+    kept = ts.screen_arguments(rgb, fractions, 0.02, db)
+    assert [a[3] for a in kept] == ['1', '3']
+    kept = ts.screen_arguments(masks, {str(k): v for k, v in fractions.items()}, 0.02, db)
+    assert [a[1] for a in kept] == ['1', '3']
+    manifest = open_manifest(db)
+    assert manifest.state(rgb_key('SK', '2', 2020)) == SKIPPED
+    assert manifest.state(rgb_key('SK', '2', 2021)) == SKIPPED
+    assert manifest.state(rgb_key('SK', '1', 2020)) != SKIPPED
+    assert manifest.state(mask_key('SK', '2')) == SKIPPED
+    assert set(ts.skipped_tiles(db, 'SK')) == {'2'}
@@ -0,0 +1,200 @@
+"""
+Payload-aware tile downloader: one GeoTIFF per tile-year, no fragments.
+
+The pixel and byte payload of a tile is estimated from its bounds, the
+scale (10 m) and the band dtype. The tile's pixel grid is bisected along
+its longer side only until every sub-tile fits the per-request limits. Cuts
+fall on the 512x512 blocks of the output, so every write fills whole
+compressed blocks and no block is re-compressed. Sub-tiles are fetched in
+parallel with ee.data.computePixels, which returns numpy arrays without
+writing files. At most `workers` fetches are in flight, and each array is
+written into its window of one open GeoTIFF as it arrives. Peak memory is
+those sub-tiles, never the full tile. The file is written as `<name>.part`
+and renamed when complete.
+"""
+import os
+import time
+import math
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from async_download import classify_error, backoff_delay, endpoint_slot
+
+
+##################
+
+# Earth Engine computePixels / getDownloadURL limits (bytes and pixels per side)
+MAX_REQUEST_BYTES = 48 * 1024 * 1024
+MAX_GRID_DIM = 32768
+# Headroom for encoding overhead
+PAYLOAD_SAFETY = 0.75
+# Block size of the output GeoTIFF; sub-tiles are cut on block boundaries
+BLOCK = 512
+
+# Metres per degree at the equator; EE uses this to turn `scale` into
+# degrees for EPSG:4326 grids
+METERS_PER_DEGREE = 111319.49079327357
+
+
+def pixel_size(scale=10, crs='EPSG:4326'):
+    """Pixel size in CRS units for a scale in metres."""
+    return scale / METERS_PER_DEGREE if crs == 'EPSG:4326' else float(scale)
+
+
+def tile_grid(bounds, scale=10, crs='EPSG:4326'):
+    """(width, height, transform) of the pixel grid covering bounds = (xmin, ymin, xmax, ymax)."""
+    from rasterio.transform import from_origin
+    xmin, ymin, xmax, ymax = bounds
+    d = pixel_size(scale, crs)
+    width = max(1, int(math.ceil((xmax - xmin) / d - 1e-9)))
+    height = max(1, int(math.ceil((ymax - ymin) / d - 1e-9)))
+    return width, height, from_origin(xmin, ymax, d, d)
+
+
+def estimate_payload(bounds, n_bands=3, dtype='uint8', scale=10, crs='EPSG:4326'):
+    """Return (pixels, bytes) of one download of `bounds`."""
+    width, height, _ = tile_grid(bounds, scale, crs)
+    pixels = width * height
+    return pixels, pixels * n_bands * np.dtype(dtype).itemsize
+
+
+def _cut(n, block):
+    """Where to bisect a side of n pixels: on a block boundary while it spans several blocks."""
+    if n > block:
+        return max(1, n // block // 2) * block
+    return n // 2
+
+
+def split_windows(width, height, bytes_per_pixel, max_bytes=MAX_REQUEST_BYTES,
+                  max_dim=MAX_GRID_DIM, safety=PAYLOAD_SAFETY, block=BLOCK):
+    """
+    Bisect the (width, height) grid along its longer side until every
+    window fits max_bytes * safety and max_dim. Returns [(col, row, w, h)].
+
+    Windows start on multiples of `block` and are whole blocks wide and high,
+    except in the last column and row; only a single block over the limits
+    is split further.
+    """
+    limit = max_bytes * safety
+    out, stack = [], [(0, 0, width, height)]
+    while stack:
+        c, r, w, h = stack.pop()
+        if (w * h * bytes_per_pixel <= limit and w <= max_dim and h <= max_dim) or (w == 1 and h == 1):
+            out.append((c, r, w, h))
+        elif w >= h:
+            half = _cut(w, block)
+            stack += [(c + half, r, w - half, h), (c, r, half, h)]
+        else:
+            half = _cut(h, block)
+            stack += [(c, r + half, w, h - half), (c, r, w, half)]
+    return out
+
+
+def tile_bounds(tile_shp):
+    """
+    Bounds of a tile: computed locally for a GeoJSON feature (grid_catalog),
+    one getInfo round trip for an ee object.
+    """
+    if isinstance(tile_shp, dict):
+        from shapely.geometry import shape
+        return tuple(shape(tile_shp.get('geometry', tile_shp)).bounds)
+    import ee
+    with endpoint_slot('getInfo'):
+        coords = ee.Feature(tile_shp).geometry().bounds().getInfo()['coordinates'][0]
+    xs, ys = [p[0] for p in coords], [p[1] for p in coords]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+##################
+
+def compute_pixels_fetch(image, grid, band_names, dtype):
+    """Fetch one sub-tile as a (bands, h, w) array with ee.data.computePixels."""
+    import ee
+    arr = ee.data.computePixels({
+        'expression': image,
+        'fileFormat': 'NUMPY_NDARRAY',
+        'bandIds': list(band_names),
+        'grid': grid,
+    })
+    return np.stack([arr[b] for b in band_names]).astype(dtype, copy=False)
+
+
+def _grid(transform, col, row, w, h, crs):
+    x0, y0 = transform * (col, row)
+    return {'dimensions': {'width': w, 'height': h},
+            'affineTransform': {'scaleX': transform.a, 'shearX': 0, 'translateX': x0,
+                                'shearY': 0, 'scaleY': transform.e, 'translateY': y0},
+            'crsCode': crs}
+
+
+def download_tile_mosaic(image, bounds, out_tif, band_names, dtype='uint8', scale=10,
+                         crs='EPSG:4326', max_bytes=MAX_REQUEST_BYTES, workers=8,
+                         max_retries=5, fetch=None, nodata=None):
+    """
+    Download `image` over `bounds` into the single GeoTIFF `out_tif`.
+
+    Parameters:
+    - image: ee.Image with bands `band_names`.
+    - bounds: (xmin, ymin, xmax, ymax) in `crs`.
+    - dtype: output dtype; with len(band_names) it drives the payload estimate.
+    - max_bytes: per-request payload limit used for sub-tiling.
+    - workers: sub-tiles fetched in parallel; at most this many arrays are
+      in memory at once.
+    - fetch: fetch(image, grid, band_names, dtype) -> array; defaults to
+      ee.data.computePixels.
+
+    Returns a dict with the number of sub-tiles, pixels and bytes written.
+    """
+    import rasterio
+
+    fetch = fetch or compute_pixels_fetch
+    width, height, transform = tile_grid(bounds, scale, crs)
+    bpp = len(band_names) * np.dtype(dtype).itemsize
+    windows = split_windows(width, height, bpp, max_bytes)
+
+    profile = {'driver': 'GTiff', 'width': width, 'height': height, 'count': len(band_names),
+               'dtype': dtype, 'crs': crs, 'transform': transform, 'nodata': nodata,
+               'tiled': True, 'blockxsize': 512, 'blockysize': 512, 'compress': 'deflate',
+               'BIGTIFF': 'IF_SAFER'}
+    part = out_tif + '.part'
+
+    def fetch_window(win):
+        col, row, w, h = win
+        grid = _grid(transform, col, row, w, h, crs)
+        for attempt in range(max_retries + 1):
+            try:
+                return fetch(image, grid, band_names, dtype)
+            except Exception as e:
+                if classify_error(e) == 'permanent' or attempt == max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_tif)), exist_ok=True)
+    try:
+        with rasterio.open(part, 'w', **profile) as dst:
+            dst.descriptions = tuple(band_names)
+            in_flight = max(1, min(workers, len(windows)))
+
+            def write_completed(futures):
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    # pop so the written array is not kept alive by the future
+                    col, row, w, h = futures.pop(fut)
+                    dst.write(fut.result(), window=rasterio.windows.Window(col, row, w, h))
+
+            with ThreadPoolExecutor(max_workers=in_flight) as pool:
+                futures = {}
+                for win in windows:
+                    if len(futures) >= in_flight:
+                        write_completed(futures)
+                    futures[pool.submit(fetch_window, win)] = win
+                while futures:
+                    write_completed(futures)
+        os.replace(part, out_tif)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return {'sub_tiles': len(windows), 'pixels': width * height,
+            'bytes': width * height * bpp}
@@ -0,0 +1,139 @@
+"""
+Empty-tile pre-screening: skip grid cells with (almost) no cropland.
+
+Cells along province edges, over lakes and towns hold little or no cropland,
+but still cost a full RGB download, a SAM run and a cleaning pass. The
+screen computes the cropland fraction of every tile at a coarse scale. It
+then marks tiles below `threshold` as 'skipped' in the download manifest
+(every RGB year and the crop mask), and the download functions treat
+skipped jobs as done.
+
+Two sources for the fraction:
+- cropland_fractions_ee: AAFC ACI crop classes kept only where ESA
+  WorldCover is cropland too (the updateMask of build_cropland_mask in
+  1b_mask_download), averaged per tile at `scale` m. It uses one
+  reduceRegions request per batch of tiles.
+- cropland_fractions_local: already-downloaded crop_mask_<id>_1.tif files,
+  read decimated (COG overviews make this cheap).
+
+    fractions = cropland_fractions_ee(catalog)
+    argument_list_config_all = screen_arguments(argument_list_config_all, fractions, 0.02, db_path)
+"""
+import os
+
+from download_manifest import open_manifest, rgb_key, mask_key, province_from_dir, SKIPPED
+
+
+##################
+
+CROPLAND_THRESHOLD = 0.02
+SCREEN_SCALE = 300
+BATCH_SIZE = 500
+
+# AAFC ACI crop classes kept by build_cropland_mask (1b_mask_download)
+AAFC_CROP_CLASSES = [132, 133, 134, 135, 136, 137, 138, 139, 140, 141, 142, 145, 146, 147, 148,
+                     149, 150, 151, 152, 153, 154, 155, 156, 157, 158, 160, 162, 167, 174]
+ESA_CROPLAND = 40
+
+
+def cropland_image():
+    """1 where any AAFC ACI year (2018-2024) and ESA WorldCover both say cropland, else 0."""
+    import ee
+    esa = ee.ImageCollection('ESA/WorldCover/v100').first().eq(ESA_CROPLAND)
+    aci = (ee.ImageCollection('AAFC/ACI').filterDate('2018-01-01', '2024-12-31')
+           .map(lambda img: img.select(0).remap(AAFC_CROP_CLASSES, [1] * len(AAFC_CROP_CLASSES), 0))
+           .max())
+    return aci.updateMask(esa).unmask(0).rename('cropland')
+
+
+def cropland_fractions_ee(catalog, idx=None, scale=SCREEN_SCALE, batch_size=BATCH_SIZE):
+    """
+    {local_idx: cropland fraction} from Earth Engine, one request per batch of tiles.
+
+    Each feature carries its local_idx, and (local_idx, mean) pairs are read
+    back per feature: a tile whose mean is null (no valid pixel) gets 0.
+    """
+    import ee
+    idx = catalog.query() if idx is None else list(idx)
+    image = cropland_image()
+    fractions = {}
+    for start in range(0, len(idx), batch_size):
+        batch = idx[start:start + batch_size]
+        features = ee.FeatureCollection([ee.Feature(catalog.feature(i)).set('local_idx', i)
+                                         for i in batch])
+        means = (image.reduceRegions(collection=features, reducer=ee.Reducer.mean(), scale=scale)
+                 .select(['local_idx', 'mean'], None, False).getInfo())
+        for feature in means['features']:
+            props = feature['properties']
+            fractions[props['local_idx']] = float(props.get('mean') or 0.0)
+    return fractions
+
+
+def cropland_fraction_file(path, factor=32):
+    """Fraction of valid pixels > 0 in a crop mask raster, read at 1/factor resolution."""
+    import rasterio
+    from rasterio.enums import Resampling
+    with rasterio.open(path) as src:
+        shape = (max(1, src.height // factor), max(1, src.width // factor))
+        data = src.read(1, out_shape=shape, masked=True, resampling=Resampling.nearest)
+    valid = data.count()
+    return float((data > 0).sum()) / valid if valid else 0.0
+
+
+def cropland_fractions_local(mask_dir, tile_ids, factor=32):
+    """{tile_id: cropland fraction} from downloaded crop_mask_<id>_1.tif; missing files are left out."""
+    fractions = {}
+    for tile_id in tile_ids:
+        path = os.path.join(str(mask_dir), f'crop_mask_{tile_id}_1.tif')
+        if os.path.exists(path):
+            fractions[tile_id] = cropland_fraction_file(path, factor)
+    return fractions
+
+
+##################
+
+def _fraction(fractions, tile_id):
+    """Fraction of a tile whichever key type was used (int local_idx or str tile_id)."""
+    for key in (tile_id, str(tile_id)):
+        if key in fractions:
+            return fractions[key]
+    try:
+        return fractions.get(int(tile_id))
+    except ValueError:
+        return None
+
+
+def screen_arguments(argument_list, fractions, threshold=CROPLAND_THRESHOLD, manifest=None):
+    """
+    Drop tiles whose cropland fraction is below `threshold`.
+
+    Works on get_crp_rgb_from_asset and get_crp_mask_from_asset argument
+    tuples. Tiles without a fraction are kept. With a manifest, dropped
+    jobs are marked 'skipped' (with the fraction as reason), so later runs
+    and the planner count them as done. Returns the kept arguments.
+    """
+    manifest = open_manifest(manifest)
+    kept, skipped = [], 0
+    for arg in argument_list:
+        rgb = isinstance(arg[0], (list, tuple))
+        tile_id = arg[3] if rgb else arg[1]
+        frac = _fraction(fractions, tile_id)
+        if frac is None or frac >= threshold:
+            kept.append(arg)
+            continue
+        skipped += 1
+        if manifest:
+            reason = f'cropland fraction {frac:.4f} < {threshold}'
+            if rgb:
+                for yr in arg[0]:
+                    manifest.skip(rgb_key(arg[2], tile_id, yr), reason)
+            else:
+                manifest.skip(mask_key(province_from_dir(arg[0]), tile_id), reason)
+    print(f"Screened {len(argument_list)} tiles: {skipped} below {threshold} cropland skipped, "
+          f"{len(kept)} kept")
+    return kept
+
+
+def skipped_tiles(manifest, province, product='rgb'):
+    """Tile ids skipped by the screen, for filtering segmentation / cleaning inputs."""
+    return open_manifest(manifest).tiles(SKIPPED, product, province)
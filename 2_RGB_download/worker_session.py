@@ -0,0 +1,99 @@
+"""
+Per-process Earth Engine session for download workers.
+
+ee.Initialize() (authentication plus a metadata round trip) and the first
+geemap import used to run inside every job, and inside every year of
+get_crp_rgb_from_asset. Now each process pays for them once:
+- init_worker is the ProcessPoolExecutor initializer. It imports ee/geemap,
+  initializes the session and can pre-build province-level objects (e.g.
+  the road mask graph) before the first job arrives.
+- ensure_session is what the job functions call. It is a no-op once the
+  process is initialized, so sequential and threaded runs share one session
+  too.
+- TimedJob wraps a job function to time each job. Startup cost is reported
+  separately from per-job cost (session_report).
+"""
+import os
+import time
+import threading
+
+
+##################
+
+_SESSION = {'pid': None, 'startup_s': 0.0, 'project': None}
+_LOCK = threading.Lock()
+
+
+def ensure_session(project=None):
+    """Initialize Earth Engine once per process; returns the startup seconds it took."""
+    if _SESSION['pid'] == os.getpid():
+        return 0.0
+    with _LOCK:
+        if _SESSION['pid'] == os.getpid():
+            return 0.0
+        start = time.perf_counter()
+        import ee
+        import geemap.geemap  # noqa: F401  (heavy import, done once)
+        if project:
+            ee.Initialize(project=project)
+        else:
+            ee.Initialize()
+        _SESSION.update(pid=os.getpid(), project=project,
+                        startup_s=time.perf_counter() - start)
+        return _SESSION['startup_s']
+
+
+def init_worker(project=None, warmup=None, warmup_args=()):
+    """
+    ProcessPoolExecutor initializer: session first, then warmup(*warmup_args).
+
+    warmup builds objects that every job of the province reuses, e.g.
+    rgb_func.get_road_mask with (provName, asset_path, selectProv). Its time
+    counts as startup.
+    """
+    ensure_session(project)
+    if warmup is not None:
+        start = time.perf_counter()
+        warmup(*warmup_args)
+        _SESSION['startup_s'] += time.perf_counter() - start
+
+
+def session_startup():
+    """Startup seconds of this process (0 before the session exists)."""
+    return _SESSION['startup_s'] if _SESSION['pid'] == os.getpid() else 0.0
+
+
+##################
+
+class TimedJob:
+    """Picklable wrapper: func(*args) -> (result, {'pid', 'startup_s', 'job_s'})."""
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        ensure_session()
+        start = time.perf_counter()
+        result = self.func(*args)
+        return result, {'pid': os.getpid(), 'startup_s': session_startup(),
+                        'job_s': time.perf_counter() - start}
+
+
+def session_report(metrics):
+    """Startup vs per-job seconds from TimedJob metrics (finished jobs only)."""
+    metrics = [m for m in metrics if m]
+    startup = {m['pid']: m['startup_s'] for m in metrics}
+    jobs = sorted(m['job_s'] for m in metrics)
+    pick = lambda q: round(jobs[min(len(jobs) - 1, int(q * len(jobs)))], 2) if jobs else 0.0
+    return {'workers': len(startup),
+            'startup_total_s': round(sum(startup.values()), 2),
+            'startup_mean_s': round(sum(startup.values()) / len(startup), 2) if startup else 0.0,
+            'jobs': len(jobs),
+            'job_mean_s': round(sum(jobs) / len(jobs), 2) if jobs else 0.0,
+            'job_p50_s': pick(0.5), 'job_p95_s': pick(0.95)}
+
+
+def print_session_report(metrics):
+    r = session_report(metrics)
+    print(f"Startup: {r['workers']} workers, {r['startup_mean_s']} s each "
+          f"({r['startup_total_s']} s total) | Jobs: {r['jobs']}, mean {r['job_mean_s']} s, "
+          f"p50 {r['job_p50_s']} s, p95 {r['job_p95_s']} s")
@@ -0,0 +1,74 @@
+"""
+Skip chips with (almost) no valid pixels before SAM inference.
+
+get_s2 multiplies the RGB composite by the crop/road mask and unmask(1)s
+it, so masked-out land is a constant 0 or 1 in every band. Large parts of
+each raster are fill, yet each of their chips would still cost one encoder
+pass.
+
+chip_valid_fractions reads the raster once at 1/factor resolution (from
+the overviews when the file has them, e.g. COG downloads) and marks a
+pixel valid when any band is above `fill_max`. Optionally the crop mask is
+read too, and a pixel also needs a mask value above `mask_threshold`. A
+summed-area table gives the valid fraction of every chip core in one
+vectorized step. SamBackend(min_valid_fraction=...) drops chips below the
+threshold before encoding and reports them in backend.stats.
+"""
+import numpy as np
+
+
+##################
+
+FILL_MAX = 1
+MIN_VALID_FRACTION = 0.02
+FACTOR = 8
+
+
+def valid_pixels(raster_path, factor=FACTOR, fill_max=FILL_MAX, mask_path=None, mask_threshold=0.5):
+    """Boolean (h / factor, w / factor) grid of valid pixels, read decimated."""
+    import rasterio
+    from rasterio.enums import Resampling
+    with rasterio.open(raster_path) as src:
+        shape = (max(1, src.height // factor), max(1, src.width // factor))
+        data = src.read(out_shape=(src.count,) + shape, resampling=Resampling.nearest)
+    valid = (data > fill_max).any(axis=0)
+    if mask_path is not None:
+        with rasterio.open(mask_path) as msrc:
+            mask = msrc.read(1, out_shape=shape, resampling=Resampling.nearest)
+        valid &= mask > mask_threshold
+    return valid
+
+
+def window_fractions(valid, windows, factor=FACTOR):
+    """
+    Valid fraction of every (c0, r0, c1, r1) full-resolution window, from the decimated grid.
+
+    Uses a summed-area table, so the cost does not depend on window size.
+    """
+    h, w = valid.shape
+    table = np.zeros((h + 1, w + 1), dtype=np.int64)
+    table[1:, 1:] = valid.cumsum(axis=0).cumsum(axis=1)
+    win = np.asarray(windows, dtype=np.int64).reshape(-1, 4)
+    c0 = np.clip(win[:, 0] // factor, 0, w)
+    r0 = np.clip(win[:, 1] // factor, 0, h)
+    c1 = np.clip(-(-win[:, 2] // factor), 0, w)
+    r1 = np.clip(-(-win[:, 3] // factor), 0, h)
+    counts = table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+    area = (r1 - r0) * (c1 - c0)
+    return np.where(area > 0, counts / np.maximum(area, 1), 0.0)
+
+
+def chip_valid_fractions(raster_path, chips, factor=FACTOR, fill_max=FILL_MAX, mask_path=None,
+                         mask_threshold=0.5):
+    """Valid fraction of the core of each (col, row, core) chip of sam_backend.chip_windows."""
+    valid = valid_pixels(raster_path, factor, fill_max, mask_path, mask_threshold)
+    return window_fractions(valid, [core for _, _, core in chips], factor)
+
+
+def screen_chips(raster_path, chips, min_valid_fraction=MIN_VALID_FRACTION, **kwargs):
+    """(chips to segment, number skipped)."""
+    if not min_valid_fraction or not chips:
+        return list(chips), 0
+    fractions = chip_valid_fractions(raster_path, chips, **kwargs)
+    kept = [chip for chip, frac in zip(chips, fractions) if frac >= min_valid_fraction]
+    return kept, len(chips) - len(kept)
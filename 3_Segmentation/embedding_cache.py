@@ -0,0 +1,143 @@
+"""
+On-disk cache of SAM image embeddings, one file per chip.
+
+The image encoder is most of the cost of a SAM run, and its output depends
+only on the chip pixels and the model weights. It does not depend on
+stability_score_thresh, box_nms_thresh, points_per_batch,
+min_mask_region_area or any other decoder option. With a cache, reruns that
+only change those options skip the encoder and run only the mask decoder.
+
+Entries are keyed by the raster's content hash, the chip window (col, row,
+size) and the model version. Each is saved as a .npy file and opened
+memory-mapped, so a hit costs no copy until the decoder reads it. Every
+hit refreshes the file's mtime. When the cache grows past `max_bytes`, the
+least recently used files are deleted. Writes go through a temporary file
+and os.replace, so several workers can share one cache folder.
+
+    cache = EmbeddingCache(project_root / '5_Data' / 'Embedding_cache')
+    backend = SamBackend(model, cache=cache)
+"""
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+
+##################
+
+MAX_BYTES = 20 * 1024 ** 3
+_HASH_BLOCK = 1 << 20
+
+_raster_hashes = {}
+_hash_lock = threading.Lock()
+
+
+def raster_hash(path):
+    """sha1 of the raster file, remembered per (path, size, mtime) within the process."""
+    st = os.stat(path)
+    memo = (os.path.abspath(str(path)), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if memo in _raster_hashes:
+            return _raster_hashes[memo]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+            h.update(block)
+    with _hash_lock:
+        _raster_hashes[memo] = h.hexdigest()
+    return _raster_hashes[memo]
+
+
+def embedding_key(content_hash, col, row, size, model_version):
+    return hashlib.sha1(f'{content_hash}:{col}:{row}:{size}:{model_version}'.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Memory-mapped .npy embeddings under `cache_dir` with an LRU size limit.
+
+    get(key) returns a read-only memmap or None; put(key, array) stores an
+    entry and evicts old ones if needed. hits and misses count lookups
+    made through this instance.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._bytes = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        # two-level fan-out keeps directories small
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            arr = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arr
+
+    def put(self, key, array):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        size = os.path.getsize(tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            over = self._bytes is None or self._bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def entries(self):
+        """[(mtime, size, path)] of every entry, oldest first."""
+        out = []
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.npy'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    out.append((st.st_mtime, st.st_size, entry.path))
+        return sorted(out)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        """Delete least recently used entries until the cache fits in max_bytes. Returns bytes freed."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+        with self._lock:
+            self._bytes = total - freed
+        return freed
+
+    def clear(self):
+        return self.evict(0)
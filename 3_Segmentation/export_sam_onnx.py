@@ -0,0 +1,106 @@
+"""
+Export a SAM checkpoint to the two ONNX files OnnxSamModel runs.
+
+Run it once, on any machine with torch and segment-anything
+(pip install torch segment-anything onnx); the segmentation workers then
+need only onnxruntime.
+
+    python export_sam_onnx.py sam_vit_b_01ec64.pth --model-type vit_b --out-dir models
+
+writes
+- sam_encoder.onnx: sam.image_encoder. Input `images` (B, 3, 1024, 1024)
+  float32, already normalized with PIXEL_MEAN/PIXEL_STD (OnnxSamModel.encode
+  does that), output `image_embeddings` (B, 256, 64, 64). B is dynamic, so
+  `batch_size` chips go through in one call.
+- sam_decoder.onnx: the prompt decoder of segment-anything's SamOnnxModel
+  with a dynamic prompt axis on point_coords/point_labels, so a whole
+  `points_per_batch` of prompts runs in one call. It returns only
+  `iou_predictions` (P, 4) and `low_res_masks` (P, 4, 256, 256); the
+  full-resolution upscaling that scripts/export_onnx_model.py adds is left
+  out of the graph because SamBackend upsamples only the masks it keeps.
+
+The stock decoder from scripts/export_onnx_model.py also works with
+OnnxSamModel, one prompt per call.
+"""
+import argparse
+import os
+
+
+##################
+
+def build_decoder(sam):
+    """torch module: SamOnnxModel's prompt decoder without the mask upscaling."""
+    import torch
+    from segment_anything.utils.onnx import SamOnnxModel
+
+    class PromptBatchDecoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.onnx_model = SamOnnxModel(sam, return_single_mask=False)
+
+        def forward(self, image_embeddings, point_coords, point_labels, mask_input, has_mask_input):
+            m = self.onnx_model
+            sparse = m._embed_points(point_coords, point_labels)
+            dense = m._embed_masks(mask_input, has_mask_input)
+            masks, scores = m.model.mask_decoder.predict_masks(
+                image_embeddings=image_embeddings,
+                image_pe=m.model.prompt_encoder.get_dense_pe(),
+                sparse_prompt_embeddings=sparse,
+                dense_prompt_embeddings=dense,
+            )
+            return scores, masks
+
+    return PromptBatchDecoder().eval()
+
+
+def export(checkpoint, model_type='vit_b', out_dir='.', opset=17):
+    """Write sam_encoder.onnx and sam_decoder.onnx to out_dir; returns both paths."""
+    import torch
+    from segment_anything import sam_model_registry
+
+    sam = sam_model_registry[model_type](checkpoint=checkpoint).eval()
+    size = sam.image_encoder.img_size
+    os.makedirs(out_dir, exist_ok=True)
+    encoder_path = os.path.join(out_dir, 'sam_encoder.onnx')
+    decoder_path = os.path.join(out_dir, 'sam_decoder.onnx')
+
+    with torch.no_grad():
+        torch.onnx.export(
+            sam.image_encoder, (torch.randn(1, 3, size, size),), encoder_path,
+            input_names=['images'], output_names=['image_embeddings'],
+            dynamic_axes={'images': {0: 'batch'}, 'image_embeddings': {0: 'batch'}},
+            opset_version=opset, dynamo=False,
+        )
+        dim = sam.prompt_encoder.embed_dim
+        h, w = sam.prompt_encoder.image_embedding_size
+        mask_size = [4 * h, 4 * w]
+        inputs = (
+            torch.randn(1, dim, h, w),
+            torch.randint(0, size, (2, 2, 2), dtype=torch.float),
+            torch.tensor([[1, -1], [1, -1]], dtype=torch.float),
+            torch.zeros(1, 1, *mask_size),
+            torch.zeros(1),
+        )
+        torch.onnx.export(
+            build_decoder(sam), inputs, decoder_path,
+            input_names=['image_embeddings', 'point_coords', 'point_labels', 'mask_input',
+                         'has_mask_input'],
+            output_names=['iou_predictions', 'low_res_masks'],
+            dynamic_axes={'point_coords': {0: 'prompts', 1: 'num_points'},
+                          'point_labels': {0: 'prompts', 1: 'num_points'},
+                          'iou_predictions': {0: 'prompts'}, 'low_res_masks': {0: 'prompts'}},
+            opset_version=opset, dynamo=False,
+        )
+    return encoder_path, decoder_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('checkpoint', nargs='?', default=None,
+                        help='SAM .pth checkpoint (omit for random weights, to test the export)')
+    parser.add_argument('--model-type', default='vit_b', choices=['vit_b', 'vit_l', 'vit_h'])
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+    for path in export(args.checkpoint, args.model_type, args.out_dir, args.opset):
+        print(path)
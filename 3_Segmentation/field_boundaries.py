@@ -0,0 +1,255 @@
+"""
+In-memory process_field_boundaries on GeoPandas / Shapely 2 arrays.
+
+segmet_func.process_field_boundaries runs each step as an arcpy tool and
+writes a temporary shapefile after every one (_temp_proj, _temp_ovl,
+_temp_single, _temp_erode, _temp_filt, _temp_final, _diff, _diff_erode,
+_diff_erode_sp, _diff_sel, _diff_buf). Here the same steps run on geometry
+arrays, and only the final `<base>_clean.shp` is written:
+1. Project: to the CRS picked from the first shapefile (its own if
+   projected, else the UTM zone of its centre), for every file, as the
+   arcpy version does with fcs[0]
+2. CountOverlappingFeatures: node all outlines, polygonize the faces and
+   count the inputs over each face (COUNT_)
+3. MultipartToSinglepart
+4. Buffer -20 m
+5. Area and cmpness (4 pi A / P^2), keep Area >= min_area_sqm and
+   cmpness >= compactness_threshold
+6. Buffer +20 m
+7. Keep the fields that overlap `<mask_base>_mask_final.shp` (the
+   Intersect + SelectLayerByLocation pair)
+8. SymDiff of the kept fields and the mask, buffer -20 m, explode, keep
+   parts >= 300000 m2 that do not intersect the fields, buffer +20 m, and
+   merge them with the fields
+
+Buffers are planar in the projected CRS (the arcpy +20 m used GEODESIC, the
+same at tile scale) with round joins. Spatial selections use an STRtree.
+Runs on Linux without ArcGIS.
+
+    process_field_boundaries(input_folder, output_folder, mask_folder)
+"""
+import os
+import glob
+import math
+
+import numpy as np
+
+
+##################
+
+MIN_AREA_SQM = 50000
+COMPACTNESS_THRESHOLD = 0.3
+BUFFER_M = 20
+DIFF_MIN_AREA_SQM = 300000
+
+
+def suitable_projected_crs(gdf):
+    """The layer's CRS if projected, else the WGS84 UTM zone of its centre (as get_suitable_projected_sr)."""
+    if gdf.crs is not None and gdf.crs.is_projected:
+        return gdf.crs
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    lon, lat = (xmin + xmax) / 2.0, (ymin + ymax) / 2.0
+    zone = int((lon + 180) / 6) + 1
+    epsg = (32600 if lat >= 0 else 32700) + zone
+    print(f"Auto‐selected UTM zone {zone} (EPSG:{epsg})")
+    return f"EPSG:{epsg}"
+
+
+def count_overlaps(geoms):
+    """
+    CountOverlappingFeatures: (faces, COUNT_) of the planar overlay of `geoms`.
+
+    Faces covered by no input (holes) are left out.
+    """
+    import shapely
+    geoms = np.asarray(geoms, dtype=object)
+    if len(geoms) == 0:
+        return geoms, np.zeros(0, dtype=np.int64)
+    lines = shapely.union_all(shapely.boundary(geoms))
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(lines)))
+    points = shapely.point_on_surface(faces)
+    tree = shapely.STRtree(geoms)
+    face_idx, _ = tree.query(points, predicate='within')
+    counts = np.bincount(face_idx, minlength=len(faces))
+    keep = counts > 0
+    return faces[keep], counts[keep]
+
+
+def area_compactness(geoms):
+    """(Area, cmpness) arrays, as add_area_cmp."""
+    import shapely
+    area = shapely.area(geoms)
+    peri = shapely.length(geoms)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cmp = np.where(peri > 0, 4 * math.pi * area / (peri * peri), 0.0)
+    return area, cmp
+
+
+def _buffer(geoms, distance):
+    import shapely
+    out = shapely.buffer(geoms, distance, quad_segs=8, join_style='round')
+    return out, ~shapely.is_empty(out)
+
+
+def _intersects(geoms, others):
+    """Boolean per geom: overlaps (not just touches) any of `others`."""
+    import shapely
+    hit = np.zeros(len(geoms), dtype=bool)
+    if len(geoms) == 0 or len(others) == 0:
+        return hit
+    i, j = shapely.STRtree(others).query(geoms, predicate='intersects')
+    real = ~shapely.touches(geoms[i], others[j])
+    hit[i[real]] = True
+    return hit
+
+
+def _difference_local(geoms, others):
+    """geoms[k] minus the union of the `others` that intersect it (STRtree-local unions)."""
+    import shapely
+    out = geoms.copy()
+    if len(geoms) == 0 or len(others) == 0:
+        return out
+    i, j = shapely.STRtree(others).query(geoms, predicate='intersects')
+    if len(i) == 0:
+        return out
+    starts = np.flatnonzero(np.r_[True, i[1:] != i[:-1]])
+    idx = i[starts]
+    unions = np.array([shapely.union_all(others[group]) for group in np.split(j, starts[1:])],
+                      dtype=object)
+    out[idx] = shapely.difference(geoms[idx], unions)
+    return out
+
+
+def symmetric_difference(a, b):
+    """SymDiff of two polygon layers: each feature minus the other layer, as singlepart-ready pieces."""
+    import shapely
+    pieces = np.concatenate([_difference_local(a, b), _difference_local(b, a)])
+    return pieces[~shapely.is_empty(pieces)]
+
+
+##################
+
+def clean_field_boundaries(gdf, mask_gdf=None, min_area_sqm=MIN_AREA_SQM,
+                           compactness_threshold=COMPACTNESS_THRESHOLD, buffer_m=BUFFER_M,
+                           diff_min_area_sqm=DIFF_MIN_AREA_SQM, crs=None):
+    """
+    Steps 1-8 of process_field_boundaries on one layer; returns the _clean GeoDataFrame.
+
+    crs: projected CRS to work in; None picks one for this layer
+    (suitable_projected_crs).
+    Returns None when no part passes the area/compactness filter (the arcpy
+    version skips those files). Without a mask, the filtered fields are
+    returned unmasked and step 8 is skipped.
+    """
+    import shapely
+    import geopandas as gpd
+
+    # 1) Project
+    if crs is None:
+        crs = suitable_projected_crs(gdf)
+    geoms = np.asarray(gdf.to_crs(crs).geometry.array)
+    geoms = shapely.make_valid(geoms[~shapely.is_empty(geoms) & ~shapely.is_missing(geoms)])
+
+    # 2) Count overlaps  3) Multipart -> singlepart
+    faces, counts = count_overlaps(shapely.get_parts(geoms))
+    parts, part_idx = shapely.get_parts(faces, return_index=True)
+    counts = counts[part_idx]
+
+    # 4) Buffer -20m
+    eroded, nonempty = _buffer(parts, -buffer_m)
+    eroded, counts = eroded[nonempty], counts[nonempty]
+
+    # 5) Area & compactness + filter
+    area, cmp = area_compactness(eroded)
+    keep = (area >= min_area_sqm) & (cmp >= compactness_threshold)
+    if not keep.any():
+        print("  ✖ no parts pass area/compactness; skipping.")
+        return None
+    eroded, counts, area, cmp = eroded[keep], counts[keep], area[keep], cmp[keep]
+
+    # 6) Buffer +20m
+    final, _ = _buffer(eroded, buffer_m)
+    fields = gpd.GeoDataFrame({'COUNT_': counts, 'Area': area, 'cmpness': cmp},
+                              geometry=final, crs=crs)
+    if mask_gdf is None:
+        return fields
+
+    # 7) Keep fields that overlap the mask
+    mask = np.asarray(mask_gdf.to_crs(crs).geometry.array)
+    mask = shapely.make_valid(mask[~shapely.is_empty(mask) & ~shapely.is_missing(mask)])
+    fields = fields[_intersects(final, mask)].reset_index(drop=True)
+    out = np.asarray(fields.geometry.array)
+
+    # 8) SymDiff with the mask, shrink, explode, keep large parts clear of the fields, grow
+    diff, _ = _buffer(symmetric_difference(out, mask), -buffer_m)
+    diff = shapely.get_parts(diff[~shapely.is_empty(diff)])
+    diff_area = shapely.area(diff)
+    sel = diff_area >= diff_min_area_sqm
+    diff, diff_area = diff[sel], diff_area[sel]
+    clear = ~_intersects(diff, out)
+    diff, diff_area = diff[clear], diff_area[clear]
+    diff_buf, _ = _buffer(diff, buffer_m)
+    extra = gpd.GeoDataFrame({'Area_sqm': diff_area}, geometry=diff_buf, crs=crs)
+
+    import pandas as pd
+    return gpd.GeoDataFrame(pd.concat([fields, extra], ignore_index=True), crs=crs)
+
+
+def _base_name(shp):
+    name = os.path.splitext(os.path.basename(shp))[0]
+    # strip off "_with_otsu" or any other suffix if needed:
+    return name.rsplit("_with_otsu", 1)[0]
+
+
+def process_file(shp, output_folder, mask_folder, min_area_sqm=MIN_AREA_SQM,
+                 compactness_threshold=COMPACTNESS_THRESHOLD, crs=None):
+    """Clean one boundary shapefile into `<output_folder>/<base>_clean.shp`; returns its path or None."""
+    import geopandas as gpd
+
+    base = _base_name(shp)
+    print(f"\n▶ Processing {os.path.basename(shp)} → base='{base}'")
+    mask_base = base[len("Boundary_"):] if base.startswith("Boundary_") else base
+    mask_fc = os.path.join(str(mask_folder), f"{mask_base}_mask_final.shp")
+    mask_gdf = gpd.read_file(mask_fc) if os.path.exists(mask_fc) else None
+    if mask_gdf is None:
+        print(f"  ✖ Mask not found: {mask_fc}. Writing unmasked final.")
+
+    clean = clean_field_boundaries(gpd.read_file(shp), mask_gdf, min_area_sqm, compactness_threshold,
+                                   crs=crs)
+    if clean is None:
+        return None
+    os.makedirs(str(output_folder), exist_ok=True)
+    out_fc = os.path.join(str(output_folder), f"{base}_clean.shp")
+    clean.to_file(out_fc, driver="ESRI Shapefile")
+    print(f"  ✔ saved {len(clean)} fields: {out_fc}")
+    return out_fc
+
+
+def _process_args(args):
+    return process_file(*args)
+
+
+def process_field_boundaries(input_folder, output_folder, mask_folder,
+                             min_area_sqm=MIN_AREA_SQM, compactness_threshold=COMPACTNESS_THRESHOLD,
+                             workers=1):
+    """
+    Same inputs and `<base>_clean.shp` outputs as segmet_func.process_field_boundaries.
+
+    Every file is projected to the CRS picked from the first one, as the
+    arcpy version does. workers > 1 cleans files in parallel processes.
+    """
+    import geopandas as gpd
+
+    fcs = sorted(glob.glob(os.path.join(str(input_folder), "*.shp")))
+    if not fcs:
+        print("No shapefiles found."); return []
+    crs = suitable_projected_crs(gpd.read_file(fcs[0]))
+    args = [(shp, output_folder, mask_folder, min_area_sqm, compactness_threshold, crs) for shp in fcs]
+    if workers > 1:
+        from multiprocessing import Pool
+        with Pool(workers) as pool:
+            outputs = pool.map(_process_args, args)
+    else:
+        outputs = [process_file(*a) for a in args]
+    print(f"\n✅ All done – outputs in {output_folder}")
+    return [o for o in outputs if o]
@@ -0,0 +1,179 @@
+"""
+Polygonize SAM masks straight from label rasters, with vertex reduction.
+
+At 10 m, a mask outline follows the pixel edges: a staircase with a vertex at
+every pixel corner. Those vertices are carried through every Part 4 step
+(Project, CountOverlappingFeatures, the +-20 m buffers, SymDiff,
+Intersect), and the cost of each step grows with them.
+
+Here the masks of a chip are packed into a few label rasters of
+non-overlapping masks (pack_labels). Each label raster is vectorized in
+one rasterio.features.shapes pass. The result is a polygon coverage in
+which neighbouring fields share their edges exactly, so it is simplified
+with shapely.coverage_simplify. That is Visvalingam-Whyatt on the shared
+edges, so the coverage stays gap- and overlap-free. It only drops vertices,
+so the ones left are still pixel-grid corners. A tolerance of 1 pixel
+removes the one-pixel steps and keeps real corners.
+
+geometry_stats gives the vertex count and WKB bytes before and after, and
+SamBackend reports them in backend.stats. For outputs of the ArcGIS tool
+(overlapping polygons), simplify_shapefile simplifies each polygon with
+preserve_topology instead.
+"""
+import numpy as np
+
+
+##################
+
+TOLERANCE_PIXELS = 1.0
+
+
+def geometry_stats(geoms):
+    """{'features', 'vertices', 'bytes' (WKB)} of an array of geometries."""
+    import shapely
+    geoms = np.asarray(geoms, dtype=object)
+    if len(geoms) == 0:
+        return {'features': 0, 'vertices': 0, 'bytes': 0}
+    return {'features': len(geoms),
+            'vertices': int(shapely.get_num_coordinates(geoms).sum()),
+            'bytes': int(sum(len(b) for b in shapely.to_wkb(geoms)))}
+
+
+def add_stats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def format_reduction(before, after):
+    if not before.get('vertices'):
+        return "no polygons"
+    return (f"{before['vertices']:,} → {after['vertices']:,} vertices "
+            f"({100.0 * after['vertices'] / before['vertices']:.0f}%), "
+            f"{before['bytes'] / 1e6:.2f} → {after['bytes'] / 1e6:.2f} MB")
+
+
+def simplify_coverage(geoms, tolerance):
+    """Coverage-preserving simplification (per-polygon preserve_topology on Shapely < 2.1)."""
+    import shapely
+    geoms = np.asarray(geoms, dtype=object)
+    if not tolerance or len(geoms) == 0:
+        return geoms
+    if hasattr(shapely, 'coverage_simplify'):
+        out = shapely.coverage_simplify(geoms, tolerance)
+    else:
+        out = shapely.simplify(geoms, tolerance, preserve_topology=True)
+    bad = ~shapely.is_valid(out)
+    if bad.any():
+        out[bad] = shapely.make_valid(out[bad])
+    return out
+
+
+##################
+
+def pack_labels(masks, boxes=None, shape=None):
+    """
+    Pack boolean masks into label rasters of non-overlapping masks.
+
+    masks: (N, H, W) array, or with `shape` = (H, W) a list of masks cropped
+    to their `boxes` (x0, y0, x1, y1), as SamBackend.decode_chip returns.
+    Each mask goes to the first layer where it overlaps nothing. Returns
+    (layers: list of (H, W) int32 arrays, 1-based labels; where: (N, 2)
+    array of (layer, label) per mask).
+    """
+    if shape is None:
+        shape = masks.shape[1:]
+        if boxes is None:
+            from sam_backend import mask_boxes
+            boxes = mask_boxes(masks)
+        masks = [m[y0:y1, x0:x1] for m, (x0, y0, x1, y1) in zip(masks, boxes)]
+    layers, where = [], np.zeros((len(masks), 2), dtype=np.int64)
+    counts = []
+    for k, (sub, (x0, y0, x1, y1)) in enumerate(zip(masks, boxes)):
+        for li, layer in enumerate(layers):
+            if not (layer[y0:y1, x0:x1][sub] > 0).any():
+                break
+        else:
+            layers.append(np.zeros(shape, dtype=np.int32))
+            counts.append(0)
+            li = len(layers) - 1
+        counts[li] += 1
+        layers[li][y0:y1, x0:x1][sub] = counts[li]
+        where[k] = li, counts[li]
+    return layers, where
+
+
+def polygonize_labels(labels, transform, tolerance=TOLERANCE_PIXELS):
+    """
+    Vectorize one label raster (0 = background) and simplify it as a coverage.
+
+    tolerance is in pixels (0 or None keeps the staircase). Returns
+    (label values, geometries, stats before, stats after). Labels with
+    several parts come back as one MultiPolygon.
+    """
+    import shapely
+    from rasterio.features import shapes
+
+    parts, values = [], []
+    for geom, value in shapes(labels, mask=labels > 0, transform=transform, connectivity=4):
+        parts.append(shapely.geometry.shape(geom))
+        values.append(int(value))
+    parts = np.array(parts, dtype=object)
+    values = np.array(values, dtype=np.int64)
+    before = geometry_stats(parts)
+    parts = simplify_coverage(parts, (tolerance or 0) * abs(transform.a))
+    after = geometry_stats(parts)
+
+    order = np.argsort(values, kind='stable')
+    parts, values = parts[order], values[order]
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else []
+    ids, geoms = [], []
+    for group, start in zip(np.split(parts, starts[1:]) if len(values) else [], starts):
+        polys = [p for g in group for p in shapely.get_parts(g) if not p.is_empty]
+        if not polys:
+            continue
+        ids.append(values[start])
+        geoms.append(polys[0] if len(polys) == 1 else shapely.MultiPolygon(polys))
+    return np.array(ids, dtype=np.int64), np.array(geoms, dtype=object), before, after
+
+
+def polygonize_masks(masks, transform, tolerance=TOLERANCE_PIXELS, boxes=None, shape=None):
+    """
+    One geometry per boolean mask (None where a mask vanished), plus stats before/after.
+
+    Masks may overlap; they are packed into label layers first. masks,
+    boxes and shape as in pack_labels.
+    """
+    layers, where = pack_labels(masks, boxes, shape)
+    geoms = np.full(len(masks), None, dtype=object)
+    before, after = {}, {}
+    for li, layer in enumerate(layers):
+        ids, layer_geoms, b, a = polygonize_labels(layer, transform, tolerance)
+        add_stats(before, b)
+        add_stats(after, a)
+        lookup = dict(zip(ids.tolist(), layer_geoms))
+        for k in np.flatnonzero(where[:, 0] == li):
+            geoms[k] = lookup.get(int(where[k, 1]))
+    return geoms, before, after
+
+
+##################
+
+def simplify_gdf(gdf, tolerance):
+    """Per-polygon topology-preserving simplification (tolerance in CRS units) of possibly overlapping polygons."""
+    import shapely
+    out = gdf.copy()
+    geoms = shapely.simplify(np.asarray(gdf.geometry.array), tolerance, preserve_topology=True)
+    out = out.set_geometry(shapely.make_valid(geoms), crs=gdf.crs)
+    return out[~out.geometry.is_empty].reset_index(drop=True)
+
+
+def simplify_shapefile(in_shp, out_shp=None, tolerance=10.0, verbose=True):
+    """Simplify a Boundary_*.shp (e.g. from the ArcGIS tool); overwrites in place by default."""
+    import geopandas as gpd
+    gdf = gpd.read_file(in_shp)
+    out = simplify_gdf(gdf, tolerance)
+    if verbose:
+        print(f"{in_shp}: {format_reduction(geometry_stats(gdf.geometry.array), geometry_stats(out.geometry.array))}")
+    out.to_file(str(out_shp or in_shp), driver="ESRI Shapefile")
+    return out
@@ -0,0 +1,593 @@
+"""
+Segmentation backends: RGB raster in, field polygons out.
+
+The notebook calls arcpy.ia.DetectObjectsUsingDeepLearning(raster, out_fc,
+sam_model, batch_options), which needs ArcGIS Pro. Here the same call goes
+through a backend:
+- ArcpyBackend: the ArcGIS tool, unchanged (Windows, ArcGIS Pro)
+- SamBackend: open-source SAM automatic mask generation on CPU, for
+  ordinary Linux workers. It needs numpy, scipy, rasterio, shapely and
+  geopandas, plus onnxruntime for OnnxSamModel.
+
+Both take the `batch_options` of the notebook (padding, batch_size,
+points_per_batch, box_nms_thresh, stability_score_thresh,
+min_mask_region_area) and return a GeoDataFrame with Class and Confidence
+columns, as the ArcGIS tool writes.
+
+SamBackend cuts the raster into model-sized chips that overlap by
+`padding` pixels on each side. Chips go through the image encoder in groups
+of `batch_size`, `workers` groups at a time in a thread pool. For each chip,
+a grid of point prompts is decoded `points_per_batch` at a time. Masks are
+filtered by predicted IoU and stability score, upsampled one at a time and
+kept cropped to their boxes (as the RLE of SAM's automatic mask generator,
+only the box is stored), so a chip holds a few full-size arrays at most.
+They are then suppressed by box NMS and cleaned of regions under
+min_mask_region_area pixels. A mask is kept by the
+chip whose core (the chip minus its padding) holds its box centre, so each
+chip overlap is decoded twice but reported once.
+
+    backend = SamBackend(OnnxSamModel(encoder_onnx, decoder_onnx))
+    detect_objects(raster, out_fc, backend, batch_options)
+
+The two ONNX files come from a SAM checkpoint via export_sam_onnx.py.
+
+A model is any object with `image_size`, `version`, `encode` and `decode`
+(see OnnxSamModel). TinySamModel is a small randomly-initialized NumPy
+model for trying the pipeline without model weights.
+"""
+import os
+import abc
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+
+##################
+
+# ArcGIS SAM defaults, plus the SAM automatic mask generator defaults for the
+# options the ArcGIS tool does not expose
+DEFAULT_OPTIONS = {
+    'padding': 256,
+    'batch_size': 10,
+    'points_per_batch': 64,
+    'box_nms_thresh': 0.7,
+    'stability_score_thresh': 0.95,
+    'min_mask_region_area': 0,
+    'points_per_side': 32,
+    'pred_iou_thresh': 0.88,
+}
+STABILITY_OFFSET = 1.0
+MASK_THRESHOLD = 0.0
+PIXEL_MEAN = np.array([123.675, 116.28, 103.53], dtype=np.float32)
+PIXEL_STD = np.array([58.395, 57.12, 57.375], dtype=np.float32)
+
+
+def parse_batch_options(batch_options=None):
+    """
+    Options dict from the notebook's batch_options.
+
+    Accepts "padding 256;batch_size 10;..." strings, the tuple the notebook
+    passes to the ArcGIS tool (the first item is used) or a dict. Missing
+    options take DEFAULT_OPTIONS.
+    """
+    options = dict(DEFAULT_OPTIONS)
+    if isinstance(batch_options, (tuple, list)):
+        batch_options = batch_options[0] if batch_options else None
+    if isinstance(batch_options, dict):
+        options.update(batch_options)
+    elif batch_options:
+        for item in str(batch_options).split(';'):
+            parts = item.split()
+            if len(parts) == 2:
+                options[parts[0]] = parts[1]
+    for key, value in options.items():
+        value = float(value)
+        options[key] = int(value) if value.is_integer() and key in (
+            'padding', 'batch_size', 'points_per_batch', 'points_per_side',
+            'min_mask_region_area') else value
+    return options
+
+
+##################
+
+class OnnxSamModel:
+    """
+    SAM exported to ONNX, run with onnxruntime on CPU.
+
+    encoder_path: encoder with input (B, 3, S, S) float32, normalized with
+        PIXEL_MEAN/PIXEL_STD, and output image embeddings.
+    decoder_path: prompt decoder. export_sam_onnx.py writes both files; its
+        decoder takes a batch of prompts per call and skips the
+        full-resolution masks. The stock decoder of segment-anything
+        (scripts/export_onnx_model.py) also works, one prompt per call.
+    threads: intra-op threads per session (default: all cores).
+    """
+
+    OUTPUTS = ['iou_predictions', 'low_res_masks']
+
+    def __init__(self, encoder_path, decoder_path, image_size=1024, threads=None):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        providers = ['CPUExecutionProvider']
+        self.encoder = ort.InferenceSession(str(encoder_path), opts, providers=providers)
+        self.decoder = ort.InferenceSession(str(decoder_path), opts, providers=providers)
+        self.image_size = image_size
+        self.version = _file_version(encoder_path, decoder_path)
+        self._encoder_input = self.encoder.get_inputs()[0].name
+        inputs = {i.name: i for i in self.decoder.get_inputs()}
+        self._decoder_inputs = set(inputs)
+        # the stock export fixes the prompt axis at 1; ours leaves it symbolic
+        self.prompt_batch = not isinstance(inputs['point_coords'].shape[0], int)
+
+    def encode(self, images):
+        """(B, S, S, 3) uint8 chips -> (B, C, h, w) float32 embeddings."""
+        x = ((images.astype(np.float32) - PIXEL_MEAN) / PIXEL_STD).transpose(0, 3, 1, 2)
+        return self.encoder.run(None, {self._encoder_input: np.ascontiguousarray(x)})[0]
+
+    def decode(self, embedding, points):
+        """
+        Masks for a batch of single-point prompts on one chip.
+
+        embedding: (C, h, w) of one chip; points: (P, 2) x, y in chip pixels.
+        Returns (low-resolution mask logits (P, 3, m, m), predicted IoU (P, 3)),
+        the three multimask outputs SAM's automatic mask generator uses.
+        """
+        n = len(points)
+        # each prompt is the point plus the padding point SAM expects without a box
+        coords = np.zeros((n, 2, 2), dtype=np.float32)
+        coords[:, 0] = points
+        labels = np.tile(np.array([[1, -1]], dtype=np.float32), (n, 1))
+        feed = {
+            'image_embeddings': embedding[None].astype(np.float32),
+            'mask_input': np.zeros((1, 1, 256, 256), dtype=np.float32),
+            'has_mask_input': np.zeros(1, dtype=np.float32),
+            'orig_im_size': np.array([self.image_size, self.image_size], dtype=np.float32),
+        }
+        feed = {k: v for k, v in feed.items() if k in self._decoder_inputs}
+        if self.prompt_batch:
+            iou, low_res = self.decoder.run(self.OUTPUTS, dict(feed, point_coords=coords,
+                                                               point_labels=labels))
+        else:
+            runs = [self.decoder.run(self.OUTPUTS, dict(feed, point_coords=coords[k:k + 1],
+                                                        point_labels=labels[k:k + 1]))
+                    for k in range(n)]
+            iou = np.concatenate([r[0] for r in runs])
+            low_res = np.concatenate([r[1] for r in runs])
+        # drop the single-mask token, as multimask_output=True does
+        if iou.shape[1] == 4:
+            iou, low_res = iou[:, 1:], low_res[:, 1:]
+        return low_res, iou
+
+
+class TinySamModel:
+    """
+    Randomly-initialized stand-in with the SAM model interface.
+
+    The encoder average-pools the chip to 1/16 resolution and projects the
+    colours to `dim` random features; the decoder scores every cell by its
+    feature similarity to the prompt cell. Masks follow colour regions but
+    mean nothing; use it to exercise chipping, batching and postprocessing.
+    """
+
+    def __init__(self, image_size=256, dim=8, seed=0):
+        rng = np.random.default_rng(seed)
+        self.image_size = image_size
+        self.weights = rng.normal(size=(3, dim)).astype(np.float32)
+        self.version = f'tiny-{image_size}-{dim}-{seed}'
+
+    def encode(self, images):
+        b, s = images.shape[0], self.image_size
+        x = ((images.astype(np.float32) - PIXEL_MEAN) / PIXEL_STD)
+        x = x.reshape(b, s // 16, 16, s // 16, 16, 3).mean(axis=(2, 4))
+        return np.tanh(x @ self.weights).transpose(0, 3, 1, 2)
+
+    def decode(self, embedding, points):
+        _, h, w = embedding.shape
+        cells = np.clip((points / 16).astype(int), 0, [w - 1, h - 1])
+        prompt = embedding[:, cells[:, 1], cells[:, 0]].T
+        dist = np.linalg.norm(embedding[None] - prompt[:, :, None, None], axis=1)
+        logits = (4.0 - 8.0 * dist)[:, None]
+        iou = 1.0 / (1.0 + np.exp(-logits.mean(axis=(2, 3))))
+        return logits.astype(np.float32), np.clip(iou + 0.5, 0, 1).astype(np.float32)
+
+
+def _file_version(*paths):
+    """Short hash of the model files, so cached results follow the weights."""
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+
+##################
+
+def chip_windows(width, height, size, padding):
+    """
+    Overlapping chips over a width x height raster.
+
+    Returns [(col, row, core)] where (col, row) is the chip's top-left
+    pixel (may be negative: chips read past the edge are filled) and core
+    is the (c0, r0, c1, r1) part of the raster the chip reports masks for.
+    """
+    stride = size - 2 * padding
+    if stride <= 0:
+        raise ValueError(f"padding {padding} leaves no chip core at size {size}")
+    chips = []
+    for r in range(0, height, stride):
+        for c in range(0, width, stride):
+            chips.append((c - padding, r - padding,
+                          (c, r, min(width, c + stride), min(height, r + stride))))
+    return chips
+
+
+def point_grid(size, points_per_side):
+    """(n*n, 2) x, y prompt points at the cell centres of an n x n grid."""
+    step = size / points_per_side
+    ticks = step / 2 + step * np.arange(points_per_side)
+    xs, ys = np.meshgrid(ticks, ticks)
+    return np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32)
+
+
+def stability_scores(logits, offset=STABILITY_OFFSET, threshold=MASK_THRESHOLD):
+    """IoU between each mask thresholded at threshold + offset and at threshold - offset."""
+    high = (logits > threshold + offset).sum(axis=(-1, -2))
+    low = (logits > threshold - offset).sum(axis=(-1, -2))
+    return np.where(low > 0, high / np.maximum(low, 1), 0.0)
+
+
+def mask_boxes(masks):
+    """(N, 4) x0, y0, x1, y1 (exclusive) of each boolean mask; empty masks get zeros."""
+    boxes = np.zeros((len(masks), 4), dtype=np.int64)
+    rows, cols = masks.any(axis=2), masks.any(axis=1)
+    for i in range(len(masks)):
+        r, c = np.flatnonzero(rows[i]), np.flatnonzero(cols[i])
+        if len(r):
+            boxes[i] = c[0], r[0], c[-1] + 1, r[-1] + 1
+    return boxes
+
+
+def box_nms(boxes, scores, iou_thresh):
+    """Indices kept by greedy NMS, best score first (IoU against each kept box, O(N) memory)."""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        lt = np.maximum(boxes[i, :2], boxes[:, :2])
+        rb = np.minimum(boxes[i, 2:], boxes[:, 2:])
+        inter = np.prod(np.clip(rb - lt, 0, None), axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            suppressed |= inter / (area[i] + area - inter) > iou_thresh
+    return np.array(keep, dtype=np.int64)
+
+
+def remove_small_regions(mask, min_area, outside=None):
+    """
+    Drop islands and fill holes smaller than min_area pixels (SAM postprocessing).
+
+    outside: optional boolean margin of background pixels that stands for
+    the rest of the image (see clean_crop); holes touching it are never filled.
+    """
+    if min_area <= 0:
+        return mask
+    for fill in (False, True):
+        target = ~mask if fill else mask
+        labels, n = ndimage.label(target)
+        if n == 0:
+            continue
+        small = np.bincount(labels.ravel())[1:] < min_area
+        if fill and outside is not None:
+            open_labels = np.unique(labels[outside])
+            small[open_labels[open_labels > 0] - 1] = False
+        if small.any():
+            hit = np.concatenate([[False], small])[labels]
+            mask = mask | hit if fill else mask & ~hit
+    return mask
+
+
+def clean_crop(crop, box, size, min_area):
+    """
+    remove_small_regions of a mask cropped to its box in a size x size chip.
+
+    The crop gets a one-pixel background margin on the sides where the box
+    does not reach the chip edge: background connected to it lies outside
+    the box in the chip, so it is never a hole. Returns the cleaned crop and
+    its box, trimmed to what is left (crop None when nothing is).
+    """
+    if min_area <= 0:
+        return crop, box
+    x0, y0, x1, y1 = (int(v) for v in box)
+    pads = ((int(y0 > 0), int(y1 < size)), (int(x0 > 0), int(x1 < size)))
+    padded = np.pad(crop, pads)
+    outside = np.pad(np.zeros(crop.shape, dtype=bool), pads, constant_values=True)
+    cleaned = remove_small_regions(padded, min_area, outside)
+    cleaned = cleaned[pads[0][0]:pads[0][0] + crop.shape[0], pads[1][0]:pads[1][0] + crop.shape[1]]
+    sub = mask_boxes(cleaned[None])[0]
+    if sub[2] == 0:
+        return None, None
+    return (cleaned[sub[1]:sub[3], sub[0]:sub[2]],
+            np.array([x0 + sub[0], y0 + sub[1], x0 + sub[2], y0 + sub[3]], dtype=np.int64))
+
+
+def _upsample(logits, size):
+    """Bilinear resize of (m, m) logits to (size, size)."""
+    if logits.shape[-1] == size:
+        return logits
+    return ndimage.zoom(logits, size / logits.shape[-1], order=1)
+
+
+##################
+
+class SegmentationBackend(abc.ABC):
+    """Interface: segment(raster_path, options) -> GeoDataFrame of field polygons."""
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def segment(self, raster_path, options=None):
+        """Field polygons of one raster, with Class and Confidence columns."""
+
+
+class ArcpyBackend(SegmentationBackend):
+    """arcpy.ia.DetectObjectsUsingDeepLearning with a SAM .dlpk (ArcGIS Pro)."""
+
+    name = 'arcpy'
+
+    def __init__(self, model_path, arguments=("NMS", "Confidence", "Class", 0,
+                                               "PROCESS_AS_MOSAICKED_IMAGE")):
+        self.model_path = str(model_path)
+        self.arguments = tuple(arguments)
+
+    def detect(self, raster_path, out_fc, options=None):
+        import arcpy
+        arcpy.CheckOutExtension("ImageAnalyst")
+        args = ";".join(f"{k} {v}" for k, v in parse_batch_options(options).items()
+                        if k in ('padding', 'batch_size', 'box_nms_thresh', 'points_per_batch',
+                                 'stability_score_thresh', 'min_mask_region_area'))
+        arcpy.ia.DetectObjectsUsingDeepLearning(str(raster_path), str(out_fc), self.model_path,
+                                                args, *self.arguments)
+        return out_fc
+
+    def segment(self, raster_path, options=None):
+        import tempfile
+        import geopandas as gpd
+        with tempfile.TemporaryDirectory() as tmp:
+            out_fc = os.path.join(tmp, 'detections.shp')
+            self.detect(raster_path, out_fc, options)
+            return gpd.read_file(out_fc)
+
+
+class SamBackend(SegmentationBackend):
+    """
+    SAM automatic mask generation on CPU over overlapping chips.
+
+    model: OnnxSamModel, TinySamModel or any object with the same interface.
+    workers: chip batches encoded at once (threads). onnxruntime releases
+        the GIL, so threads share the cores; give the model
+        threads=cores // workers to avoid oversubscription.
+    cache: optional embedding_cache.EmbeddingCache. Cached chips skip the
+        encoder, so reruns with other decoder options only decode.
+    stitch: merge or drop polygons that chips report twice along their
+        seams (seam_merge.stitch_seams) before returning.
+    min_valid_fraction: chips whose core has a smaller share of non-fill
+        pixels (chip_screen.py, read from overviews) are not segmented.
+        0 segments every chip.
+    simplify: coverage simplification tolerance in pixels for the mask
+        outlines (polygonize.py); 0 keeps the pixel staircase.
+    """
+
+    name = 'sam'
+
+    def __init__(self, model, workers=None, cache=None, stitch=True, min_valid_fraction=0.02,
+                 simplify=1.0):
+        self.model = model
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 1) // 2))
+        self.cache = cache
+        self.stitch = stitch
+        self.min_valid_fraction = min_valid_fraction
+        self.simplify = simplify
+        self.stats = {}
+
+    def encode_chips(self, raster_path, chips, content_hash=None):
+        """
+        Embeddings of the chips at (col, row), in order, and the number encoded.
+
+        With a cache and the raster's content_hash, cached chips are read
+        back and only the others go through the encoder, in one batch.
+        """
+        size = self.model.image_size
+        if self.cache is None or content_hash is None:
+            return self.model.encode(np.stack([read_chip(raster_path, c, r, size)
+                                               for c, r in chips])), len(chips)
+        from embedding_cache import embedding_key
+        keys = [embedding_key(content_hash, c, r, size, self.model.version) for c, r in chips]
+        embeddings = [self.cache.get(k) for k in keys]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            encoded = self.model.encode(np.stack([read_chip(raster_path, *chips[i], size)
+                                                  for i in missing]))
+            for i, e in zip(missing, encoded):
+                self.cache.put(keys[i], e)
+                embeddings[i] = e
+        return embeddings, len(missing)
+
+    def decode_chip(self, embedding, options):
+        """
+        Masks of one chip after filtering and NMS: (crops, boxes, scores).
+
+        Each mask is a boolean array cropped to its (x0, y0, x1, y1) box in
+        chip pixels; masks are upsampled one at a time, so no batch of
+        full-resolution logits is ever held.
+        """
+        size = self.model.image_size
+        points = point_grid(size, options['points_per_side'])
+        crops, scores, boxes = [], [], []
+        for start in range(0, len(points), options['points_per_batch']):
+            low_res, iou = self.model.decode(embedding, points[start:start + options['points_per_batch']])
+            low_res = low_res.reshape(-1, *low_res.shape[-2:])
+            iou = iou.ravel()
+            for k in np.flatnonzero(iou > options['pred_iou_thresh']):
+                logits = _upsample(low_res[k], size)
+                if stability_scores(logits) < options['stability_score_thresh']:
+                    continue
+                mask = logits > MASK_THRESHOLD
+                box = mask_boxes(mask[None])[0]
+                if box[2] == 0:
+                    continue
+                crops.append(mask[box[1]:box[3], box[0]:box[2]])
+                boxes.append(box)
+                scores.append(iou[k])
+        if not crops:
+            return [], np.zeros((0, 4), dtype=np.int64), np.zeros(0)
+        keep = box_nms(np.array(boxes), np.array(scores), options['box_nms_thresh'])
+        out_crops, out_boxes, out_scores = [], [], []
+        for i in keep:
+            crop, box = clean_crop(crops[i], boxes[i], size, options['min_mask_region_area'])
+            if crop is not None:
+                out_crops.append(crop)
+                out_boxes.append(box)
+                out_scores.append(scores[i])
+        return out_crops, np.array(out_boxes, dtype=np.int64).reshape(-1, 4), np.array(out_scores)
+
+    def chip_polygons(self, crops, boxes, scores, col, row, core, transform):
+        """
+        Polygons of the masks whose box centre lies in the chip core (raster CRS).
+
+        crops, boxes, scores as decode_chip returns them. Returns
+        ([(geometry, score)], vertex stats before, after simplification).
+        """
+        from affine import Affine
+        from polygonize import polygonize_masks
+        c0, r0, c1, r1 = core
+        cx, cy = col + (boxes[:, 0] + boxes[:, 2]) / 2.0, row + (boxes[:, 1] + boxes[:, 3]) / 2.0
+        keep = (c0 <= cx) & (cx < c1) & (r0 <= cy) & (cy < r1)
+        if not keep.any():
+            return [], {}, {}
+        size = self.model.image_size
+        geoms, before, after = polygonize_masks([crops[i] for i in np.flatnonzero(keep)],
+                                                transform * Affine.translation(col, row),
+                                                self.simplify, boxes[keep], shape=(size, size))
+        records = [(g, float(s)) for g, s in zip(geoms, scores[keep]) if g is not None]
+        return records, before, after
+
+    def segment(self, raster_path, options=None):
+        import rasterio
+        import geopandas as gpd
+
+        options = parse_batch_options(options)
+        with rasterio.open(raster_path) as src:
+            width, height, transform, crs = src.width, src.height, src.transform, src.crs
+        all_chips = chip_windows(width, height, self.model.image_size, options['padding'])
+        from chip_screen import screen_chips
+        from polygonize import add_stats
+        chips, skipped = screen_chips(raster_path, all_chips, self.min_valid_fraction)
+        groups = [chips[i:i + options['batch_size']] for i in range(0, len(chips), options['batch_size'])]
+
+        content_hash = None
+        if self.cache is not None:
+            from embedding_cache import raster_hash
+            content_hash = raster_hash(raster_path)
+
+        def run_group(group):
+            embeddings, n_encoded = self.encode_chips(raster_path, [(c, r) for c, r, _ in group],
+                                                      content_hash)
+            records, before, after = [], {}, {}
+            for (col, row, core), embedding in zip(group, embeddings):
+                crops, boxes, scores = self.decode_chip(np.asarray(embedding), options)
+                chip_records, b, a = self.chip_polygons(crops, boxes, scores, col, row, core, transform)
+                records += chip_records
+                add_stats(before, b)
+                add_stats(after, a)
+            return records, n_encoded, before, after
+
+        records, encoded, calls, before, after = [], 0, 0, {}, {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for i in range(0, len(groups), self.workers):
+                for group_records, n_encoded, b, a in pool.map(run_group, groups[i:i + self.workers]):
+                    records += group_records
+                    encoded += n_encoded
+                    calls += n_encoded > 0
+                    add_stats(before, b)
+                    add_stats(after, a)
+        gdf = gpd.GeoDataFrame({'Class': ['field'] * len(records),
+                                'Confidence': [100.0 * s for _, s in records]},
+                               geometry=[g for g, _ in records], crs=crs)
+        if self.stitch:
+            from seam_merge import stitch_seams, chip_seams
+            gdf = stitch_seams(gdf, chip_seams(transform, width, height, self.model.image_size,
+                                               options['padding']))
+        self.stats = {'chips': len(all_chips), 'skipped_chips': skipped, 'encoded_chips': encoded,
+                      'cached_chips': len(chips) - encoded, 'encoder_calls': calls,
+                      'masks': len(records), 'polygons': len(gdf),
+                      'vertices_before': before.get('vertices', 0), 'vertices_after': after.get('vertices', 0),
+                      'bytes_before': before.get('bytes', 0), 'bytes_after': after.get('bytes', 0)}
+        return gdf
+
+
+def read_chip(raster_path, col, row, size):
+    """(size, size, 3) uint8 chip with its top-left at (col, row); outside the raster is 0."""
+    import rasterio
+    from rasterio.windows import Window
+    with rasterio.open(raster_path) as src:
+        data = src.read([1, 2, 3], window=Window(col, row, size, size), boundless=True, fill_value=0)
+    return np.clip(data, 0, 255).astype(np.uint8).transpose(1, 2, 0)
+
+
+##################
+
+def format_stats(stats):
+    """One line of SamBackend.stats, e.g. for the notebook loop."""
+    if not stats:
+        return ''
+    from polygonize import format_reduction
+    reduction = format_reduction({'vertices': stats['vertices_before'], 'bytes': stats['bytes_before']},
+                                 {'vertices': stats['vertices_after'], 'bytes': stats['bytes_after']})
+    return (f"{stats['chips']} chips: {stats['skipped_chips']} skipped as fill, "
+            f"{stats['encoded_chips']} encoded, {stats['cached_chips']} from cache → "
+            f"{stats['polygons']} polygons; {reduction}")
+
+
+def detect_objects(raster, out_fc, backend, batch_options=None, verbose=True):
+    """
+    Drop-in for arcpy.ia.DetectObjectsUsingDeepLearning(raster, out_fc, model, batch_options).
+
+    Runs `backend` and writes its polygons to `out_fc` (shapefile). Returns
+    the GeoDataFrame.
+    """
+    if isinstance(backend, ArcpyBackend):
+        import geopandas as gpd
+        backend.detect(raster, out_fc, batch_options)
+        return gpd.read_file(out_fc)
+    gdf = backend.segment(raster, batch_options)
+    os.makedirs(os.path.dirname(os.path.abspath(str(out_fc))), exist_ok=True)
+    gdf.to_file(str(out_fc), driver="ESRI Shapefile")
+    if verbose:
+        print(f"  {format_stats(backend.stats)}")
+    return gdf
+
+
+def get_backend(name, model_path=None, encoder_path=None, decoder_path=None, threads=None, **kwargs):
+    """
+    'arcpy' (model_path: SAM.dlpk), 'sam' (ONNX encoder/decoder) or 'tiny' (random weights).
+
+    Other keyword arguments (workers, cache, stitch, min_valid_fraction, simplify) go to SamBackend.
+    """
+    if name == 'arcpy':
+        return ArcpyBackend(model_path)
+    if name == 'sam':
+        return SamBackend(OnnxSamModel(encoder_path, decoder_path, threads=threads), **kwargs)
+    if name == 'tiny':
+        return SamBackend(TinySamModel(), **kwargs)
+    raise ValueError(f"Unknown segmentation backend: {name!r}")
@@ -0,0 +1,240 @@
+"""
+Stitch segmentation polygons across chip seams with a spatial index.
+
+DetectObjectsUsingDeepLearning (and SamBackend) segment a raster in chips
+that overlap by `padding` pixels. Fields that cross a chip boundary come out
+twice: as near-duplicates, or as a full field plus a partial one, or as two
+partial fields cut at the chip edges. Per-chip NMS cannot see those pairs,
+so Part 4 cleaned them up with CountOverlappingFeatures and buffers.
+
+stitch_seams resolves them in one pass:
+1. candidates: polygons that touch a seam band (each chip core boundary
+   +- the padding, i.e. the chip overlap zones). Polygons elsewhere pass
+   through untouched.
+2. pairs: candidate pairs that intersect, from one STRtree bulk query
+3. per pair, all at once with Shapely 2 arrays: intersection area, IoU and
+   containment (intersection / smaller area)
+4. duplicates: containment >= contain_thresh drops the smaller polygon
+   (a partial field inside the full one), otherwise IoU >= iou_thresh
+   drops the one with the lower confidence. Pairs are resolved greedily,
+   best winner first, and a dropped polygon suppresses nothing, as in NMS.
+5. pieces: two kept polygons are unioned when they are cut at the same
+   seam from either side (their box centres lie on opposite sides of the
+   seam line, and their overlap lies in the band and spans most of its
+   width, as the two chips' clipped masks of one field do) and the overlap
+   is at least merge_thresh of each of them. A small mask that touches two
+   fields therefore never bridges them, and neighbouring fields that
+   merely overlap are left apart.
+
+Work grows with the number of seam polygons and their neighbours, not with
+the square of the polygon count.
+
+    gdf = stitch_seams(gdf, chip_seams(transform, width, height, 1024, 256))
+"""
+import numpy as np
+
+
+##################
+
+IOU_THRESH = 0.5
+CONTAIN_THRESH = 0.8
+MERGE_THRESH = 0.1
+SEAM_SPAN = 0.9
+
+
+def chip_seams(transform, width, height, chip_size, padding, tolerance=1):
+    """
+    Seam bands (shapely polygons in raster CRS) of a chip layout.
+
+    One band per chip core boundary, `padding + tolerance` pixels wide on
+    each side, which covers the zone that two chips both see.
+    """
+    import shapely
+    stride = chip_size - 2 * padding
+    half = padding + tolerance
+    boxes = []
+    for c in range(stride, width, stride):
+        boxes.append((c - half, 0, c + half, height))
+    for r in range(stride, height, stride):
+        boxes.append((0, r - half, width, r + half))
+    if not boxes:
+        return []
+    px = np.array(boxes, dtype=np.float64)
+    xs0, ys0 = transform * (px[:, 0], px[:, 1])
+    xs1, ys1 = transform * (px[:, 2], px[:, 3])
+    return list(shapely.box(np.minimum(xs0, xs1), np.minimum(ys0, ys1),
+                            np.maximum(xs0, xs1), np.maximum(ys0, ys1)))
+
+
+def raster_seams(raster_path, chip_size=1024, padding=256):
+    """chip_seams of a raster segmented with the given chip size and padding."""
+    import rasterio
+    with rasterio.open(raster_path) as src:
+        return chip_seams(src.transform, src.width, src.height, chip_size, padding)
+
+
+def seam_candidates(geoms, seams):
+    """Indices of the polygons that intersect any seam band (all of them without seams)."""
+    import shapely
+    if seams is None:
+        return np.arange(len(geoms))
+    if len(seams) == 0:
+        return np.zeros(0, dtype=np.int64)
+    tree = shapely.STRtree(geoms)
+    _, hit = tree.query(np.asarray(seams, dtype=object), predicate='intersects')
+    return np.unique(hit)
+
+
+def overlap_pairs(geoms):
+    """(i, j, intersection geometry) of every intersecting pair i < j."""
+    import shapely
+    tree = shapely.STRtree(geoms)
+    i, j = tree.query(geoms, predicate='intersects')
+    keep = i < j
+    i, j = i[keep], j[keep]
+    return i, j, shapely.intersection(geoms[i], geoms[j])
+
+
+def seam_cuts(geoms, i, j, inter, seams, span=SEAM_SPAN):
+    """
+    Boolean per pair: i and j look like two chips' pieces of one field.
+
+    True when their intersection lies within a seam band, spans at least
+    `span` of the band's width, and the two box centres are on opposite
+    sides of the seam line. Always False without seams.
+    """
+    import shapely
+    cut = np.zeros(len(i), dtype=bool)
+    if seams is None or len(seams) == 0 or len(i) == 0:
+        return cut
+    seams = np.asarray(seams, dtype=object)
+    p, s = shapely.STRtree(seams).query(inter, predicate='within')
+    if len(p) == 0:
+        return cut
+    sb = shapely.bounds(seams)[s]
+    ib = shapely.bounds(inter[p])
+    gi, gj = shapely.bounds(geoms[i[p]]), shapely.bounds(geoms[j[p]])
+    # the seam line runs along the band's long side; measure across it
+    ax = np.where(sb[:, 3] - sb[:, 1] >= sb[:, 2] - sb[:, 0], 0, 1)
+    rows = np.arange(len(p))
+    lo, hi = sb[rows, ax], sb[rows, ax + 2]
+    mid = (lo + hi) / 2.0
+    ci = (gi[rows, ax] + gi[rows, ax + 2]) / 2.0
+    cj = (gj[rows, ax] + gj[rows, ax + 2]) / 2.0
+    across = ib[rows, ax + 2] - ib[rows, ax]
+    ok = ((ci - mid) * (cj - mid) < 0) & (across >= span * (hi - lo))
+    cut[p[ok]] = True
+    return cut
+
+
+def resolve_pairs(areas, scores, i, j, inter, iou_thresh=IOU_THRESH,
+                  contain_thresh=CONTAIN_THRESH, merge_thresh=MERGE_THRESH, cut=None):
+    """
+    Boolean `drop` per polygon, plus the (i, j) pairs to merge.
+
+    inter: intersection area per pair; cut: seam_cuts per pair (no merges
+    when None). Duplicate pairs are taken best winner first (score, then
+    area); a pair whose winner is already dropped is skipped, so suppression
+    does not cascade. Merge pairs join kept polygons only, and only when
+    the overlap is at least merge_thresh of both.
+    """
+    a_i, a_j = areas[i], areas[j]
+    smaller = np.minimum(a_i, a_j)
+    larger = np.maximum(a_i, a_j)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(a_i + a_j - inter > 0, inter / (a_i + a_j - inter), 0.0)
+        contain = np.where(smaller > 0, inter / smaller, 0.0)
+        both = np.where(larger > 0, inter / larger, 0.0)
+    # containment first, so a partial field never beats the full one on score
+    dup_contain = contain >= contain_thresh
+    dup_iou = ~dup_contain & (iou >= iou_thresh)
+    dup = dup_iou | dup_contain
+    # loser: the smaller polygon (containment) or the lower score (IoU); ties go the other way
+    i_loses_contain = (a_i < a_j) | ((a_i == a_j) & (scores[i] < scores[j]))
+    i_loses_iou = (scores[i] < scores[j]) | ((scores[i] == scores[j]) & (a_i < a_j))
+    i_loses = np.where(dup_contain, i_loses_contain, i_loses_iou)[dup]
+    loser = np.where(i_loses, i[dup], j[dup])
+    winner = np.where(i_loses, j[dup], i[dup])
+    drop = np.zeros(len(areas), dtype=bool)
+    for k in np.lexsort((-areas[winner], -scores[winner])):
+        if not drop[winner[k]]:
+            drop[loser[k]] = True
+    if cut is None:
+        cut = np.zeros(len(i), dtype=bool)
+    merge = ~dup & cut & (both >= merge_thresh)
+    merge &= ~drop[i] & ~drop[j]
+    return drop, i[merge], j[merge]
+
+
+def stitch_seams(gdf, seams=None, score_col='Confidence', iou_thresh=IOU_THRESH,
+                 contain_thresh=CONTAIN_THRESH, merge_thresh=MERGE_THRESH, verbose=False):
+    """
+    One clean polygon set from overlapping chip outputs.
+
+    gdf: polygons of one raster (e.g. SamBackend.segment or a Boundary_*.shp).
+    seams: seam bands from chip_seams/raster_seams; None treats every polygon
+        as a candidate and only drops duplicates (no seam, no pieces).
+    score_col: confidence used to break IoU duplicates (area if missing).
+    Returns a new GeoDataFrame. Merged polygons keep the attributes of their
+    highest-scoring member.
+    """
+    import shapely
+    import geopandas as gpd
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna()].reset_index(drop=True)
+    geoms = shapely.make_valid(np.asarray(gdf.geometry.array))
+    cand = seam_candidates(geoms, seams)
+    if len(cand) < 2:
+        return gdf.copy()
+    c_geoms = geoms[cand]
+    areas = shapely.area(c_geoms)
+    scores = (gdf[score_col].to_numpy(dtype=np.float64)[cand] if score_col in gdf.columns
+              else areas)
+
+    i, j, inter_geoms = overlap_pairs(c_geoms)
+    cut = seam_cuts(c_geoms, i, j, inter_geoms, seams)
+    drop, mi, mj = resolve_pairs(areas, scores, i, j, shapely.area(inter_geoms), iou_thresh,
+                                 contain_thresh, merge_thresh, cut)
+
+    n = len(cand)
+    graph = sparse.coo_matrix((np.ones(len(mi), dtype=np.int8), (mi, mj)), shape=(n, n))
+    _, comp = connected_components(graph, directed=False)
+    kept = np.flatnonzero(~drop)
+    out_geoms = geoms.copy()
+    keep_rows = np.ones(len(gdf), dtype=bool)
+    keep_rows[cand[drop]] = False
+    if len(mi):
+        # group kept candidates by component, best score first; union each group into its first member
+        order = np.lexsort((-scores[kept], comp[kept]))
+        members, groups = kept[order], comp[kept][order]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        for group in np.split(members, starts[1:]):
+            if len(group) > 1:
+                out_geoms[cand[group[0]]] = shapely.union_all(geoms[cand[group]])
+                keep_rows[cand[group[1:]]] = False
+    out = gdf.copy()
+    out = out.set_geometry(gpd.GeoSeries(out_geoms, crs=gdf.crs))
+    out = out[keep_rows].reset_index(drop=True)
+    if verbose:
+        print(f"Seam stitching: {len(gdf)} polygons, {n} on seams, {len(i)} overlapping pairs, "
+              f"{int(drop.sum())} duplicates dropped, {int((~keep_rows).sum() - drop.sum())} "
+              f"pieces merged → {len(out)} polygons")
+    return out
+
+
+def stitch_shapefile(in_shp, raster_path, out_shp=None, chip_size=1024, padding=256, **kwargs):
+    """stitch_seams on a Boundary_*.shp using the chip layout of its raster; overwrites in place by default."""
+    import geopandas as gpd
+    gdf = gpd.read_file(in_shp)
+    seams = raster_seams(raster_path, chip_size, padding)
+    if gdf.crs is not None:
+        import rasterio
+        with rasterio.open(raster_path) as src:
+            raster_crs = src.crs
+        if raster_crs is not None and gdf.crs != raster_crs:
+            seams = list(gpd.GeoSeries(seams, crs=raster_crs).to_crs(gdf.crs))
+    out = stitch_seams(gdf, seams, **kwargs)
+    out.to_file(str(out_shp or in_shp), driver="ESRI Shapefile")
+    return out
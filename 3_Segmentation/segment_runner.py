@@ -0,0 +1,268 @@
+"""
+Segmentation work queue that several processes or hosts can share.
+
+The notebook loops `for raster in rasterList` and skips rasters whose
+output exists. Two machines on the same 5_Data/RGB_download/{Province}
+folder would then segment the same rasters and write the same
+Boundary_*.shp at once. Here every raster is a job, claimed through a lease
+file in `<out_folder>/.leases`:
+- claim: the lease is created with O_CREAT | O_EXCL, so exactly one worker
+  gets it. It holds the owner, host and pid.
+- heartbeat: while the job runs, a thread touches the lease every
+  `heartbeat` seconds. A lease that is briefly missing (another worker's
+  expiry check moves it aside and back) is retried; the heartbeat stops
+  only once the lease names another owner.
+- expiry: a lease not touched for `ttl` seconds belongs to a crashed
+  worker. The next worker renames it away (only one rename can succeed) and
+  claims the raster again.
+- publish: the output is written under a temporary name in the output
+  folder, then renamed into place, with the .shp last. A Boundary_*.shp is
+  therefore complete whenever it exists, and a worker that lost its lease
+  does not publish.
+
+A job whose heartbeat stops for longer than `ttl` (hung or suspended
+process) is claimed again and runs twice; only the current lease holder
+publishes it.
+
+    run_queue(in_folder, out_folder, backend, batch_options)        # on each host
+    run_processes(4, in_folder, out_folder, {'name': 'sam', ...})   # or 4 local workers
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from pathlib import Path
+
+
+##################
+
+LEASE_SECONDS = 600
+HEARTBEAT_SECONDS = 60
+RETRY_SECONDS = 1                                      # heartbeat retry after a missing lease read
+SHP_EXTS = ['.dbf', '.shx', '.prj', '.cpg', '.shp']   # .shp last: it marks the output complete
+LEASE_DIR = '.leases'
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def output_path(out_folder, raster):
+    return os.path.join(str(out_folder), f"Boundary_{Path(raster).stem}.shp")
+
+
+def is_done(out_fc):
+    """True if the published shapefile is complete (.shp, .shx and .dbf)."""
+    base = os.path.splitext(out_fc)[0]
+    return all(os.path.exists(base + ext) for ext in ('.shp', '.shx', '.dbf'))
+
+
+##################
+
+class Lease:
+    """
+    Exclusive, expiring claim on one job, stored as a file.
+
+    acquire() returns False if another live worker holds the job. Use it as
+    a context manager after a successful acquire; the heartbeat runs until
+    release().
+    """
+
+    def __init__(self, path, owner, ttl=LEASE_SECONDS, heartbeat=HEARTBEAT_SECONDS):
+        self.path = str(path)
+        self.owner = owner
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'owner': self.owner, 'host': socket.gethostname(), 'pid': os.getpid(),
+                       'claimed': time.time(), 'ttl': self.ttl}, f)
+        return True
+
+    def expired(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def holder(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get('owner')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not self._create():
+            if not self.expired():
+                return False
+            # stale lease: move it aside; if another worker got there first, the rename fails
+            stale = f"{self.path}.stale.{uuid.uuid4().hex[:8]}"
+            try:
+                os.rename(self.path, stale)
+            except FileNotFoundError:
+                pass
+            else:
+                if time.time() - os.path.getmtime(stale) <= self.ttl:
+                    # another worker reclaimed it between our check and the rename: put it back
+                    try:
+                        os.link(stale, self.path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale)
+                    return False
+                os.remove(stale)
+            if not self._create():
+                return False
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        self._thread.start()
+        return True
+
+    def _beat(self):
+        wait = self.heartbeat
+        while not self._stop.wait(wait):
+            holder = self.holder()
+            if holder == self.owner:
+                try:
+                    os.utime(self.path)
+                    wait = self.heartbeat
+                    continue
+                except FileNotFoundError:
+                    pass
+            elif holder is not None:
+                return          # reclaimed: the lease now names another worker
+            # missing or half-written: another worker's acquire() may have it
+            # moved aside for a moment, so look again soon
+            wait = min(self.heartbeat, RETRY_SECONDS)
+
+    def held(self):
+        """True while the lease file still names this owner."""
+        return self.holder() == self.owner
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.held():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def publish(tmp_fc, out_fc):
+    """Rename the temporary shapefile set onto out_fc, .shp last."""
+    tmp_base, out_base = os.path.splitext(tmp_fc)[0], os.path.splitext(out_fc)[0]
+    for ext in SHP_EXTS:
+        if os.path.exists(tmp_base + ext):
+            os.replace(tmp_base + ext, out_base + ext)
+
+
+def remove_shapefile(fc):
+    base = os.path.splitext(fc)[0]
+    for ext in SHP_EXTS:
+        if os.path.exists(base + ext):
+            os.remove(base + ext)
+
+
+##################
+
+def list_rasters(in_folder, pattern="*.tif"):
+    return sorted(str(p) for p in Path(in_folder).glob(pattern))
+
+
+def run_queue(in_folder, out_folder, backend, batch_options=None, rasters=None, ttl=LEASE_SECONDS,
+              heartbeat=HEARTBEAT_SECONDS, owner=None, verbose=True):
+    """
+    Segment every raster of in_folder that no other worker has done or holds.
+
+    Safe to run at the same time on several hosts sharing the folders.
+    Returns {'done': n, 'skipped': n, 'busy': n, 'failed': [(raster, error)]}.
+    """
+    from sam_backend import detect_objects
+
+    owner = owner or worker_id()
+    os.makedirs(str(out_folder), exist_ok=True)
+    lease_dir = os.path.join(str(out_folder), LEASE_DIR)
+    rasters = list_rasters(in_folder) if rasters is None else list(rasters)
+    report = {'done': 0, 'skipped': 0, 'busy': 0, 'failed': []}
+
+    for raster in rasters:
+        out_fc = output_path(out_folder, raster)
+        if is_done(out_fc):
+            report['skipped'] += 1
+            continue
+        lease = Lease(os.path.join(lease_dir, Path(raster).stem + '.lease'), owner, ttl, heartbeat)
+        if not lease.acquire():
+            report['busy'] += 1
+            continue
+        with lease:
+            # done by a worker whose lease expired just before ours
+            if is_done(out_fc):
+                report['skipped'] += 1
+                continue
+            tmp_fc = os.path.join(str(out_folder), f".tmp_{uuid.uuid4().hex[:8]}_{Path(out_fc).name}")
+            if verbose:
+                print(f"Processing: {raster} -> {out_fc}")
+            try:
+                detect_objects(raster, tmp_fc, backend, batch_options, verbose=verbose)
+                if not lease.held():
+                    raise RuntimeError("lease lost (expired and reclaimed), not publishing")
+                publish(tmp_fc, out_fc)
+                report['done'] += 1
+            except Exception as exc:
+                report['failed'].append((raster, repr(exc)))
+                if verbose:
+                    print(f"  ✖ {raster}: {exc!r}")
+            finally:
+                remove_shapefile(tmp_fc)
+    if verbose:
+        print(f"[{owner}] {report['done']} segmented, {report['skipped']} already done, "
+              f"{report['busy']} held by other workers, {len(report['failed'])} failed")
+    return report
+
+
+def _process_main(args):
+    in_folder, out_folder, backend_args, batch_options, rasters, ttl, heartbeat = args
+    from sam_backend import get_backend
+    backend = get_backend(**backend_args)
+    return run_queue(in_folder, out_folder, backend, batch_options, rasters, ttl, heartbeat, verbose=False)
+
+
+def run_processes(num_processes, in_folder, out_folder, backend_args, batch_options=None, rasters=None,
+                  ttl=LEASE_SECONDS, heartbeat=HEARTBEAT_SECONDS):
+    """
+    run_queue in num_processes local processes; backend_args go to get_backend in each.
+
+    Every process builds its own backend (model sessions are not shared).
+    Returns {'done': n, 'failed': [(raster, error)], 'remaining': [rasters
+    without a published output]}.
+    """
+    from multiprocessing import Pool
+    args = (str(in_folder), str(out_folder), dict(backend_args), batch_options,
+            None if rasters is None else list(rasters), ttl, heartbeat)
+    with Pool(num_processes) as pool:
+        reports = pool.map(_process_main, [args] * num_processes)
+    rasters = list_rasters(in_folder) if rasters is None else list(rasters)
+    total = {'done': sum(r['done'] for r in reports),
+             'failed': [f for r in reports for f in r['failed']],
+             'remaining': [r for r in rasters if not is_done(output_path(out_folder, r))]}
+    print(f"{total['done']} rasters segmented by {num_processes} processes, {len(total['failed'])} failed, "
+          f"{len(total['remaining'])} not done (failed or held by other hosts)")
+    return total
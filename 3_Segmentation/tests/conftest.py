@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the Part 3 modules import each other as top-level modules (from the notebook folder)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
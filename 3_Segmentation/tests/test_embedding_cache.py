@@ -0,0 +1,95 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from embedding_cache import EmbeddingCache, embedding_key, raster_hash
+
+
+def _entry(n=1000, value=0.0):
+    return np.full(n, value, dtype=np.float32)
+
+
+def _age(cache, key, seconds):
+    t = time.time() - seconds
+    os.utime(cache._path(key), (t, t))
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    assert cache.get('ab01') is None
+    cache.put('ab01', _entry(value=3.0))
+    out = cache.get('ab01')
+    assert isinstance(out, np.memmap) and not out.flags.writeable
+    assert np.array_equal(out, _entry(value=3.0))
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert EmbeddingCache(tmp_path).get('ab01') is not None     # shared folder, new instance
+
+
+def test_lru_eviction_order(tmp_path):
+    probe = EmbeddingCache(tmp_path / 'probe')
+    probe.put('aa00', _entry())
+    one = probe.size()                        # bytes of one .npy entry
+    cache = EmbeddingCache(tmp_path / 'cache', max_bytes=3 * one)
+    for age, key in ((40, 'aa00'), (30, 'bb00'), (20, 'cc00')):
+        cache.put(key, _entry())
+        _age(cache, key, age)
+    assert cache.get('aa00') is not None      # hit: aa00 becomes the most recent
+    cache.put('dd00', _entry())
+    assert cache.get('bb00') is None          # least recently used goes first
+    assert all(cache.get(k) is not None for k in ('aa00', 'cc00', 'dd00'))
+    assert cache.size() <= 3 * one
+    _age(cache, 'aa00', 10)
+    _age(cache, 'cc00', 5)
+    assert cache.evict(one) == 2 * one
+    assert [os.path.basename(p) for _, _, p in cache.entries()] == ['dd00.npy']
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_key_changes_with_model_window_and_content():
+    base = embedding_key('h1', 0, 0, 1024, 'v1')
+    assert base == embedding_key('h1', 0, 0, 1024, 'v1')
+    others = [embedding_key('h2', 0, 0, 1024, 'v1'), embedding_key('h1', 512, 0, 1024, 'v1'),
+              embedding_key('h1', 0, 512, 1024, 'v1'), embedding_key('h1', 0, 0, 512, 'v1'),
+              embedding_key('h1', 0, 0, 1024, 'v2')]
+    assert len({base, *others}) == 6
+
+
+def test_raster_hash_follows_content(tmp_path):
+    path = tmp_path / 'r.tif'
+    path.write_bytes(b'abc')
+    first = raster_hash(path)
+    assert raster_hash(path) == first
+    path.write_bytes(b'abd')
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert raster_hash(path) != first
+
+
+def test_backend_reuses_embeddings_until_model_changes(tmp_path):
+    rasterio = pytest.importorskip('rasterio')
+    pytest.importorskip('geopandas')
+    from rasterio.transform import from_origin
+    from sam_backend import SamBackend, TinySamModel
+
+    data = np.zeros((3, 200, 200), dtype=np.uint8)
+    data[:, :100] = 200
+    raster = tmp_path / 'rgb.tif'
+    with rasterio.open(raster, 'w', driver='GTiff', width=200, height=200, count=3, dtype='uint8',
+                       crs='EPSG:32613', transform=from_origin(500000, 5700000, 10, 10)) as dst:
+        dst.write(data)
+    cache = EmbeddingCache(tmp_path / 'cache')
+    options = {'padding': 32, 'points_per_side': 4, 'pred_iou_thresh': 0.4,
+               'stability_score_thresh': 0.5}
+
+    backend = SamBackend(TinySamModel(image_size=128), cache=cache, min_valid_fraction=0)
+    backend.segment(str(raster), options)
+    n_chips = backend.stats['chips']
+    assert backend.stats['encoded_chips'] == n_chips and cache.misses == n_chips
+    backend.segment(str(raster), dict(options, stability_score_thresh=0.6))
+    assert backend.stats['encoded_chips'] == 0 and cache.hits == n_chips
+
+    other = SamBackend(TinySamModel(image_size=128, seed=1), cache=cache, min_valid_fraction=0)
+    other.segment(str(raster), options)
+    assert other.stats['encoded_chips'] == n_chips
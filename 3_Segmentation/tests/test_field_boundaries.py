@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip('shapely')
+gpd = pytest.importorskip('geopandas')
+
+from field_boundaries import (count_overlaps, area_compactness, clean_field_boundaries,
+                              process_field_boundaries)
+
+UTM = 'EPSG:32613'
+
+
+def layer(boxes, crs=UTM):
+    return gpd.GeoDataFrame(geometry=[shapely.box(*b) for b in boxes], crs=crs)
+
+
+def test_count_overlaps_counts_inputs_per_face():
+    # A and B overlap on [1, 2] x [0, 2]; C is on its own
+    faces, counts = count_overlaps([shapely.box(0, 0, 2, 2), shapely.box(1, 0, 3, 2),
+                                    shapely.box(5, 0, 6, 1)])
+    by_x = {round(f.centroid.x, 6): (round(f.area, 6), int(c)) for f, c in zip(faces, counts)}
+    assert by_x == {0.5: (2.0, 1), 1.5: (2.0, 2), 2.5: (2.0, 1), 5.5: (1.0, 1)}
+
+
+def test_count_overlaps_leaves_out_holes():
+    ring = shapely.box(0, 0, 3, 3).difference(shapely.box(1, 1, 2, 2))
+    faces, counts = count_overlaps([ring])
+    assert len(faces) == 1 and counts.tolist() == [1]
+    assert faces[0].area == pytest.approx(8.0)
+
+
+def test_area_compactness():
+    area, cmp = area_compactness(np.array([shapely.box(0, 0, 100, 100), shapely.box(0, 0, 1000, 10)]))
+    assert area.tolist() == [10000.0, 10000.0]
+    assert cmp[0] == pytest.approx(math.pi / 4)
+    assert cmp[1] == pytest.approx(4 * math.pi * 10000 / 2020 ** 2)
+
+
+def test_area_and_compactness_filter():
+    fields = layer([
+        (0, 0, 400, 400),           # eroded 360 x 360: kept
+        (1000, 0, 1200, 200),       # eroded 160 x 160 = 25,600 m2: too small
+        (2000, 0, 4000, 60),        # eroded 1960 x 20 = 39,200 m2: too small
+        (0, 1000, 3000, 1100),      # eroded 2960 x 60 = 177,600 m2, cmpness 0.06: too elongated
+    ])
+    out = clean_field_boundaries(fields)
+    assert len(out) == 1
+    assert out['COUNT_'].tolist() == [1]
+    assert out['Area'].iloc[0] == pytest.approx(360 * 360)
+    assert out['cmpness'].iloc[0] == pytest.approx(math.pi / 4)
+    # +20 m with round joins: 360 x 360 plus four 20 m sides and a 20 m disk
+    assert out.geometry.iloc[0].area == pytest.approx(360 ** 2 + 4 * 360 * 20 + math.pi * 400, rel=1e-3)
+
+
+def test_nothing_passes_returns_none():
+    assert clean_field_boundaries(layer([(0, 0, 100, 100)])) is None
+
+
+def test_mask_selects_overlapping_fields():
+    fields = layer([(0, 0, 400, 400), (1000, 0, 1400, 400), (2000, 0, 2400, 400)])
+    # overlaps the first field, only touches the third (whose +20 m buffer reaches x = 2000)
+    mask = layer([(300, 0, 700, 400), (1600, 0, 2000, 400)])
+    out = clean_field_boundaries(fields, mask, diff_min_area_sqm=1e12)
+    assert len(out) == 1
+    assert out.geometry.iloc[0].bounds == pytest.approx((0, 0, 400, 400))
+
+
+def test_large_mask_gaps_are_recovered():
+    fields = layer([(0, 0, 400, 400)])
+    # the big mask part holds the field; the small one is under 300,000 m2 once shrunk
+    mask = layer([(0, 0, 2000, 1000), (3000, 0, 3400, 400)])
+    out = clean_field_boundaries(fields, mask)
+    assert len(out) == 2
+    extra = out[out['Area_sqm'].notna()]
+    # mask minus the field, shrunk 20 m: 1960 x 960 minus the 400 x 400 corner the field
+    # (grown 40 m in all) takes, whose far corner is a 40 m quarter circle
+    expected = 1960 * 960 - (400 ** 2 - (1 - math.pi / 4) * 40 ** 2)
+    assert extra['Area_sqm'].iloc[0] == pytest.approx(expected, rel=1e-4)
+    assert not extra.geometry.iloc[0].intersects(shapely.box(20, 20, 380, 380))
+
+
+def test_process_field_boundaries_projects_every_file_like_the_first(tmp_path):
+    pytest.importorskip('pyogrio')
+    inputs, outputs, masks = tmp_path / 'in', tmp_path / 'out', tmp_path / 'mask'
+    inputs.mkdir()
+    # both layers in lon/lat; the second lies in the next UTM zone
+    layer([(500000, 5700000, 500400, 5700400)]).to_crs('EPSG:4326').to_file(inputs / 'Boundary_a.shp')
+    layer([(500000, 5700000, 500400, 5700400)], 'EPSG:32614').to_crs('EPSG:4326').to_file(
+        inputs / 'Boundary_b.shp')
+    written = process_field_boundaries(inputs, outputs, masks)
+    assert [p.split('/')[-1] for p in written] == ['Boundary_a_clean.shp', 'Boundary_b_clean.shp']
+    assert {gpd.read_file(p).crs.to_epsg() for p in written} == {32613}
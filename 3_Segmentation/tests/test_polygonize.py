@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('rasterio')
+from affine import Affine
+
+from polygonize import pack_labels, polygonize_masks, geometry_stats, simplify_shapefile
+
+ORIGIN = (500000.0, 5700000.0)
+TRANSFORM = Affine(10, 0, ORIGIN[0], 0, -10, ORIGIN[1])
+
+
+def _fields(size=60):
+    """Three fields tiling a size x size raster: two along a staircase diagonal, one strip."""
+    rows, cols = np.mgrid[0:size, 0:size]
+    strip = rows >= size - 10
+    a = (cols < rows) & ~strip
+    b = (cols >= rows) & ~strip
+    return np.stack([a, b, strip])
+
+
+def _on_pixel_corners(geom):
+    xy = shapely.get_coordinates(geom)
+    cols, rows = (xy[:, 0] - ORIGIN[0]) / 10, (ORIGIN[1] - xy[:, 1]) / 10
+    return np.allclose(cols, np.round(cols)) and np.allclose(rows, np.round(rows))
+
+
+def test_pack_labels_layers():
+    masks = _fields()
+    overlap = np.zeros_like(masks[0])
+    overlap[5:15, 5:15] = True                     # overlaps a and b
+    layers, where = pack_labels(np.concatenate([masks, overlap[None]]))
+    assert len(layers) == 2
+    assert where.tolist() == [[0, 1], [0, 2], [0, 3], [1, 1]]
+    assert np.array_equal(layers[0] == 2, masks[1])
+    # cropped masks with their boxes pack the same way
+    from sam_backend import mask_boxes
+    boxes = mask_boxes(masks)
+    crops = [m[y0:y1, x0:x1] for m, (x0, y0, x1, y1) in zip(masks, boxes)]
+    cropped, cropped_where = pack_labels(crops, boxes, shape=masks.shape[1:])
+    assert np.array_equal(cropped[0], layers[0]) and np.array_equal(cropped_where, where[:3])
+
+
+def test_polygonize_reduces_vertices_on_the_pixel_grid():
+    masks = _fields()
+    raw, before, _ = polygonize_masks(masks, TRANSFORM, tolerance=0)
+    geoms, before_s, after = polygonize_masks(masks, TRANSFORM, tolerance=1.0)
+    # the staircase has a vertex at every step; one-pixel steps are simplified away
+    assert before == before_s == geometry_stats(raw)
+    assert before['features'] == after['features'] == 3
+    assert after['vertices'] < before['vertices'] / 4
+    assert after['bytes'] < before['bytes']
+    assert geometry_stats(geoms) == after
+    assert all(_on_pixel_corners(g) for g in geoms)
+    for g, mask in zip(raw, masks):
+        assert g.area == pytest.approx(mask.sum() * 100)
+
+
+def test_simplified_fields_still_tile_without_gaps_or_overlaps():
+    masks = _fields()
+    geoms, _, _ = polygonize_masks(masks, TRANSFORM, tolerance=1.0)
+    assert all(g.is_valid for g in geoms)
+    union = shapely.union_all(geoms)
+    extent = shapely.box(ORIGIN[0], ORIGIN[1] - 600, ORIGIN[0] + 600, ORIGIN[1])
+    # no overlaps: areas add up; no gaps: together they still cover the raster
+    assert sum(g.area for g in geoms) == pytest.approx(union.area)
+    assert union.symmetric_difference(extent).area == pytest.approx(0, abs=1e-6)
+    # the diagonal edge is still shared exactly
+    a, b = geoms[0], geoms[1]
+    assert a.intersection(b).area == pytest.approx(0, abs=1e-6)
+    assert a.boundary.intersection(b.boundary).length > 500
+
+
+def test_simplify_shapefile(tmp_path, capsys):
+    gpd = pytest.importorskip('geopandas')
+    raw, _, _ = polygonize_masks(_fields(), TRANSFORM, tolerance=0)
+    path = tmp_path / 'Boundary_rgb.shp'
+    gpd.GeoDataFrame({'Class': ['field'] * 3}, geometry=list(raw), crs='EPSG:32613').to_file(path)
+    out = simplify_shapefile(str(path), tolerance=10.0)
+    assert 'vertices' in capsys.readouterr().out
+    assert geometry_stats(out.geometry.array)['vertices'] < geometry_stats(raw)['vertices']
+    assert len(gpd.read_file(path)) == 3 and out.geometry.is_valid.all()
@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+
+from sam_backend import (parse_batch_options, chip_windows, box_nms, remove_small_regions,
+                         clean_crop, mask_boxes, SegmentationBackend, SamBackend, TinySamModel,
+                         DEFAULT_OPTIONS, detect_objects)
+
+
+def test_parse_batch_options_string():
+    options = parse_batch_options("padding 128;batch_size 4;box_nms_thresh 0.5")
+    assert options['padding'] == 128 and isinstance(options['padding'], int)
+    assert options['batch_size'] == 4
+    assert options['box_nms_thresh'] == 0.5
+    assert options['points_per_side'] == DEFAULT_OPTIONS['points_per_side']
+
+
+def test_parse_batch_options_tuple_and_dict():
+    # the notebook passes a one-item tuple to the ArcGIS tool
+    assert parse_batch_options(("padding 64;points_per_batch 16",))['points_per_batch'] == 16
+    assert parse_batch_options({'stability_score_thresh': '0.9'})['stability_score_thresh'] == 0.9
+    assert parse_batch_options(None) == DEFAULT_OPTIONS
+
+
+def test_chip_windows_cover_raster_once():
+    chips = chip_windows(300, 200, 128, 32)
+    assert chips[0] == (-32, -32, (0, 0, 64, 64))
+    cover = np.zeros((200, 300), dtype=int)
+    for col, row, (c0, r0, c1, r1) in chips:
+        assert (col, row) == (c0 - 32, r0 - 32)
+        cover[r0:r1, c0:c1] += 1
+    assert (cover == 1).all()
+
+
+def test_chip_windows_need_a_core():
+    with pytest.raises(ValueError):
+        chip_windows(100, 100, 64, 32)
+
+
+def test_box_nms_keeps_best_and_disjoint():
+    boxes = np.array([[0, 0, 10, 10], [1, 0, 11, 10], [20, 20, 30, 30], [0, 1, 10, 11]])
+    scores = np.array([0.5, 0.9, 0.7, 0.4])
+    # box 0 falls to box 1; box 3 overlaps only box 0 that much, so it stays
+    assert box_nms(boxes, scores, 0.7).tolist() == [1, 2, 3]
+    assert box_nms(np.zeros((0, 4)), np.zeros(0), 0.7).tolist() == []
+
+
+def _dense_nms(boxes, scores, iou_thresh):
+    boxes = boxes.astype(np.float64)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    lt = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    rb = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    iou = inter / (area[:, None] + area[None, :] - inter)
+    keep, suppressed = [], np.zeros(len(boxes), dtype=bool)
+    for i in np.argsort(-scores, kind='stable'):
+        if not suppressed[i]:
+            keep.append(i)
+            suppressed |= iou[i] > iou_thresh
+    return keep
+
+
+def test_box_nms_matches_pairwise_matrix():
+    rng = np.random.default_rng(0)
+    xy = rng.integers(0, 200, (300, 2))
+    boxes = np.hstack([xy, xy + rng.integers(1, 60, (300, 2))])
+    scores = rng.random(300)
+    assert box_nms(boxes, scores, 0.5).tolist() == _dense_nms(boxes, scores, 0.5)
+
+
+def test_remove_small_regions():
+    mask = np.zeros((20, 20), dtype=bool)
+    mask[2:12, 2:12] = True
+    mask[5, 5] = False        # 1-pixel hole
+    mask[16:18, 16:18] = True  # 4-pixel island
+    out = remove_small_regions(mask, 5)
+    assert out[5, 5]
+    assert not out[16:18, 16:18].any()
+    assert out.sum() == 100
+    assert remove_small_regions(mask, 0) is mask
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_clean_crop_matches_full_mask(seed):
+    rng = np.random.default_rng(seed)
+    size = 64
+    mask = np.zeros((size, size), dtype=bool)
+    # a blob with holes and islands, touching the chip edge for some seeds
+    x0, y0 = rng.integers(0, 20, 2) * (seed % 2)
+    mask[y0:y0 + 40, x0:x0 + 44] = rng.random((40, 44)) > 0.25
+    for min_area in (0, 3, 12, 200):
+        full = remove_small_regions(mask, min_area)
+        box = mask_boxes(mask[None])[0]
+        crop, out_box = clean_crop(mask[box[1]:box[3], box[0]:box[2]], box, size, min_area)
+        if not full.any():
+            assert crop is None
+            continue
+        assert out_box.tolist() == mask_boxes(full[None])[0].tolist()
+        rebuilt = np.zeros_like(mask)
+        rebuilt[out_box[1]:out_box[3], out_box[0]:out_box[2]] = crop
+        assert np.array_equal(rebuilt, full)
+
+
+def test_decode_chip_returns_cropped_masks():
+    model = TinySamModel(image_size=128)
+    image = np.zeros((1, 128, 128, 3), dtype=np.uint8)
+    image[0, :64] = 200
+    image[0, 64:, 64:] = 90
+    options = parse_batch_options({'points_per_side': 8, 'points_per_batch': 16,
+                                   'pred_iou_thresh': 0.4, 'stability_score_thresh': 0.5,
+                                   'min_mask_region_area': 20})
+    crops, boxes, scores = SamBackend(model).decode_chip(model.encode(image)[0], options)
+    assert len(crops) == len(boxes) == len(scores) > 0
+    for crop, (x0, y0, x1, y1) in zip(crops, boxes):
+        assert crop.shape == (y1 - y0, x1 - x0)
+        # trimmed to the mask: every border row and column holds a pixel
+        assert crop[0].any() and crop[-1].any() and crop[:, 0].any() and crop[:, -1].any()
+
+
+def test_segment_is_abstract():
+    with pytest.raises(TypeError):
+        SegmentationBackend()
+
+
+def test_detect_objects_tiny_model(tmp_path):
+    rasterio = pytest.importorskip('rasterio')
+    pytest.importorskip('geopandas')
+    from rasterio.transform import from_origin
+    data = np.zeros((3, 300, 300), dtype=np.uint8)
+    data[:, :150, :150] = 200
+    data[:, 150:, 150:] = 90
+    data[0, :150, 150:] = 150
+    raster = tmp_path / 'rgb_SK_2021_1_1.tif'
+    with rasterio.open(raster, 'w', driver='GTiff', width=300, height=300, count=3, dtype='uint8',
+                       crs='EPSG:32613', transform=from_origin(500000, 5700000, 10, 10)) as dst:
+        dst.write(data)
+    backend = SamBackend(TinySamModel(image_size=256), workers=2)
+    out_fc = tmp_path / 'out' / 'Boundary_rgb_SK_2021_1_1.shp'
+    gdf = detect_objects(raster, out_fc, backend,
+                         "padding 64;batch_size 2;points_per_side 8;pred_iou_thresh 0.4;"
+                         "stability_score_thresh 0.5",
+                         verbose=False)
+    assert out_fc.exists()
+    assert list(gdf.columns[:2]) == ['Class', 'Confidence']
+    assert len(gdf) > 0
+    assert backend.stats['chips'] == 9
+    assert backend.stats['encoded_chips'] + backend.stats['skipped_chips'] == 9
+    assert gdf.geometry.is_valid.all()
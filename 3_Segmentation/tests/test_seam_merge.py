@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip('shapely')
+gpd = pytest.importorskip('geopandas')
+
+from seam_merge import resolve_pairs, stitch_seams
+
+
+def frame(boxes, scores=None):
+    scores = scores if scores is not None else [90.0] * len(boxes)
+    return gpd.GeoDataFrame({'Confidence': scores},
+                            geometry=[shapely.box(*b) for b in boxes])
+
+
+def vertical_band(x, half):
+    return shapely.box(x - half, -1000, x + half, 1000)
+
+
+def test_duplicates_do_not_cascade():
+    # IoU(A, B) = IoU(B, C) = 0.6, IoU(A, C) = 1/3: greedy NMS keeps A and C
+    gdf = frame([(0, 0, 100, 100), (25, 0, 125, 100), (50, 0, 150, 100)], [90.0, 80.0, 70.0])
+    out = stitch_seams(gdf)
+    assert sorted(out['Confidence']) == [70.0, 90.0]
+
+
+def test_resolve_pairs_skips_dropped_winners():
+    areas = np.array([100.0, 100.0, 100.0])
+    scores = np.array([0.9, 0.8, 0.7])
+    i, j = np.array([0, 1, 0]), np.array([1, 2, 2])
+    inter = np.array([75.0, 75.0, 50.0])
+    drop, mi, mj = resolve_pairs(areas, scores, i, j, inter)
+    assert drop.tolist() == [False, True, False]
+    assert len(mi) == len(mj) == 0
+
+
+def test_pieces_cut_at_a_seam_are_unioned():
+    # one 160 x 80 field, seam at x=100 with 20 px padding: the left chip clips it at 120, the right at 80
+    gdf = frame([(0, 0, 120, 80), (80, 0, 160, 80)])
+    out = stitch_seams(gdf, [vertical_band(100, 21)])
+    assert len(out) == 1
+    assert out.geometry.iloc[0].area == pytest.approx(160 * 80)
+
+
+def test_small_mask_does_not_bridge_two_fields():
+    # the small mask is half inside each field (containment 0.5 with both)
+    gdf = frame([(0, 0, 100, 100), (100, 0, 200, 100), (90, 40, 110, 60)])
+    out = stitch_seams(gdf, [vertical_band(100, 21)])
+    assert len(out) == 3
+    assert out.geometry.area.max() == pytest.approx(100 * 100)
+
+
+def test_overlapping_neighbours_stay_apart():
+    # five fields, each overlapping the next by 15 %, with a seam through every overlap
+    boxes = [(85 * k, 0, 85 * k + 100, 100) for k in range(5)]
+    seams = [vertical_band(85 * k + 92.5, 21) for k in range(1, 5)]
+    out = stitch_seams(frame(boxes), seams)
+    assert len(out) == 5
+    assert out.geometry.area.max() == pytest.approx(100 * 100)
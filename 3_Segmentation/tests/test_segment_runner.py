@@ -0,0 +1,100 @@
+import os
+import json
+import time
+
+import pytest
+
+import segment_runner
+from segment_runner import Lease
+
+
+@pytest.fixture(autouse=True)
+def fast_retry(monkeypatch):
+    monkeypatch.setattr(segment_runner, 'RETRY_SECONDS', 0.01)
+
+
+def _wait_for(cond, timeout=2.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _age(path, seconds):
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+
+def test_acquire_is_exclusive(tmp_path):
+    path = tmp_path / '.leases' / 'a.lease'
+    a = Lease(path, 'a', ttl=60, heartbeat=60)
+    b = Lease(path, 'b', ttl=60, heartbeat=60)
+    assert a.acquire()
+    assert not b.acquire()
+    with a:
+        assert a.held() and not b.held()
+    assert not path.exists()
+    assert b.acquire()
+    b.release()
+
+
+def test_heartbeat_survives_lease_moved_aside(tmp_path):
+    # what another worker's stale check in acquire() does: rename, then link back
+    path = tmp_path / 'a.lease'
+    lease = Lease(path, 'a', ttl=60, heartbeat=0.02)
+    assert lease.acquire()
+    aside = str(path) + '.stale.x'
+    os.rename(path, aside)
+    time.sleep(0.1)                     # several heartbeats see no lease
+    os.link(aside, path)
+    os.remove(aside)
+    _age(path, 30)
+    assert _wait_for(lambda: time.time() - os.path.getmtime(path) < 5)
+    assert lease._thread.is_alive()
+    lease.release()
+    assert not path.exists()
+
+
+def test_heartbeat_survives_half_written_lease(tmp_path):
+    path = tmp_path / 'a.lease'
+    lease = Lease(path, 'a', ttl=60, heartbeat=0.02)
+    assert lease.acquire()
+    content = path.read_text()
+    path.write_text(content[:5])
+    time.sleep(0.1)
+    assert lease._thread.is_alive()
+    path.write_text(content)
+    _age(path, 30)
+    assert _wait_for(lambda: time.time() - os.path.getmtime(path) < 5)
+    lease.release()
+
+
+def test_heartbeat_stops_when_another_owner_holds_lease(tmp_path):
+    path = tmp_path / 'a.lease'
+    lease = Lease(path, 'a', ttl=60, heartbeat=0.02)
+    assert lease.acquire()
+    path.write_text(json.dumps({'owner': 'b'}))
+    assert _wait_for(lambda: not lease._thread.is_alive())
+    _age(path, 30)
+    time.sleep(0.1)
+    assert time.time() - os.path.getmtime(path) >= 29     # not touched any more
+    lease.release()
+    assert path.exists()                                  # b's lease is left alone
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    path = tmp_path / 'a.lease'
+    a = Lease(path, 'a', ttl=10, heartbeat=60)
+    assert a.acquire()
+    a._stop.set()                       # a hung worker: no more heartbeats
+    a._thread.join()
+    b = Lease(path, 'b', ttl=10, heartbeat=60)
+    assert not b.acquire()
+    _age(path, 20)
+    assert b.acquire()
+    assert b.held() and not a.held()
+    a.release()
+    assert b.held()
+    b.release()